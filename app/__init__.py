@@ -9,6 +9,7 @@ from flask import request
 from flask_babel import Babel
 from flask_babel import lazy_gettext as _l
 from .filters import extract_year, xslt_transform
+from .cache import FragmentCache
 
 
 
@@ -22,6 +23,7 @@ login = LoginManager()
 login.login_view = 'auth.login'
 login.login_message = _l('Please log in to access this page.')
 babel = Babel()
+fragment_cache = FragmentCache()
 
 
 def create_app(config_class=Config):
@@ -32,6 +34,7 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login.init_app(app)
     babel.init_app(app)
+    fragment_cache.init_app(app)
 
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
@@ -51,6 +54,9 @@ def create_app(config_class=Config):
     from app.preservation_planning.cli import bp as preservation_planning_cli_bp
     app.register_blueprint(preservation_planning_cli_bp)
 
+    from app.data_management.cli import bp as data_management_cli_bp
+    app.register_blueprint(data_management_cli_bp)
+
     from app.api import bp as api_bp
     app.register_blueprint(api_bp)
 
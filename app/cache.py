@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    A thread-safe, size bounded in-process cache that evicts the least recently used entry.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteFragmentStore:
+    """
+    A cache tier in a SQLite file that is shared by all worker processes on a host.
+
+    Failures are swallowed, a broken or locked store only turns lookups into misses.
+    """
+
+    # Prune the store once every this many writes
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path: str, max_entries: int = 100000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS fragments '
+                               '(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            row = self.connection.execute('SELECT value FROM fragments WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            self.connection.execute('INSERT OR REPLACE INTO fragments (key, value, stored_at) VALUES (?, ?, ?)',
+                                    (key, value, time.time()))
+            self._writes += 1
+            if self._writes % self.PRUNE_INTERVAL == 0:
+                # INSERT OR REPLACE gives every write a new, higher rowid, so the rowid order is the
+                # write order and the oldest entries are found through the rowid without sorting
+                self.connection.execute('DELETE FROM fragments WHERE rowid <= '
+                                        '(SELECT rowid FROM fragments ORDER BY rowid DESC LIMIT 1 OFFSET ?)',
+                                        (self.max_entries,))
+        except sqlite3.Error:
+            pass
+
+
+class FragmentCache:
+    """
+    Cache for rendered HTML fragments with a local LRU tier and an optional shared SQLite tier.
+
+    Entries are never invalidated explicitly. Callers put a version of the underlying data
+    in the key (such as Node.version), so any change produces a new key and stale entries
+    simply age out of both tiers.
+
+    Configuration:
+        FRAGMENT_CACHE_SIZE: The number of fragments kept in each process. 0 disables the cache.
+        FRAGMENT_CACHE_PATH: A SQLite file shared by all workers. If unset only the local tier is used.
+        FRAGMENT_CACHE_SHARED_SIZE: The number of fragments kept in the shared tier.
+    """
+
+    def __init__(self, app=None) -> None:
+        self.local = None
+        self.shared = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        size = app.config.get('FRAGMENT_CACHE_SIZE', 1024)
+        self.local = LRUCache(size) if size else None
+        path = app.config.get('FRAGMENT_CACHE_PATH')
+        self.shared = SQLiteFragmentStore(path, app.config.get('FRAGMENT_CACHE_SHARED_SIZE', 100000)) \
+            if path and size else None
+
+    def get(self, key: str) -> Optional[str]:
+        if self.local is None:
+            return None
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        if self.local is None:
+            return
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def get_or_render(self, key: str, render: Callable[[], str]) -> str:
+        """
+        Return the cached fragment for the key, rendering and storing it on a miss.
+
+        Args:
+            key (str): The cache key, which must change whenever the fragment would.
+            render (Callable[[], str]): Renders the fragment.
+
+        Returns:
+            str: The rendered fragment.
+        """
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.set(key, value)
+        return value
@@ -0,0 +1,54 @@
+import hashlib
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+from flask import Response, make_response, request, session
+from flask_babel import get_locale
+from flask_login import current_user
+
+
+def conditional_response(validators: Iterable, last_modified: Optional[datetime], render: Callable) -> Response:
+    """
+    Answer a request with 304 Not Modified when the client's copy is current, otherwise render it.
+
+    The ETag is derived from `validators` (such as ids and versions of the shown records)
+    together with the current user and locale, because pages differ between users and
+    languages. If-None-Match takes precedence over If-Modified-Since. `render` is only
+    called when a full response is needed.
+
+    Args:
+        validators (Iterable): Values that change whenever the rendered output would change.
+        last_modified (datetime, optional): The latest modification of the shown records, naive values are UTC.
+        render (Callable): Returns the view's response, e.g. the result of render_template.
+
+    Returns:
+        Response: Either an empty 304 response or the rendered response, both carrying the validators.
+    """
+    etag = hashlib.sha1(repr((tuple(validators), current_user.get_id(), str(get_locale()))).encode()).hexdigest()
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0)
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+    # Pending flash messages are part of the page, so never short-circuit while there are any
+    if request.method in ('GET', 'HEAD') and '_flashes' not in session:
+        if request.if_none_match:
+            # Weak comparison, as RFC 9110 asks for If-None-Match, so W/ tags and * match too
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = bool(last_modified and request.if_modified_since
+                                and last_modified <= request.if_modified_since)
+        if not_modified:
+            response = Response(status=304)
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+
+    response = make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Let browsers keep the page but revalidate it on every use
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
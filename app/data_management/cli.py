@@ -0,0 +1,84 @@
+import os
+import click
+from flask import Blueprint
+from app.data_management.tree import rebuild_node_paths, rebuild_node_counters, delete_subtree
+from app.data_management.search import rebuild_search_index
+from app.data_management.tools.ead.importer import import_ead
+from app.data_management.tools.ead.exporter import EXPORT_FORMATS, buffered
+
+bp = Blueprint('data_management_cli', __name__, cli_group=None)
+
+
+# Data management CLI group
+@bp.cli.group()
+def data_management():
+    """Data management commands."""
+    pass
+
+
+@data_management.command()
+def rebuild_paths():
+    """Rebuild the materialized ancestry paths of all nodes."""
+    count = rebuild_node_paths()
+    click.echo(f"Rebuilt paths for {count} node(s).")
+
+
+@data_management.command()
+def rebuild_counters():
+    """Recompute the child and descendant counters of all nodes."""
+    count = rebuild_node_counters()
+    click.echo(f"Rebuilt counters for {count} node(s).")
+
+
+@data_management.command()
+def rebuild_search():
+    """Create and repopulate the full-text search index of all nodes."""
+    rebuild_search_index()
+    click.echo("Rebuilt the search index.")
+
+
+@data_management.command('delete-subtree')
+@click.argument('node_id', type=int)
+@click.confirmation_option(prompt='Delete the node and everything below it?')
+def delete_subtree_command(node_id):
+    """Delete a node with all its descendants and associations."""
+    try:
+        counts = delete_subtree(node_id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"Deleted {counts['nodes']} node(s), {counts['node_association']} node association(s) "
+               f"and {counts['agent_node_association']} agent association(s).")
+
+
+@data_management.command('import-ead')
+@click.argument('ead_file')
+@click.option('--parent-id', type=int, default=None, help='Import below an existing node (default is a new top node).')
+@click.option('--batch-size', type=int, default=1000, help='Number of nodes inserted per batch (default is 1000).')
+@click.option('--checkpoint', default=None, help='Checkpoint file used to resume (default is EAD_FILE.checkpoint).')
+def import_ead_command(ead_file, parent_id, batch_size, checkpoint):
+    """Import an EAD 2002/EAD3 finding aid as archival descriptions."""
+    if not os.path.exists(ead_file):
+        raise click.BadParameter(f"EAD file {ead_file} does not exist.")
+
+    try:
+        count = import_ead(ead_file, parent_id=parent_id, batch_size=batch_size, checkpoint=checkpoint)
+    except Exception as e:
+        raise click.ClickException(f"Error importing EAD file: {str(e)}")
+
+    click.echo(f"Imported {count} node(s) from {ead_file}.")
+
+
+@data_management.command('export')
+@click.argument('node_id', type=int)
+@click.argument('output', type=click.File('w', encoding='utf-8'))
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='ead',
+              help='Export format (default is ead).')
+def export_command(node_id, output, export_format):
+    """Export a fonds as EAD XML or NDJSON to OUTPUT ('-' for stdout)."""
+    exporter, _, _ = EXPORT_FORMATS[export_format]
+    try:
+        for chunk in buffered(exporter(node_id)):
+            output.write(chunk)
+    except ValueError as e:
+        raise click.ClickException(str(e))
@@ -1,10 +1,17 @@
+import hashlib
 import os
 
-from flask import render_template, request, url_for, redirect, jsonify
+from flask import render_template, request, url_for, redirect, jsonify, abort, flash, Response, stream_with_context
 from flask_login import login_required
 from app.data_management import bp
-from app.models import Node
-from app import db
+from app.data_management.tools.ead.exporter import EXPORT_FORMATS, buffered
+from app.data_management.search import search_nodes
+from app.data_management.tree import delete_subtree, move_subtree, InvalidMoveError
+from app.models import Agent, Node
+from app.pagination import keyset_paginate
+from app.conditional import conditional_response
+from app import db, fragment_cache
+from flask_babel import get_locale
 import sqlalchemy as sa
 from sqlalchemy import func
 from datetime import datetime
@@ -36,19 +43,100 @@ def authority_records():
                            #next_url=next_url,
                            #prev_url=prev_url)
 
+@bp.route('/data-management/agent-records', methods=['GET'])
+@login_required
+def agent_records():
+    search_query = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor')
+    query = sa.select(Agent)
+    if search_query:
+        query = query.where(Agent.name.ilike(f'%{search_query}%'))
+    agents = keyset_paginate(query, (Agent.id,), cursor, per_page=15, count_limit=1000)
+    next_url = url_for('data_management.agent_records', q=search_query or None, cursor=agents.next_cursor) \
+        if agents.has_next else None
+    prev_url = url_for('data_management.agent_records', q=search_query or None, cursor=agents.prev_cursor) \
+        if agents.has_prev else None
+
+    validators = [(agent.id, agent.updated_at) for agent in agents] + [agents.total]
+    last_modified = max((agent.updated_at for agent in agents), default=None)
+    return conditional_response(validators, last_modified, lambda: render_template(
+        'data_management/agent_records/index.jinja2',
+        agents=agents,
+        search_query=search_query,
+        next_url=next_url,
+        prev_url=prev_url))
+
+
+@bp.route('/data-management/agent-records/<int:id>', methods=['GET'])
+@login_required
+def agent_record_detail(id):
+    agent = db.get_or_404(Agent, id)
+    # The htmx fragment (submenu=False) and the full page are different representations
+    submenu = request.args.get('submenu') != 'False'
+    return conditional_response((agent.id, agent.updated_at, submenu), agent.updated_at, lambda: render_template(
+        'data_management/agent_records/detail.jinja2', agent=agent, submenu=submenu))
+
+
+@bp.route('/data-management/agent-records/<int:agent_id>/edit', methods=['GET', 'POST'])
+@login_required
+def edit_agent_record(agent_id):
+    agent = db.get_or_404(Agent, agent_id)
+    agent_type_list = os.getenv('AGENT_TYPES', 'person,family,corporate body').split(',')
+
+    if request.method == 'POST':
+        agent.name = request.form['name']
+        agent.type = request.form.get('type', agent.type)
+        agent.description = request.form.get('description', '')
+        agent.date_start = datetime.strptime(request.form['date_start'], "%Y-%m-%d") \
+            if request.form.get('date_start') else None
+        agent.date_end = datetime.strptime(request.form['date_end'], "%Y-%m-%d") \
+            if request.form.get('date_end') else None
+        db.session.commit()
+
+        # Return the updated agent details after saving
+        return render_template('data_management/agent_records/detail.jinja2', agent=agent, submenu=False)
+
+    # Render the edit form
+    return render_template('data_management/agent_records/_edit_agent.jinja2', agent=agent,
+                           agent_type_list=agent_type_list)
+
+
 @bp.route('/data-management/archival-descriptions', methods=['GET', 'POST'])
 @login_required
 def archival_descriptions():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     query = sa.select(Node).where(Node.parent == None)
-    nodes = db.paginate(query,page=page, per_page=15, error_out=False)
-    next_url = url_for('data_management.archival_descriptions', page=nodes.next_num) \
+    nodes = keyset_paginate(query, (Node.created_at, Node.id), cursor, per_page=15, count_limit=1000)
+    next_url = url_for('data_management.archival_descriptions', cursor=nodes.next_cursor) \
         if nodes.has_next else None
-    prev_url = url_for('data_management.archival_descriptions', page=nodes.prev_num) \
+    prev_url = url_for('data_management.archival_descriptions', cursor=nodes.prev_cursor) \
         if nodes.has_prev else None
 
-    return render_template('data_management/archival_descriptions/index.jinja2',
+    validators = [(node.id, node.version) for node in nodes] + [nodes.total]
+    last_modified = max((node.updated_at for node in nodes), default=None)
+    return conditional_response(validators, last_modified, lambda: render_template(
+        'data_management/archival_descriptions/index.jinja2',
+        nodes=nodes,
+        next_url=next_url,
+        prev_url=prev_url))
+
+
+@bp.route('/data-management/archival-descriptions/search', methods=['GET'])
+@login_required
+def fts_search():
+    search_query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = 50
+    total_hits, nodes = search_nodes(search_query, limit=per_page, offset=(max(page, 1) - 1) * per_page)
+    next_url = url_for('data_management.fts_search', q=search_query, page=page + 1) \
+        if page * per_page < total_hits else None
+    prev_url = url_for('data_management.fts_search', q=search_query, page=page - 1) \
+        if page > 1 else None
+
+    return render_template('data_management/resource_records/fts_search.jinja2',
                            nodes=nodes,
+                           total_hits=total_hits,
+                           search_query=search_query,
                            next_url=next_url,
                            prev_url=prev_url)
 
@@ -57,26 +145,91 @@ def archival_descriptions():
 @login_required
 def archival_descriptions_detail(id, reload=False):
     node = Node.query.get_or_404(id)
-    first_level_children = node.children.all()  # Preload first-level children
     #if request.method == "POST":
     #    return render_template('data_management/archival_descriptions/node_detail.jinja2', node=node)
 
     #return render_template('data_management/archival_descriptions/node.jinja2', node=node, reload=reload)
-    return render_template('data_management/archival_descriptions/tree.jinja2', node=node, reload=reload)
+    def render():
+        children = node.get_children_page()
+        next_url = url_for('data_management.get_children', node_id=node.id, cursor=children.next_cursor) \
+            if children.has_next else None
+        return render_template('data_management/archival_descriptions/tree.jinja2', node=node, reload=reload,
+                               children=children, next_url=next_url)
+
+    validators, last_modified = node_detail_validators(node)
+    return conditional_response(validators, last_modified, render)
 
 
 
+@bp.route('/data-management/archival-descriptions/<int:id>/export', methods=['GET'])
+@login_required
+def export_archival_description(id):
+    export_format = request.args.get('format', 'ead')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    node = Node.query.get_or_404(id)
+    # Checked here, once the response is streaming its status can no longer change
+    if node.path is None:
+        abort(409, description="The node has no materialized path yet, run 'flask data-management rebuild-paths'")
+    exporter, mimetype, extension = EXPORT_FORMATS[export_format]
+
+    # Stream the export in chunks, the subtree is never loaded as a whole
+    response = Response(stream_with_context(buffered(exporter(node.id))), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="node-{node.id}.{extension}"'
+    return response
+
+
+def node_detail_validators(node: Node) -> tuple:
+    """
+    Build the validators and last modification of a page showing a node with its linked agents.
+
+    The node version does not change when a linked agent is edited, so the ids and
+    modification times of the agents are part of the validators as well.
+
+    Returns:
+        tuple: The validators and the latest modification of the node and its agents.
+    """
+    agents = sorted((agent.id, agent.updated_at) for agent in node.agents)
+    last_modified = max([node.updated_at] + [updated_at for _, updated_at in agents if updated_at is not None])
+    return (node.id, node.version, tuple(agents)), last_modified
+
+
+def cached_fragment(name: str, node: Node, render, validators: tuple = ()) -> str:
+    """
+    Render a node fragment through the fragment cache.
+
+    The key holds the node version, which is raised whenever the node or anything below
+    it changes, so edits never have to purge the cache. `validators` covers other records
+    shown in the fragment, such as the linked agents.
+    """
+    key = f'{name}:{node.id}:{node.version}:{get_locale()}:{request.query_string.decode()}'
+    if validators:
+        key += ':' + hashlib.sha1(repr(validators).encode()).hexdigest()
+    return fragment_cache.get_or_render(key, render)
+
+
 @bp.route('/node/<int:node_id>/children', methods=['GET'])
 def get_children(node_id):
     node = Node.query.get_or_404(node_id)
-    children = node.children.all()
-    return render_template('data_management/archival_descriptions/_children.jinja2', children=children)
+
+    def render():
+        children = node.get_children_page(request.args.get('cursor'))
+        next_url = url_for('data_management.get_children', node_id=node.id, cursor=children.next_cursor) \
+            if children.has_next else None
+        return render_template('data_management/resource_records/_children.jinja2', node=node, children=children,
+                               next_url=next_url)
+
+    return conditional_response((node.id, node.version), node.updated_at,
+                                lambda: cached_fragment('children', node, render))
 
 
 @bp.route('/node/<int:node_id>/details', methods=['GET'])
 def get_node_details(node_id):
     node = Node.query.get_or_404(node_id)
-    return render_template('data_management/archival_descriptions/node_detail.jinja2', node=node)
+    validators, last_modified = node_detail_validators(node)
+    return conditional_response(validators, last_modified, lambda: cached_fragment(
+        'details', node, lambda: render_template('data_management/archival_descriptions/node_detail.jinja2',
+                                                 node=node), validators))
 
 
 @bp.route('/data-management/archival-descriptions/node/<id>', methods=['GET', 'POST'])
@@ -85,9 +238,11 @@ def get_node(id):
     full_tree = request.args.get('full_tree')
     node = Node.query.get(id)
     if full_tree and not node.is_top_node():
-        node = node.query.get(node.get_top_node().id)
+        node = node.get_top_node()
 
-    return render_template('data_management/archival_descriptions/_tree_node.jinja2', node=node)
+    return conditional_response((node.id, node.version), node.updated_at, lambda: cached_fragment(
+        'tree', node, lambda: render_template('data_management/archival_descriptions/_tree_node.jinja2',
+                                              node=node)))
 
 
 @bp.route('/node/<int:node_id>/edit', methods=['GET', 'POST'])
@@ -149,16 +304,52 @@ def add_node(parent_id=None):
 
 
 
+@bp.route('/data-management/archival-descriptions/move', methods=['GET', 'POST'])
+@login_required
+def move_node():
+    source_node = Node.query.get_or_404(request.args.get('source_node_id', type=int))
+    tree_root_id = request.args.get('tree_root_id', type=int)
+    tree_root = Node.query.get_or_404(tree_root_id) if tree_root_id else source_node.get_top_node()
+
+    if request.method == 'POST':
+        # Moving to the top level is asked for explicitly, a missing or malformed destination is an error
+        destination_id = request.form.get('destination_node_id', type=int)
+        try:
+            if not request.form.get('to_root') and destination_id is None:
+                raise InvalidMoveError("No destination node was selected")
+            move_subtree(source_node.id, None if request.form.get('to_root') else destination_id)
+        except InvalidMoveError as e:
+            flash(e.message)
+            return redirect(url_for('data_management.move_node', source_node_id=source_node.id,
+                                    tree_root_id=tree_root.id))
+        return redirect(url_for('data_management.archival_descriptions_detail', id=source_node.id))
+
+    if tree_root.path is None:
+        abort(409, description="The tree has no materialized paths yet, run 'flask data-management rebuild-paths'")
+    search_query = request.args.get('q', '').strip()
+    query = sa.select(Node).where(Node.descendant_clause(tree_root.path)).order_by(Node.path)
+    if search_query:
+        query = query.where(Node.title.ilike(f'%{search_query}%'))
+    result_nodes = list(db.session.scalars(query.limit(500)))
+
+    return render_template('data_management/resource_records/move_node.jinja2',
+                           source_node=source_node,
+                           tree_root=tree_root,
+                           search_query=search_query,
+                           result_nodes=result_nodes)
+
+
 @bp.route('/data-management/archival-descriptions/node/delete/<id>', methods=['GET', 'POST'])
 @login_required
 def delete_node(id):
     if request.method == 'POST':
-        node = Node.query.get(id)
+        node = Node.query.get_or_404(id)
         top_node = node.get_top_node()
-        if top_node == id:
-            print("hek")
-        db.session.delete(node)
-        db.session.commit()
+        deleted_top_node = top_node.id == node.id
+        delete_subtree(node.id)
 
+        if deleted_top_node:
+            response = jsonify(success=True)
+            response.headers['HX-Redirect'] = url_for('data_management.archival_descriptions')
+            return response
         return render_template('data_management/archival_descriptions/node.jinja2', node=top_node)
-
@@ -0,0 +1,112 @@
+from typing import Tuple
+import sqlalchemy as sa
+from markupsafe import Markup, escape
+from app import db
+from app.models import Node, path_ids
+
+# Markers put around matches by highlight()/snippet(), swapped for <mark> after escaping the text
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# External content FTS5 index over nodes, the triggers keep it in sync with the nodes table.
+# The update trigger only fires for the indexed columns so path and counter updates stay cheap.
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5(
+        title, archival_history, ref_code, content='nodes', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS nodes_fts_ai AFTER INSERT ON nodes BEGIN
+        INSERT INTO nodes_fts(rowid, title, archival_history, ref_code)
+        VALUES (new.id, new.title, new.archival_history, new.ref_code);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS nodes_fts_ad AFTER DELETE ON nodes BEGIN
+        INSERT INTO nodes_fts(nodes_fts, rowid, title, archival_history, ref_code)
+        VALUES ('delete', old.id, old.title, old.archival_history, old.ref_code);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS nodes_fts_au AFTER UPDATE OF title, archival_history, ref_code ON nodes BEGIN
+        INSERT INTO nodes_fts(nodes_fts, rowid, title, archival_history, ref_code)
+        VALUES ('delete', old.id, old.title, old.archival_history, old.ref_code);
+        INSERT INTO nodes_fts(rowid, title, archival_history, ref_code)
+        VALUES (new.id, new.title, new.archival_history, new.ref_code);
+    END""",
+]
+
+
+def create_search_index(connection: sa.Connection) -> None:
+    """Create the FTS5 table and its triggers if they do not exist yet."""
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+
+
+@sa.event.listens_for(Node.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        create_search_index(connection)
+
+
+def rebuild_search_index() -> None:
+    """Create the search index if needed and repopulate it from the nodes table."""
+    connection = db.session.connection()
+    create_search_index(connection)
+    connection.exec_driver_sql("INSERT INTO nodes_fts(nodes_fts) VALUES ('rebuild')")
+    db.session.commit()
+
+
+def to_match_query(query: str) -> str:
+    """Quote every term of a user query so FTS5 treats it as plain text and matches all terms."""
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+
+def _marked(text: str) -> Markup:
+    if text is None:
+        return Markup('')
+    return Markup(str(escape(text)).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+def search_nodes(query: str, limit: int = 50, offset: int = 0) -> Tuple[int, list]:
+    """
+    Search node titles, archival histories and reference codes with the FTS5 index.
+
+    Args:
+        query (str): The search terms, all of which must match.
+        limit (int, optional): The maximum number of hits to return. Defaults to 50.
+        offset (int, optional): The number of best hits to skip. Defaults to 0.
+
+    Returns:
+        Tuple[int, list]: The total number of hits and the requested hits, best first. Each hit
+        is a dict with id, level_of_description, root_title and the highlighted title and
+        archival_history as escaped Markup.
+    """
+    match = to_match_query(query)
+    if not match:
+        return 0, []
+
+    total = db.session.execute(
+        sa.text("SELECT count(*) FROM nodes_fts WHERE nodes_fts MATCH :match"), {'match': match}
+    ).scalar()
+
+    rows = db.session.execute(
+        sa.text(
+            "SELECT nodes.id, nodes.path, nodes.level_of_description, "
+            "highlight(nodes_fts, 0, :start, :end) AS title, "
+            "snippet(nodes_fts, 1, :start, :end, '…', 32) AS archival_history "
+            "FROM nodes_fts JOIN nodes ON nodes.id = nodes_fts.rowid "
+            "WHERE nodes_fts MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset"
+        ),
+        {'match': match, 'start': MATCH_START, 'end': MATCH_END, 'limit': limit, 'offset': offset},
+    ).all()
+
+    # Look up the titles of the top nodes of all hits in one query
+    root_ids = {path_ids(row.path)[0] for row in rows if row.path}
+    root_titles = dict(db.session.execute(sa.select(Node.id, Node.title).where(Node.id.in_(root_ids))).all())
+
+    hits = [
+        {
+            'id': row.id,
+            'title': _marked(row.title),
+            'archival_history': _marked(row.archival_history),
+            'level_of_description': row.level_of_description,
+            'root_title': root_titles.get(path_ids(row.path)[0]) if row.path else None,
+        }
+        for row in rows
+    ]
+    return total, hits
@@ -0,0 +1,150 @@
+import json
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape, quoteattr
+import sqlalchemy as sa
+from app import db
+from app.models import Node
+
+EAD_NAMESPACE = 'urn:isbn:1-931666-22-9'
+
+# Values allowed in the EAD 2002 level attribute, anything else is written as otherlevel
+EAD_LEVELS = {'class', 'collection', 'file', 'fonds', 'item', 'recordgrp', 'series', 'subfonds', 'subgrp',
+              'subseries'}
+
+
+def iter_subtree_rows(node_id: int, yield_per: int = 1000) -> Iterator[sa.Row]:
+    """
+    Stream the rows of a node and all its descendants in depth-first order.
+
+    The rows are ordered by the materialized path and fetched through a server-side cursor
+    in chunks of `yield_per`, so no more than one chunk is held in memory at a time.
+
+    Args:
+        node_id (int): The id of the top node of the subtree.
+        yield_per (int, optional): The number of rows fetched per round trip. Defaults to 1000.
+
+    Yields:
+        sa.Row: One row of the nodes table per node, parents before their children.
+
+    Raises:
+        ValueError: If the node does not exist or has no path yet.
+    """
+    root_path = db.session.scalar(sa.select(Node.path).where(Node.id == node_id))
+    if root_path is None:
+        raise ValueError(f"Node {node_id} does not exist or has no path, run 'flask data-management rebuild-paths'")
+
+    nodes = Node.__table__
+    query = (
+        sa.select(nodes)
+        .where(sa.or_(nodes.c.id == node_id, Node.descendant_clause(root_path)))
+        .order_by(nodes.c.path)
+    )
+    yield from db.session.execute(query, execution_options={'yield_per': yield_per})
+
+
+def buffered(chunks: Iterable[str], size: int = 64 * 1024) -> Iterator[str]:
+    """Join small string chunks into pieces of roughly `size` characters."""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_ndjson(node_id: int) -> Iterator[str]:
+    """
+    Export a node and its descendants as newline delimited JSON, one node per line.
+
+    Args:
+        node_id (int): The id of the top node to export.
+
+    Yields:
+        str: One JSON document per node followed by a newline, in depth-first order.
+    """
+    base_depth = None
+    for row in iter_subtree_rows(node_id):
+        if base_depth is None:
+            base_depth = row.depth
+        yield json.dumps({
+            'id': row.id,
+            'parent_id': row.parent_id if row.id != node_id else None,
+            'depth': row.depth - base_depth,
+            'ref_code': row.ref_code,
+            'title': row.title,
+            'level_of_description': row.level_of_description,
+            'date_start': row.date_start.date().isoformat() if row.date_start else None,
+            'date_end': row.date_end.date().isoformat() if row.date_end else None,
+            'extent': row.extent,
+            'archival_history': row.archival_history,
+        }, ensure_ascii=False) + '\n'
+
+
+def _ead_level(level: str) -> str:
+    if not level:
+        return ''
+    if level.lower() in EAD_LEVELS:
+        return f' level={quoteattr(level.lower())}'
+    return f' level="otherlevel" otherlevel={quoteattr(level)}'
+
+
+def _ead_did(row: sa.Row) -> str:
+    did = [f'<did><unitid>{escape(row.ref_code or "")}</unitid><unittitle>{escape(row.title or "")}</unittitle>']
+    if row.date_start or row.date_end:
+        start = (row.date_start or row.date_end).date().isoformat()
+        end = (row.date_end or row.date_start).date().isoformat()
+        label = start if start == end else f'{start}/{end}'
+        did.append(f'<unitdate normal="{start}/{end}">{label}</unitdate>')
+    if row.extent:
+        did.append(f'<physdesc><extent>{escape(row.extent)}</extent></physdesc>')
+    did.append('</did>')
+    if row.archival_history:
+        did.append(f'<custodhist><p>{escape(row.archival_history)}</p></custodhist>')
+    return ''.join(did)
+
+
+def export_ead(node_id: int) -> Iterator[str]:
+    """
+    Export a node and its descendants as an EAD 2002 finding aid.
+
+    The top node becomes the archdesc and every descendant a nested unnumbered <c>
+    component. Components are opened and closed while the depth-first row stream is
+    consumed, so only the chain of currently open components is tracked.
+
+    Args:
+        node_id (int): The id of the top node to export.
+
+    Yields:
+        str: Consecutive pieces of the EAD document.
+    """
+    rows = iter_subtree_rows(node_id)
+    root = next(rows)
+
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<ead xmlns="{EAD_NAMESPACE}">\n'
+    yield (f'<eadheader><eadid>{escape(root.ref_code or "")}</eadid><filedesc><titlestmt>'
+           f'<titleproper>{escape(root.title or "")}</titleproper></titlestmt></filedesc></eadheader>\n')
+    level = _ead_level(root.level_of_description) or ' level="fonds"'
+    yield f'<archdesc{level}>{_ead_did(root)}\n<dsc>\n'
+
+    open_depth = root.depth
+    for row in rows:
+        while open_depth >= row.depth:
+            yield '</c>\n'
+            open_depth -= 1
+        yield f'<c{_ead_level(row.level_of_description)}>{_ead_did(row)}\n'
+        open_depth = row.depth
+
+    while open_depth > root.depth:
+        yield '</c>\n'
+        open_depth -= 1
+    yield '</dsc>\n</archdesc>\n</ead>\n'
+
+
+EXPORT_FORMATS = {
+    'ead': (export_ead, 'application/xml', 'xml'),
+    'ndjson': (export_ndjson, 'application/x-ndjson', 'ndjson'),
+}
@@ -0,0 +1,233 @@
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+import sqlalchemy as sa
+from lxml import etree
+from app import db
+from app.data_management.tree import rebuild_node_counters
+from app.models import Node
+
+# Component elements of EAD 2002 (c, c01-c12) and EAD3 (c, c01-c12), plus archdesc as the top node
+COMPONENT_TAGS = {'archdesc', 'c'} | {f'c{level:02d}' for level in range(1, 13)}
+
+
+class EADImportError(Exception):
+    """Custom exception raised when an EAD file cannot be imported."""
+
+    def __init__(self, message: str = "Invalid EAD file") -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+def _text(elem: Optional[etree._Element]) -> Optional[str]:
+    """Return the whitespace normalized text content of an element, or None."""
+    if elem is None:
+        return None
+    text = ' '.join(''.join(elem.itertext()).split())
+    return text or None
+
+
+def _find(elem: etree._Element, *names: str) -> Optional[etree._Element]:
+    """Find the first descendant whose local name matches one of the given names, ignoring namespaces."""
+    for child in elem.iter():
+        if isinstance(child.tag, str) and etree.QName(child).localname in names:
+            return child
+    return None
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO 8601 date that may be reduced to year or year-month precision."""
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d', '%Y-%m', '%Y'):
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _read_did(did: etree._Element, fields: dict) -> None:
+    """Copy the descriptive identification of a component into its fields."""
+    fields['ref_code'] = _text(_find(did, 'unitid'))
+    fields['title'] = _text(_find(did, 'unittitle'))
+    fields['extent'] = _text(_find(did, 'extent', 'physdesc', 'physdescstructured'))
+
+    # EAD3 structured dates
+    from_date = _find(did, 'fromdate')
+    to_date = _find(did, 'todate')
+    if from_date is not None or to_date is not None:
+        fields['date_start'] = _parse_date(from_date.get('standarddate') if from_date is not None else None)
+        fields['date_end'] = _parse_date(to_date.get('standarddate') if to_date is not None else None)
+        return
+
+    # EAD 2002 unitdate/@normal and EAD3 unitdate/@normal, e.g. '1900/1950'
+    unit_date = _find(did, 'unitdate')
+    if unit_date is not None and unit_date.get('normal'):
+        start, _, end = unit_date.get('normal').partition('/')
+        fields['date_start'] = _parse_date(start)
+        fields['date_end'] = _parse_date(end or start)
+
+
+def iter_ead_components(path: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Stream the archival components of an EAD 2002 or EAD3 file in document order.
+
+    The file is parsed incrementally and every element is cleared as soon as its data has
+    been read, so memory use depends on the nesting depth and not on the file size.
+    A component is yielded as soon as its own description is complete, which is when its
+    first child component starts or, for leaves, when the component ends. Parents are
+    therefore always yielded before their children.
+
+    Args:
+        path (str): The path to the EAD file.
+
+    Yields:
+        Tuple[int, dict]: The nesting depth of the component (0 for archdesc) and its
+        fields (ref_code, title, level_of_description, dates, extent, archival_history).
+    """
+    # Each frame is [fields, yielded]
+    stack = []
+
+    for event, elem in etree.iterparse(path, events=('start', 'end'), remove_comments=True, huge_tree=True):
+        if not isinstance(elem.tag, str):
+            continue
+        name = etree.QName(elem).localname
+
+        if event == 'start':
+            if name in COMPONENT_TAGS:
+                if stack and not stack[-1][1]:
+                    stack[-1][1] = True
+                    yield len(stack) - 1, stack[-1][0]
+                level = elem.get('level')
+                if level == 'otherlevel':
+                    level = elem.get('otherlevel') or level
+                stack.append([{'level_of_description': level}, False])
+            continue
+
+        if not stack:
+            continue
+
+        if name == 'did':
+            _read_did(elem, stack[-1][0])
+            elem.clear()
+        elif name == 'custodhist':
+            stack[-1][0]['archival_history'] = _text(elem)
+            elem.clear()
+        elif name in COMPONENT_TAGS:
+            fields, yielded = stack.pop()
+            if not yielded:
+                yield len(stack), fields
+            # Drop the finished component and any already processed siblings
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+
+def import_ead(path: str, parent_id: Optional[int] = None, batch_size: int = 1000,
+               checkpoint: Optional[str] = None) -> int:
+    """
+    Import an EAD file as a tree of nodes with batched Core inserts.
+
+    Node ids are allocated up front as a contiguous range following the current maximum id,
+    which lets children reference their parents without reading ids back. Rows are written
+    with `executemany` in batches of `batch_size`, one transaction per batch.
+
+    The checkpoint file records the first allocated id. If an import is interrupted, running
+    it again with the same checkpoint re-parses the file, recomputes the same ids and skips
+    every component whose row was already committed. The checkpoint is removed once the
+    import is complete. No other nodes should be created while an import is running.
+
+    Args:
+        path (str): The path to the EAD file.
+        parent_id (int, optional): The id of an existing node to import the description under.
+            If None, the archdesc becomes a new top node.
+        batch_size (int, optional): The number of nodes inserted per statement. Defaults to 1000.
+        checkpoint (str, optional): The checkpoint file. Defaults to `<path>.checkpoint`.
+
+    Returns:
+        int: The number of nodes inserted by this run.
+
+    Raises:
+        EADImportError: If the parent does not exist or has no path yet, or the checkpoint belongs
+            to another import.
+        etree.XMLSyntaxError: If the EAD file is not well-formed.
+    """
+    checkpoint = checkpoint or f'{path}.checkpoint'
+    nodes = Node.__table__
+
+    base_path, base_depth = '/', -1
+    if parent_id is not None:
+        parent = db.session.get(Node, parent_id)
+        if parent is None:
+            raise EADImportError(f"Parent node {parent_id} does not exist")
+        if parent.path is None:
+            # The imported paths are derived from the parent's, without one they would all be wrong
+            raise EADImportError(f"Parent node {parent_id} has no path, run 'flask data-management rebuild-paths'")
+        base_path, base_depth = parent.path, parent.depth
+
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        if state['source'] != os.path.abspath(path) or state['parent_id'] != parent_id:
+            raise EADImportError(f"Checkpoint {checkpoint} belongs to another import")
+        first_id = state['first_id']
+        last_id = db.session.scalar(sa.select(sa.func.max(nodes.c.id)).where(nodes.c.id >= first_id))
+        committed = last_id - first_id + 1 if last_id is not None else 0
+    else:
+        first_id = (db.session.scalar(sa.select(sa.func.max(nodes.c.id))) or 0) + 1
+        committed = 0
+        state = {'source': os.path.abspath(path), 'parent_id': parent_id, 'first_id': first_id}
+        with open(checkpoint, 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+
+    now = datetime.now(timezone.utc)
+    # Ancestors of the current component as (id, path)
+    ancestors = []
+    batch = []
+    inserted = 0
+
+    for index, (depth, fields) in enumerate(iter_ead_components(path)):
+        node_id = first_id + index
+        del ancestors[depth:]
+        parent_row_id, parent_path = ancestors[-1] if ancestors else (parent_id, base_path)
+        node_path = f'{parent_path}{node_id}/'
+        ancestors.append((node_id, node_path))
+
+        if index < committed:
+            continue
+
+        batch.append({
+            'id': node_id,
+            'parent_id': parent_row_id,
+            'ref_code': fields.get('ref_code') or str(uuid.uuid4()),
+            'title': fields.get('title') or '',
+            'level_of_description': fields.get('level_of_description') or '',
+            'date_start': fields.get('date_start'),
+            'date_end': fields.get('date_end'),
+            'extent': fields.get('extent'),
+            'archival_history': fields.get('archival_history'),
+            'created_at': now,
+            'path': node_path,
+            'depth': base_depth + 1 + depth,
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(sa.insert(nodes), batch)
+            db.session.commit()
+            inserted += len(batch)
+            batch = []
+
+    if batch:
+        db.session.execute(sa.insert(nodes), batch)
+        db.session.commit()
+        inserted += len(batch)
+
+    # Core inserts bypass the counter events, so count the imported subtree in one go
+    if committed or inserted:
+        rebuild_node_counters(first_id)
+    os.remove(checkpoint)
+    return inserted
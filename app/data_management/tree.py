@@ -0,0 +1,176 @@
+from typing import Optional
+import sqlalchemy as sa
+from app import db
+from app.models import Node, path_ids, adjust_node_counters, delete_subtree_rows
+
+
+class InvalidMoveError(Exception):
+    """Custom exception raised when a node cannot be moved to the requested destination."""
+
+    def __init__(self, message: str = "Invalid move") -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+def rebuild_node_paths() -> int:
+    """
+    Recompute the materialized path and depth of every node, one level at a time.
+
+    Each level is updated with a single set-based statement, so the number of statements
+    equals the depth of the deepest tree rather than the number of nodes. Use this to
+    backfill databases created before the path column existed or to repair drifted paths.
+
+    Returns:
+        int: The number of nodes that received a path.
+    """
+    nodes = Node.__table__
+    parent = nodes.alias('parent')
+
+    db.session.execute(sa.update(nodes).values(path=None))
+    result = db.session.execute(
+        sa.update(nodes)
+        .where(nodes.c.parent_id.is_(None))
+        .values(path=sa.literal('/') + sa.cast(nodes.c.id, sa.String) + '/', depth=0)
+    )
+    total = result.rowcount
+
+    while result.rowcount:
+        parent_path = sa.select(parent.c.path).where(parent.c.id == nodes.c.parent_id).scalar_subquery()
+        parent_depth = sa.select(parent.c.depth).where(parent.c.id == nodes.c.parent_id).scalar_subquery()
+        result = db.session.execute(
+            sa.update(nodes)
+            .where(nodes.c.path.is_(None))
+            .where(nodes.c.parent_id.in_(sa.select(parent.c.id).where(parent.c.path.is_not(None))))
+            .values(path=parent_path + sa.cast(nodes.c.id, sa.String) + '/', depth=parent_depth + 1)
+        )
+        total += result.rowcount
+
+    db.session.commit()
+    return total
+
+
+def rebuild_node_counters(node_id: Optional[int] = None) -> int:
+    """
+    Recompute the child and descendant counters with one set-based statement.
+
+    Child counts come from the parent_id index and descendant counts from a range scan
+    over the path index, so the counters can be repaired without loading any nodes.
+
+    Args:
+        node_id (int, optional): Only recompute the subtree of this node and its ancestors.
+            If None, every node is recomputed.
+
+    Returns:
+        int: The number of nodes whose counters were recomputed.
+
+    Raises:
+        ValueError: If `node_id` is given and the node does not exist or has no path yet.
+    """
+    nodes = Node.__table__
+    child = nodes.alias('child')
+    descendant = nodes.alias('descendant')
+
+    child_count = sa.select(sa.func.count()).where(child.c.parent_id == nodes.c.id).scalar_subquery()
+    path_end = sa.func.substr(nodes.c.path, 1, sa.func.length(nodes.c.path) - 1, type_=sa.String) + '0'
+    descendant_count = (
+        sa.select(sa.func.count())
+        .where(descendant.c.path > nodes.c.path, descendant.c.path < path_end)
+        .scalar_subquery()
+    )
+
+    query = sa.update(nodes).values(child_count=child_count, descendant_count=descendant_count,
+                                    version=nodes.c.version + 1)
+    if node_id is not None:
+        path = db.session.scalar(sa.select(nodes.c.path).where(nodes.c.id == node_id))
+        if path is None:
+            raise ValueError(f"Node {node_id} does not exist or has no path, run 'flask data-management rebuild-paths'")
+        query = query.where(sa.or_(nodes.c.id.in_(path_ids(path)), Node.descendant_clause(path)))
+
+    result = db.session.execute(query)
+    db.session.commit()
+    return result.rowcount
+
+
+def delete_subtree(node_id: int) -> dict:
+    """
+    Delete a node, all its descendants and their associations with set-based statements.
+
+    The subtree is selected through the path index, so no node is loaded into the session.
+    Related node and agent associations are removed first, then the nodes, and the counters
+    of the remaining ancestors are reduced, all within one transaction.
+
+    Args:
+        node_id (int): The id of the top node of the subtree to delete.
+
+    Returns:
+        dict: The number of deleted rows per table ('nodes', 'node_association' and
+              'agent_node_association').
+
+    Raises:
+        ValueError: If the node does not exist or has no path yet.
+    """
+    nodes = Node.__table__
+    path = db.session.scalar(sa.select(nodes.c.path).where(nodes.c.id == node_id))
+    if path is None:
+        raise ValueError(f"Node {node_id} does not exist or has no path, run 'flask data-management rebuild-paths'")
+
+    try:
+        counts = delete_subtree_rows(db.session.connection(), node_id, path)
+        adjust_node_counters(db.session.connection(), path_ids(path)[:-1], -counts['nodes'])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return counts
+
+
+def move_subtree(node_id: int, destination_id: Optional[int]) -> Node:
+    """
+    Move a node with its whole subtree below another node.
+
+    The destination is checked against the materialized paths, so rejecting a move into
+    the node's own subtree needs no walk up the tree. A sibling with the same reference
+    code is reported before anything is written, as it would violate uq_ref_code_parent_id.
+    Re-parenting then triggers the node events, which rewrite path and depth of the
+    subtree and move its size between the old and new ancestor counters in bulk.
+
+    Args:
+        node_id (int): The id of the node to move.
+        destination_id (int, optional): The id of the new parent. If None, the node becomes a top node.
+
+    Returns:
+        Node: The moved node.
+
+    Raises:
+        InvalidMoveError: If a node does not exist, the destination lies within the moved
+            subtree or already has a child with the same reference code.
+    """
+    node = db.session.get(Node, node_id)
+    if node is None:
+        raise InvalidMoveError(f"Node {node_id} does not exist")
+
+    destination = None
+    if destination_id is not None:
+        destination = db.session.get(Node, destination_id)
+        if destination is None:
+            raise InvalidMoveError(f"Destination node {destination_id} does not exist")
+        if destination.id == node.id or destination.is_descendant_of(node):
+            raise InvalidMoveError(f"Cannot move '{node.title}' into its own subtree")
+        if destination.id == node.parent_id:
+            return node
+
+        duplicate = db.session.scalar(
+            sa.select(sa.exists().where(Node.parent_id == destination.id, Node.ref_code == node.ref_code,
+                                        Node.id != node.id))
+        )
+        if duplicate:
+            raise InvalidMoveError(f"'{destination.title}' already has a child with reference code {node.ref_code}")
+    elif node.parent_id is None:
+        return node
+
+    # Set through the column, not the relationship: leaving a loaded parent's children would
+    # make the node an orphan, which the delete-orphan cascade deletes
+    node.parent_id = destination.id if destination is not None else None
+    db.session.commit()
+    return node
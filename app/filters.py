@@ -1,6 +1,9 @@
+import hashlib
+import threading
 from lxml import etree
 from datetime import datetime
-from typing import Union
+from typing import Tuple, Union
+from app.cache import LRUCache
 
 
 def extract_year(date: Union[datetime, str]) -> Union[int, str]:
@@ -38,10 +41,71 @@ def extract_year(date: Union[datetime, str]) -> Union[int, str]:
     return ''
 
 
+def _content_hash(content: Union[str, bytes]) -> str:
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+class XSLTCache:
+    """
+    Compiled XSLT stylesheets and their output, kept in memory and shared by every view in the process.
+
+    Stylesheets and documents are keyed by a hash of their content, so the same stylesheet is
+    compiled once however it was loaded, and an edited one is simply a new key. The least
+    recently used entries are evicted once more than the given number are kept.
+    """
+
+    def __init__(self, stylesheets: int = 32, results: int = 1024) -> None:
+        self._stylesheets = LRUCache(stylesheets)
+        self._results = LRUCache(results)
+
+    def stylesheet(self, xslt_str: Union[str, bytes]) -> Tuple[str, etree.XSLT, threading.Lock]:
+        """
+        Return the hash and the compiled transformation of a stylesheet, compiling it on first use.
+
+        The transformation must be applied while holding the returned lock.
+        """
+        key = _content_hash(xslt_str)
+        entry = self._stylesheets.get(key)
+        if entry is None:
+            entry = (key, etree.XSLT(etree.XML(xslt_str)), threading.Lock())
+            self._stylesheets.set(key, entry)
+        return entry
+
+    def transform(self, xml_str: Union[str, bytes], xslt_str: Union[str, bytes]) -> str:
+        """
+        Transform an XML document with a stylesheet, returning the cached output when there is one.
+
+        Raises:
+            etree.XMLSyntaxError: If the XML or XSLT strings are not well-formed.
+            etree.XSLTParseError: If there is an issue parsing the XSLT string.
+            etree.XSLTApplyError: If the transformation fails.
+        """
+        stylesheet_key, transform, lock = self.stylesheet(xslt_str)
+        key = (stylesheet_key, _content_hash(xml_str))
+        result = self._results.get(key)
+        if result is None:
+            xml = etree.fromstring(xml_str)
+            with lock:
+                result = str(transform(xml))
+            self._results.set(key, result)
+        return result
+
+    def clear(self) -> None:
+        self._stylesheets.clear()
+        self._results.clear()
+
+
+xslt_cache = XSLTCache()
+
+
 def xslt_transform(xml_str: str, xslt_str: str) -> str:
     """
     Transforms an XML string using an XSLT stylesheet string and returns the resulting HTML.
 
+    The compiled stylesheet and the output are cached, see XSLTCache.
+
     Args:
         xml_str (str): The XML content as a string.
         xslt_str (str): The XSLT stylesheet as a string.
@@ -69,16 +133,4 @@ def xslt_transform(xml_str: str, xslt_str: str) -> str:
         In template use:
         {{ xml_data|xslt_transform(xslt_data)|safe }}
     """
-    # Parse the XML string
-    xml = etree.fromstring(xml_str)
-
-    # Parse the XSLT string
-    xslt = etree.XML(xslt_str)
-
-    # Create the transformation object
-    transform = etree.XSLT(xslt)
-
-    # Apply the transformation and return the result as a string
-    result = transform(xml)
-
-    return str(result)
\ No newline at end of file
+    return xslt_cache.transform(xml_str, xslt_str)
@@ -1,4 +1,5 @@
-from flask import render_template
+from datetime import timedelta
+from flask import current_app, render_template
 from flask_login import login_required
 from app.main import bp
 from app.main.utils import (
@@ -11,6 +12,7 @@ from app.main.utils import (
     get_cpu_usage,
     bytes_to_human_readable
 )
+from app.preservation.audit import audit_status
 
 @bp.route('/')
 @bp.route('/index')
@@ -47,3 +49,10 @@ def poll_usage():
     return render_template('administration/system/_pollusage.jinja2', ram=ram_percentage, cpu=cpu)
 
 
+@bp.route('/administration/system/poll-fixity-audit')
+@login_required
+def poll_fixity_audit():
+    audit = audit_status(timedelta(days=current_app.config['FIXITY_AUDIT_CYCLE_DAYS']))
+    for key in ('bytes_verified', 'backlog_bytes', 'throughput'):
+        audit[key] = bytes_to_human_readable(int(audit[key]))
+    return render_template('administration/system/_fixityaudit.jinja2', audit=audit)
@@ -3,6 +3,7 @@ from typing import Optional
 import sqlalchemy as sa
 import sqlalchemy.orm as so
 from app import db
+from app.pagination import keyset_paginate, KeysetPage
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from app import login
@@ -12,6 +13,11 @@ from app import login
 def load_user(id):
     return db.session.get(User, int(id))
 
+def path_ids(path: str) -> list:
+    """Split a materialized node path such as '/1/5/23/' into its node ids."""
+    return [int(part) for part in path.strip('/').split('/') if part]
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
 
@@ -57,6 +63,8 @@ class Agent(db.Model):
     date_start: so.Mapped[datetime] = so.mapped_column(nullable=True)
     date_end: so.Mapped[datetime] = so.mapped_column(nullable=True)
     created_at: so.Mapped[datetime] = so.mapped_column(index=True, default=lambda: datetime.now(timezone.utc))
+    updated_at: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc),
+                                                       onupdate=lambda: datetime.now(timezone.utc))
 
     # One-to-many relationship with Identifiers
     identifiers: so.Mapped[list['Identifier']] = so.relationship('Identifier', back_populates='agent')
@@ -91,6 +99,21 @@ class Node(db.Model):
     extent: so.Mapped[str] = so.mapped_column(sa.String(50), nullable=True)
     archival_history: so.Mapped[str] = so.mapped_column(sa.String(50), nullable=True)
     created_at: so.Mapped[datetime] = so.mapped_column(index=True, default=lambda: datetime.now(timezone.utc))
+    # Also set by the Core updates of the events below, i.e. whenever the node or its subtree changes
+    updated_at: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc),
+                                                       onupdate=lambda: datetime.now(timezone.utc))
+
+    # Materialized ancestry path ('/<top id>/.../<own id>/') and depth below the top node,
+    # kept in sync by the mapper events at the bottom of this module
+    path: so.Mapped[Optional[str]] = so.mapped_column(sa.String(255), index=True, nullable=True)
+    depth: so.Mapped[int] = so.mapped_column(default=0)
+
+    # Denormalized number of direct children and of all nodes below, kept in sync by the same events
+    child_count: so.Mapped[int] = so.mapped_column(default=0)
+    descendant_count: so.Mapped[int] = so.mapped_column(default=0)
+
+    # Raised whenever the node or anything below it changes, used to key cached fragments
+    version: so.Mapped[int] = so.mapped_column(default=1)
 
     # Many-to-Many relationships
     related_nodes: so.Mapped[list['Node']] = so.relationship(
@@ -117,45 +140,129 @@ class Node(db.Model):
 
     __table_args__ = (
         sa.UniqueConstraint('ref_code', 'parent_id', name='uq_ref_code_parent_id'),
+        # Serves keyset pagination of top nodes and ordered child listings
+        sa.Index('ix_nodes_parent_id_created_at_id', 'parent_id', 'created_at', 'id'),
     )
 
     def is_top_node(self) -> bool:
         """Check if the node is the top node of the tree."""
         return self.parent is None
 
-    def get_top_node(self) -> 'Node':
-        """Retrieve the top node of the tree starting from any sub-node."""
+    @property
+    def ancestor_ids(self) -> list:
+        """Ids of all parent nodes, top node first, read from the materialized path."""
+        if self.path is None:
+            # Not flushed yet (or not backfilled), fall back to walking the loaded parents
+            return [node.id for node in self._walk_parents()][::-1]
+        return path_ids(self.path)[:-1]
+
+    def _walk_parents(self):
         current_node = self
         while current_node.parent is not None:
             current_node = current_node.parent
-        return current_node
+            yield current_node
 
-    def get_all_parent_nodes(self) -> list:
-        """Retrieve all parent nodes for the current node recursively."""
-        parents = []
-        current_node = self
+    @staticmethod
+    def descendant_clause(path: str):
+        """
+        Build a condition matching every node below the node with the given path.
 
-        while current_node.parent is not None:
-            parents.append(current_node.parent)
-            current_node = current_node.parent
+        The prefix match is written as a range instead of LIKE so that the index on
+        ``path`` is used: '/' sorts directly before '0', so all descendants of '/1/5/'
+        fall between '/1/5/' and '/1/50'.
+        """
+        return sa.and_(Node.path > path, Node.path < path[:-1] + '0')
 
-        return parents[::-1]
+    def get_top_node(self) -> 'Node':
+        """Retrieve the top node of the tree starting from any sub-node."""
+        ancestor_ids = self.ancestor_ids
+        if not ancestor_ids:
+            return self
+        return db.session.get(Node, ancestor_ids[0])
+
+    def get_all_parent_nodes(self) -> list:
+        """Retrieve all parent nodes for the current node, top node first."""
+        ancestor_ids = self.ancestor_ids
+        if not ancestor_ids:
+            return []
+        query = sa.select(Node).where(Node.id.in_(ancestor_ids)).order_by(Node.depth)
+        return list(db.session.scalars(query))
+
+    def is_descendant_of(self, other: 'Node') -> bool:
+        """Check if the node is located anywhere below the other node."""
+        return other.id in self.ancestor_ids
 
     def get_sibling_nodes(self) -> list:
         """Retrieve all sibling nodes for the current node."""
-        if self.parent:
-            return [child for child in self.parent.children if child.id != self.id]
-        return []
-
-    def get_full_tree(self) -> dict:
-        """Retrieve the full tree rooted at the current node."""
-        tree = {
-            'id': self.id,
-            'title': self.title,
-            'created_at': self.created_at,
-            'children': [child.get_full_tree() for child in self.children]
+        if self.parent_id is None:
+            return []
+        query = (
+            sa.select(Node)
+            .where(Node.parent_id == self.parent_id, Node.id != self.id)
+            .order_by(Node.created_at, Node.id)
+        )
+        return list(db.session.scalars(query))
+
+    def get_children_page(self, cursor: Optional[str] = None, per_page: int = 100) -> KeysetPage:
+        """
+        Retrieve one window of the children of the current node.
+
+        Children are read in (created_at, id) order through the (parent_id, created_at, id)
+        index, so every window costs the same however wide the node is.
+
+        Args:
+            cursor (str, optional): The next_cursor of the previous window. If None, the first window is returned.
+            per_page (int, optional): The number of children per window. Defaults to 100.
+
+        Returns:
+            KeysetPage: The children in the window and the cursor of the following one.
+        """
+        query = sa.select(Node).where(Node.parent_id == self.id)
+        return keyset_paginate(query, (Node.created_at, Node.id), cursor, per_page=per_page)
+
+    def get_full_tree(self, max_depth: Optional[int] = None) -> dict:
+        """
+        Retrieve the full tree rooted at the current node.
+
+        The whole subtree is fetched with a single recursive CTE and the nested dict is
+        assembled in memory from an id -> children map, so the cost is one query no
+        matter how many nodes the tree holds.
+
+        Args:
+            max_depth (int, optional): Number of levels below the current node to include.
+                If None, the complete subtree is returned.
+
+        Returns:
+            dict: The node as {'id', 'title', 'created_at', 'children'}, with children nested
+                  the same way.
+        """
+        nodes = Node.__table__
+        child = nodes.alias('child')
+
+        tree = (
+            sa.select(nodes.c.id, nodes.c.parent_id, nodes.c.title, nodes.c.created_at,
+                      sa.literal(0).label('level'))
+            .where(nodes.c.id == self.id)
+            .cte('tree', recursive=True)
+        )
+        step = (
+            sa.select(child.c.id, child.c.parent_id, child.c.title, child.c.created_at, tree.c.level + 1)
+            .where(child.c.parent_id == tree.c.id)
+        )
+        if max_depth is not None:
+            step = step.where(tree.c.level < max_depth)
+        tree = tree.union_all(step)
+
+        rows = db.session.execute(sa.select(tree).order_by(tree.c.level, tree.c.id)).all()
+
+        entries = {
+            row.id: {'id': row.id, 'title': row.title, 'created_at': row.created_at, 'children': []}
+            for row in rows
         }
-        return tree
+        for row in rows:
+            if row.id != self.id:
+                entries[row.parent_id]['children'].append(entries[row.id])
+        return entries[self.id]
 
     def __repr__(self):
         return '<Node {}>'.format(self.title)
@@ -171,9 +278,229 @@ class FormatRegistry(db.Model):
     allowed: so.Mapped[bool] = so.mapped_column()
     group: so.Mapped[str] = so.mapped_column(sa.String(256), default='undefined')
     action: so.Mapped[str] = so.mapped_column(sa.String(256), nullable=True)
+    updated_at: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc),
+                                                       onupdate=lambda: datetime.now(timezone.utc))
 
     def __repr__(self):
         return '<Node {}>'.format(self.name)
 
 
+class Fixity(db.Model):
+    """The checksums of a stored file, recorded on ingest and re-verified by audits."""
+    __tablename__ = 'fixity'
 
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    # Files are not modelled yet, so a record is linked to its file by the absolute path
+    path: so.Mapped[str] = so.mapped_column(sa.String(4096), unique=True)
+    size: so.Mapped[int] = so.mapped_column(sa.BigInteger)
+    md5: so.Mapped[Optional[str]] = so.mapped_column(sa.String(32))
+    sha1: so.Mapped[Optional[str]] = so.mapped_column(sa.String(40))
+    sha256: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64), index=True)
+    sha512: so.Mapped[Optional[str]] = so.mapped_column(sa.String(128))
+    # 'ok', 'mismatch' or 'missing' after the last verification
+    status: so.Mapped[str] = so.mapped_column(sa.String(16), default='ok', index=True)
+    failure_count: so.Mapped[int] = so.mapped_column(default=0)
+    created_at: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
+    verified_at: so.Mapped[datetime] = so.mapped_column(index=True, default=lambda: datetime.now(timezone.utc))
+
+    events: so.Mapped[list['PreservationEvent']] = so.relationship('PreservationEvent', back_populates='fixity')
+
+    def digests(self) -> dict:
+        """The stored digests per algorithm, leaving out algorithms that were not computed."""
+        return {algorithm: getattr(self, algorithm) for algorithm in ('md5', 'sha1', 'sha256', 'sha512')
+                if getattr(self, algorithm) is not None}
+
+    def __repr__(self):
+        return '<Fixity {}>'.format(self.path)
+
+
+class PreservationEvent(db.Model):
+    """An action taken on a stored file, after the PREMIS event entity."""
+    __tablename__ = 'preservation_events'
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    # PREMIS event type, such as 'fixity check'
+    event_type: so.Mapped[str] = so.mapped_column(sa.String(64), index=True)
+    # 'success' or 'failure'
+    outcome: so.Mapped[str] = so.mapped_column(sa.String(16))
+    outcome_detail: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    fixity_id: so.Mapped[Optional[int]] = so.mapped_column(sa.ForeignKey('fixity.id'), index=True)
+    created_at: so.Mapped[datetime] = so.mapped_column(index=True, default=lambda: datetime.now(timezone.utc))
+
+    fixity: so.Mapped[Optional['Fixity']] = so.relationship('Fixity', back_populates='events')
+
+    def __repr__(self):
+        return '<PreservationEvent {} {}>'.format(self.event_type, self.outcome)
+
+
+class FixityAuditState(db.Model):
+    """The progress of the fixity audit scheduler, a single row shared by the CLI and the web app."""
+    __tablename__ = 'fixity_audit_state'
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    paused: so.Mapped[bool] = so.mapped_column(default=False)
+    # The process running the audit, None when none is
+    pid: so.Mapped[Optional[int]] = so.mapped_column()
+    started_at: so.Mapped[Optional[datetime]] = so.mapped_column()
+    heartbeat_at: so.Mapped[Optional[datetime]] = so.mapped_column()
+    # Totals of the current or last run
+    files_verified: so.Mapped[int] = so.mapped_column(sa.BigInteger, default=0)
+    bytes_verified: so.Mapped[int] = so.mapped_column(sa.BigInteger, default=0)
+    failures: so.Mapped[int] = so.mapped_column(default=0)
+    # Time spent verifying, excluding time spent paused or idle
+    active_seconds: so.Mapped[float] = so.mapped_column(default=0.0)
+
+
+@sa.event.listens_for(Node, 'after_insert')
+def set_node_path(mapper, connection, target):
+    """Derive the path and depth of a new node from its parent once its id is known."""
+    parent_path, parent_depth = '/', -1
+    if target.parent_id is not None:
+        parent_path, parent_depth = connection.execute(
+            sa.select(Node.path, Node.depth).where(Node.id == target.parent_id)
+        ).one()
+    path = f'{parent_path}{target.id}/'
+    connection.execute(
+        sa.update(Node.__table__).where(Node.id == target.id).values(path=path, depth=parent_depth + 1)
+    )
+    so.attributes.set_committed_value(target, 'path', path)
+    so.attributes.set_committed_value(target, 'depth', parent_depth + 1)
+    adjust_node_counters(connection, path_ids(parent_path), 1)
+
+
+@sa.event.listens_for(Node, 'after_update')
+def update_node_path(mapper, connection, target):
+    """Rewrite the paths of a re-parented node and its whole subtree in one statement."""
+    state = sa.inspect(target)
+    if not (state.attrs.parent_id.history.has_changes() or state.attrs.parent.history.has_changes()):
+        return
+    if target.path is None:
+        return
+
+    parent_path, parent_depth = '/', -1
+    if target.parent_id is not None:
+        parent_path, parent_depth = connection.execute(
+            sa.select(Node.path, Node.depth).where(Node.id == target.parent_id)
+        ).one()
+    old_path = target.path
+    new_path = f'{parent_path}{target.id}/'
+    if new_path == old_path:
+        return
+
+    nodes = Node.__table__
+    connection.execute(
+        sa.update(nodes)
+        .where(sa.or_(nodes.c.id == target.id, Node.descendant_clause(old_path)))
+        .values(
+            path=sa.literal(new_path) + sa.func.substr(nodes.c.path, len(old_path) + 1),
+            depth=nodes.c.depth + (parent_depth + 1 - target.depth),
+        )
+    )
+    so.attributes.set_committed_value(target, 'path', new_path)
+    so.attributes.set_committed_value(target, 'depth', parent_depth + 1)
+
+    subtree_size = 1 + connection.scalar(sa.select(nodes.c.descendant_count).where(nodes.c.id == target.id))
+    adjust_node_counters(connection, path_ids(old_path)[:-1], -subtree_size)
+    adjust_node_counters(connection, path_ids(new_path)[:-1], subtree_size)
+
+
+@sa.event.listens_for(Node, 'before_update')
+def bump_node_version(mapper, connection, target):
+    """
+    Raise the version of an edited node as part of its own UPDATE.
+
+    Changed agent and related node links count as edits too, they are shown in the node's
+    fragments. before_update also fires for a node whose only change is such a link.
+    """
+    if so.object_session(target).is_modified(target):
+        target.version = Node.version + 1
+
+
+@sa.event.listens_for(Node, 'after_update')
+def bump_ancestor_versions(mapper, connection, target):
+    """Raise the versions of the ancestors of an edited node, whose fragments show it too."""
+    if target.path is None or not so.object_session(target).is_modified(target):
+        return
+    ancestor_ids = path_ids(target.path)[:-1]
+    if ancestor_ids:
+        nodes = Node.__table__
+        connection.execute(sa.update(nodes).where(nodes.c.id.in_(ancestor_ids)).values(version=nodes.c.version + 1))
+
+
+@sa.event.listens_for(Node, 'before_delete')
+def release_node_counters(mapper, connection, target):
+    """
+    Remove a deleted node and its subtree from the counters of its ancestors.
+
+    SQLite does not enforce foreign keys unless asked to, so the ON DELETE CASCADE of parent_id
+    cannot be relied on to remove the descendants. They are deleted here instead, with the
+    statements delete_subtree uses, and the whole subtree is subtracted from the ancestors unless
+    an ancestor is deleted in the same flush and already did both.
+    """
+    path, descendant_count = connection.execute(
+        sa.select(Node.path, Node.descendant_count).where(Node.id == target.id)
+    ).one()
+    if path is None:
+        return
+    ancestor_ids = path_ids(path)[:-1]
+    session = so.object_session(target)
+    if session is not None and any(isinstance(obj, Node) and obj.id in ancestor_ids for obj in session.deleted):
+        return
+    # The node itself and its own associations are deleted by the flush
+    delete_subtree_rows(connection, target.id, path, include_root=False)
+    adjust_node_counters(connection, ancestor_ids, -(1 + descendant_count))
+
+
+def delete_subtree_rows(connection, node_id: int, path: str, include_root: bool = True) -> dict:
+    """
+    Delete the nodes of a subtree and their node and agent associations with set-based statements.
+
+    Args:
+        connection: The connection of the current flush or transaction.
+        node_id (int): The id of the top node of the subtree.
+        path (str): The materialized path of the top node.
+        include_root (bool, optional): If False, only the descendants are deleted. Defaults to True.
+
+    Returns:
+        dict: The number of deleted rows per table ('nodes', 'node_association' and
+              'agent_node_association').
+    """
+    nodes = Node.__table__
+    condition = Node.descendant_clause(path)
+    if include_root:
+        condition = sa.or_(nodes.c.id == node_id, condition)
+    subtree = sa.select(nodes.c.id).where(condition)
+
+    node_links = connection.execute(
+        sa.delete(node_association).where(sa.or_(node_association.c.parent_id.in_(subtree),
+                                                 node_association.c.child_id.in_(subtree)))
+    ).rowcount
+    agent_links = connection.execute(
+        sa.delete(agent_node_association).where(agent_node_association.c.node_id.in_(subtree))
+    ).rowcount
+    deleted = connection.execute(sa.delete(nodes).where(condition)).rowcount
+    return {'nodes': deleted, 'node_association': node_links, 'agent_node_association': agent_links}
+
+
+def adjust_node_counters(connection, ancestor_ids: list, size: int) -> None:
+    """
+    Add a subtree of `size` nodes (negative to remove) to the counters of its ancestors
+    and raise their versions.
+
+    Args:
+        connection: The connection of the current flush or transaction.
+        ancestor_ids (list): The ids of the ancestors of the subtree root, its parent last.
+        size (int): The number of nodes in the subtree, negative when it is removed.
+    """
+    if not ancestor_ids:
+        return
+    nodes = Node.__table__
+    connection.execute(
+        sa.update(nodes)
+        .where(nodes.c.id.in_(ancestor_ids))
+        .values(
+            descendant_count=nodes.c.descendant_count + size,
+            version=nodes.c.version + 1,
+            child_count=nodes.c.child_count + sa.case((nodes.c.id == ancestor_ids[-1], 1 if size > 0 else -1), else_=0),
+        )
+    )
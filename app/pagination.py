@@ -0,0 +1,132 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Sequence
+import sqlalchemy as sa
+from app import db
+
+
+class KeysetPage:
+    """
+    One page of a keyset (seek) paginated query.
+
+    Iterating over the page yields its items. `next_cursor` and `prev_cursor` are opaque
+    strings to pass back to `keyset_paginate` for the adjacent pages.
+    """
+
+    def __init__(self, items: list, next_cursor: Optional[str], prev_cursor: Optional[str],
+                 total: Optional[int] = None, total_is_estimate: bool = False) -> None:
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def encode_cursor(values: Sequence[Any], direction: str) -> str:
+    """Encode the key values of a row and a direction ('next' or 'prev') as an opaque cursor."""
+    payload = [direction, [value.isoformat() if isinstance(value, datetime) else value for value in values]]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def _decode_value(column: sa.ColumnElement, value: Any) -> Any:
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if not isinstance(value, python_type):
+        raise TypeError(f"Expected {python_type.__name__}, got {type(value).__name__}")
+    return value
+
+
+def decode_cursor(cursor: str, columns: Sequence[sa.ColumnElement]) -> tuple[str, list]:
+    """
+    Decode a cursor created by `encode_cursor` into its direction and typed key values.
+
+    Raises:
+        ValueError: If the cursor is malformed or does not match the key columns.
+    """
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if direction not in ('next', 'prev') or not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        # Cursors come from the client, a tampered value must not reach the query with the wrong type
+        return direction, [_decode_value(column, value) for column, value in zip(columns, values)]
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_paginate(query: sa.Select, columns: Sequence[sa.ColumnElement], cursor: Optional[str] = None,
+                    per_page: int = 15, count_limit: Optional[int] = None) -> KeysetPage:
+    """
+    Paginate a select by seeking past the key of the last row instead of using OFFSET.
+
+    The query is ordered by `columns`, which must be unique together (end with the primary
+    key) and should be covered by an index, so that every page costs the same as the first
+    one regardless of how deep it is. No COUNT(*) is issued; with `count_limit` the rows are
+    counted only up to that limit and the total is flagged as an estimate when it is reached.
+
+    Args:
+        query (sa.Select): The select statement returning the items, without ORDER BY.
+        columns (Sequence[sa.ColumnElement]): The key columns, e.g. (Node.created_at, Node.id).
+        cursor (str, optional): A cursor from a previous page. Invalid cursors return the first page.
+        per_page (int, optional): The number of items per page. Defaults to 15.
+        count_limit (int, optional): Count the matching rows up to this many. Defaults to no count.
+
+    Returns:
+        KeysetPage: The items of the requested page and the cursors of its neighbours.
+    """
+    direction, values = 'next', None
+    if cursor:
+        try:
+            direction, values = decode_cursor(cursor, columns)
+        except ValueError:
+            direction, values = 'next', None
+
+    base_query = query
+    key = sa.tuple_(*columns)
+    if values is not None:
+        bound = sa.tuple_(*[sa.literal(value, column.type) for column, value in zip(columns, values)])
+        query = query.where(key > bound if direction == 'next' else key < bound)
+    if direction == 'next':
+        query = query.order_by(*columns)
+    else:
+        query = query.order_by(*[column.desc() for column in columns])
+
+    items = list(db.session.scalars(query.limit(per_page + 1)))
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if direction == 'prev':
+        items.reverse()
+
+    def key_of(item):
+        return [getattr(item, column.key) for column in columns]
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_more or direction == 'prev':
+            next_cursor = encode_cursor(key_of(items[-1]), 'next')
+        if values is not None and (has_more or direction == 'next'):
+            prev_cursor = encode_cursor(key_of(items[0]), 'prev')
+
+    total, total_is_estimate = None, False
+    if count_limit is not None:
+        total = db.session.scalar(sa.select(sa.func.count()).select_from(base_query.limit(count_limit).subquery()))
+        total_is_estimate = total >= count_limit
+
+    return KeysetPage(items, next_cursor, prev_cursor, total, total_is_estimate)
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+import sqlalchemy as sa
+from app import db
+from app.models import Fixity, FixityAuditState
+from app.preservation.fixity import FIXITY_OK, verify_fixity
+from app.preservation.tools.fixity.throttle import Throttle
+
+# The id of the single FixityAuditState row
+AUDIT_STATE_ID = 1
+
+
+class AuditRunningError(Exception):
+    """Custom exception raised when a fixity audit is started while another one is running."""
+
+    def __init__(self, message: str = "A fixity audit is already running") -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+def get_audit_state() -> FixityAuditState:
+    """Return the audit state, creating it on first use."""
+    state = db.session.get(FixityAuditState, AUDIT_STATE_ID)
+    if state is None:
+        state = FixityAuditState(id=AUDIT_STATE_ID, files_verified=0, bytes_verified=0, failures=0,
+                                 active_seconds=0.0)
+        db.session.add(state)
+        db.session.commit()
+    return state
+
+
+def set_audit_paused(paused: bool) -> None:
+    """Pause or resume the audit. A running scheduler picks the change up after its current batch."""
+    get_audit_state().paused = paused
+    db.session.commit()
+
+
+def audit_status(cycle: timedelta, heartbeat_timeout: float = 120.0) -> Dict:
+    """
+    Summarise the audit for display.
+
+    Args:
+        cycle (timedelta): The audit cycle, records verified longer ago than this are the backlog.
+        heartbeat_timeout (float, optional): Seconds without a heartbeat after which a scheduler
+            is considered gone. Defaults to 120.
+
+    Returns:
+        Dict: The status ('running', 'paused' or 'stopped'), the files, bytes, failures and throughput
+        in bytes per second of the current or last run, the backlog in files and bytes, the estimated
+        seconds to clear it at the current throughput and the total number of records.
+    """
+    state = get_audit_state()
+    due = datetime.now(timezone.utc) - cycle
+    backlog_files, backlog_bytes = db.session.execute(
+        sa.select(sa.func.count(Fixity.id), sa.func.coalesce(sa.func.sum(Fixity.size), 0))
+        .where(Fixity.verified_at < due)
+    ).one()
+    total = db.session.scalar(sa.select(sa.func.count(Fixity.id)))
+
+    alive = (state.pid is not None and state.heartbeat_at is not None and
+             (datetime.now(timezone.utc) - state.heartbeat_at.replace(tzinfo=timezone.utc)).total_seconds()
+             < heartbeat_timeout)
+    throughput = state.bytes_verified / state.active_seconds if state.active_seconds else 0.0
+    return {
+        'status': 'paused' if state.paused else 'running' if alive else 'stopped',
+        'started_at': state.started_at,
+        'heartbeat_at': state.heartbeat_at,
+        'files_verified': state.files_verified,
+        'bytes_verified': state.bytes_verified,
+        'failures': state.failures,
+        'throughput': throughput,
+        'backlog_files': backlog_files,
+        'backlog_bytes': backlog_bytes,
+        'backlog_seconds': backlog_bytes / throughput if throughput else None,
+        'total_files': total,
+    }
+
+
+class FixityAuditScheduler:
+    """
+    Re-verify the fixity store continuously without saturating the storage.
+
+    Records not verified within `cycle` are taken least recently verified first, a small batch at
+    a time. All reads go through one Throttle, so the audit stays under the bytes per second and
+    IOPS budget however many threads hash. Progress lives in the database: records are stamped as
+    they are verified and the run totals are saved after every batch, so a stopped or killed
+    scheduler resumes where it left off. Pausing through the audit state keeps the process alive
+    but idle until it is resumed. Only one scheduler runs at a time: a scheduler refuses to start
+    while another has sent a heartbeat within `heartbeat_timeout` seconds, which must be longer
+    than a batch takes at the throttled rate.
+    """
+
+    def __init__(self, bytes_per_second: Optional[float] = None, iops: Optional[float] = None,
+                 cycle: timedelta = timedelta(days=90), batch_size: int = 16, workers: int = 2,
+                 poll_interval: float = 30.0, heartbeat_timeout: float = 120.0,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        self.cycle = cycle
+        self.batch_size = batch_size
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self._sleep = sleep
+        self._throttle = Throttle(bytes_per_second, iops)
+        self._bytes_lock = threading.Lock()
+        self._bytes_read = 0
+
+    def _read(self, count: int) -> None:
+        self._throttle(count)
+        with self._bytes_lock:
+            self._bytes_read += count
+
+    def run_batch(self) -> int:
+        """
+        Verify one batch of due records and add it to the run totals.
+
+        Returns:
+            int: The number of records verified, 0 when none are due.
+        """
+        start = time.monotonic()
+        self._bytes_read = 0
+        state = get_audit_state()
+        # Never verify a record twice in one run, even with a cycle shorter than the run
+        older_than = self.cycle
+        if state.started_at is not None:
+            older_than = max(older_than, datetime.now(timezone.utc) - state.started_at.replace(tzinfo=timezone.utc))
+        results = list(verify_fixity(limit=self.batch_size, older_than=older_than, workers=self.workers,
+                                     batch_size=self.batch_size, throttle=self._read))
+        state = get_audit_state()
+        state.files_verified += len(results)
+        state.bytes_verified += self._bytes_read
+        state.failures += sum(result['status'] != FIXITY_OK for result in results)
+        state.active_seconds += time.monotonic() - start
+        state.heartbeat_at = datetime.now(timezone.utc)
+        db.session.commit()
+        return len(results)
+
+    def run(self, duration: Optional[float] = None, until_idle: bool = False) -> Dict:
+        """
+        Run the audit in this process.
+
+        Args:
+            duration (float, optional): Stop after this many seconds. Defaults to running until stopped.
+            until_idle (bool, optional): Stop once no records are due, or the audit is paused, instead
+                of waiting. Defaults to False.
+
+        Returns:
+            Dict: The audit status when the run ends, see audit_status.
+
+        Raises:
+            AuditRunningError: If another scheduler has sent a heartbeat within `heartbeat_timeout`.
+        """
+        deadline = time.monotonic() + duration if duration is not None else None
+        get_audit_state()
+        # Claim the audit in one conditional UPDATE, so two schedulers starting together cannot both win
+        now = datetime.now(timezone.utc)
+        claimed = db.session.execute(
+            sa.update(FixityAuditState)
+            .where(FixityAuditState.id == AUDIT_STATE_ID)
+            .where(sa.or_(FixityAuditState.pid.is_(None), FixityAuditState.pid == os.getpid(),
+                          FixityAuditState.heartbeat_at.is_(None),
+                          FixityAuditState.heartbeat_at < now - timedelta(seconds=self.heartbeat_timeout)))
+            .values(pid=os.getpid(), started_at=now, heartbeat_at=now, files_verified=0, bytes_verified=0,
+                    failures=0, active_seconds=0.0)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            state = get_audit_state()
+            raise AuditRunningError(f"A fixity audit is already running in process {state.pid}, "
+                                    f"last heartbeat at {state.heartbeat_at}")
+
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                state = get_audit_state()
+                if not state.paused and self.run_batch():
+                    continue
+                if until_idle:
+                    break
+                state.heartbeat_at = datetime.now(timezone.utc)
+                db.session.commit()
+                wait = self.poll_interval
+                if deadline is not None:
+                    wait = min(wait, max(0.0, deadline - time.monotonic()))
+                self._sleep(wait)
+        finally:
+            db.session.rollback()
+            state = get_audit_state()
+            state.pid = None
+            db.session.commit()
+        return audit_status(self.cycle)
@@ -1,9 +1,18 @@
 import os
-from flask import Blueprint
+from datetime import timedelta
+from fnmatch import fnmatch
+from flask import Blueprint, current_app
 import click
+from lxml import etree
+from app.main.utils import bytes_to_human_readable
+from app.preservation.audit import AuditRunningError, FixityAuditScheduler, audit_status, set_audit_paused
+from app.preservation.fixity import FIXITY_OK, record_fixity, verify_fixity as verify_fixity_records
+from app.preservation.tools.fixity.checksums import ALGORITHMS
 from app.preservation.tools.indentifiers.fileformat import FormatIdentifier
-from app.preservation.tools.validators.xmlval import validate_xml
-from app.preservation.tools.validators.csvval import validate_csv
+from app.preservation.tools.indentifiers.batch import identify_tree, iter_files, OUTPUT_FORMATS
+from app.preservation.tools.transformers.bulk import apply_plan, plan_renames, undo_renames
+from app.preservation.tools.validators.xmlval import validate_xml, validate_xml_files, validate_xml_streaming
+from app.preservation.tools.validators.csvval import CSVStats, iter_csv_errors
 from app.preservation.tools.validators.fileformat import validate_file_format
 from app.preservation.tools.validators.filename import validate_filename
 
@@ -19,17 +28,24 @@ def preservation():
 @click.argument('column_number', type=int)
 @click.option('--delimiter', default=',', help='CSV delimiter (default is comma).')
 @click.option('--encoding', default=None, help='File encoding (default is auto-detect).')
-def validate_csv_command(csv_file, column_number, delimiter, encoding):
+@click.option('--max-errors', type=int, default=100, help='Stop after this many errors, 0 for no limit (default is 100).')
+@click.option('--workers', type=int, default=1, help='Number of worker processes for large files (default is 1).')
+def validate_csv_command(csv_file, column_number, delimiter, encoding, max_errors, workers):
     """Validate a CSV file for the correct number of columns."""
     if not os.path.exists(csv_file):
         raise click.BadParameter(f"CSV file {csv_file} does not exist.")
 
-    errors = validate_csv(csv_file, column_number, delimiter, encoding)
+    stats = CSVStats()
+    for error in iter_csv_errors(csv_file, column_number, delimiter, encoding, max_errors=max_errors or None,
+                                 workers=workers, stats=stats):
+        click.echo(str(error))
 
-    if errors:
-        click.echo(f"CSV validation failed with {len(errors)} error(s):")
-        for error in errors:
-            click.echo(error)
+    counts = ', '.join(f"{count} with {columns}" for columns, count in sorted(stats.column_counts.items()))
+    click.echo(f"Read {stats.records} record(s) on {stats.lines} line(s), columns: {counts or 'none'}.")
+    if stats.truncated:
+        click.echo(f"CSV validation stopped after {stats.errors} error(s).")
+    elif stats.errors:
+        click.echo(f"CSV validation failed with {stats.errors} error(s).")
     else:
         click.echo("CSV validation successful!")
 
@@ -39,14 +55,19 @@ def validate_csv_command(csv_file, column_number, delimiter, encoding):
 @click.argument('filename')
 @click.option('--use-pronom', default=True, help='Use PRONOM formats for identification')
 @click.option('--use-extension', default=True, help='Use extension-based formats for identification')
-def identify_format(filename, use_pronom, use_extension):
+@click.option('--cache', 'cache_path', envvar='FORMAT_IDENTIFICATION_CACHE', default=None,
+              help='SQLite file caching results of unchanged files.')
+@click.option('--containers', is_flag=True, help='Identify ZIP and OLE2 based formats such as DOCX and XLS.')
+def identify_format(filename, use_pronom, use_extension, cache_path, containers):
     """Identify the format of a given file using FIDO"""
     if not os.path.exists(filename):
         raise click.BadParameter(f"File {filename} does not exist.")
 
     identifier = FormatIdentifier(
         use_fido_pronom_formats=use_pronom,
-        use_fido_extension_formats=use_extension
+        use_fido_extension_formats=use_extension,
+        cache_path=cache_path,
+        identify_containers=containers
     )
 
     try:
@@ -62,18 +83,166 @@ def identify_format(filename, use_pronom, use_extension):
         raise click.ClickException(f"Error identifying file format: {str(e)}")
 
 
+@preservation.command()
+@click.argument('root')
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--format', 'output_format', type=click.Choice(list(OUTPUT_FORMATS)), default='csv',
+              help='Output format (default is csv).')
+@click.option('--workers', type=int, default=None, help='Number of worker processes (default is the CPU count).')
+@click.option('--batch-size', type=int, default=256, help='Files sent to a worker per task.')
+@click.option('--use-pronom', default=True, help='Use PRONOM formats for identification')
+@click.option('--use-extension', default=True, help='Use extension-based formats for identification')
+@click.option('--cache', 'cache_path', envvar='FORMAT_IDENTIFICATION_CACHE', default=None,
+              help='SQLite file caching results of unchanged files.')
+@click.option('--hash-content', is_flag=True, help='Also match cached results by content hash.')
+@click.option('--containers', is_flag=True, help='Identify ZIP and OLE2 based formats such as DOCX and XLS.')
+def identify_formats(root, output, output_format, workers, batch_size, use_pronom, use_extension, cache_path,
+                     hash_content, containers):
+    """Identify the format of every file below ROOT and write the results to OUTPUT ('-' for stdout)."""
+    if not os.path.exists(root):
+        raise click.BadParameter(f"Path {root} does not exist.")
+
+    results = identify_tree(root, workers=workers, batch_size=batch_size,
+                            use_fido_pronom_formats=use_pronom, use_fido_extension_formats=use_extension,
+                            cache_path=cache_path, hash_content=hash_content, identify_containers=containers)
+    count = OUTPUT_FORMATS[output_format](results, output)
+    click.echo(f"Identified {count} file(s).", err=True)
+
+
+@preservation.command('record-fixity')
+@click.argument('root')
+@click.option('--workers', type=int, default=None, help='Number of hashing threads (default is the CPU count).')
+def record_fixity_command(root, workers):
+    """Compute and store the MD5, SHA-1, SHA-256 and SHA-512 checksums of every file below ROOT."""
+    if not os.path.exists(root):
+        raise click.BadParameter(f"Path {root} does not exist.")
+
+    count = failed = 0
+    for result in record_fixity(iter_files(root), workers=workers):
+        count += 1
+        if result['error']:
+            failed += 1
+            click.echo(f"{result['path']}: {result['error']}", err=True)
+    click.echo(f"Recorded the checksums of {count - failed} file(s), {failed} failed.")
+
+
+@preservation.command()
+@click.option('--limit', type=int, default=None, help='Maximum number of files to verify (default is all).')
+@click.option('--older-than', type=float, default=None,
+              help='Only verify files last verified more than this many days ago.')
+@click.option('--algorithm', 'algorithms', multiple=True, type=click.Choice(ALGORITHMS),
+              help='Recompute only this digest, may be repeated (default is every stored digest).')
+@click.option('--workers', type=int, default=None, help='Number of hashing threads (default is the CPU count).')
+def verify_fixity(limit, older_than, algorithms, workers):
+    """Re-verify stored checksums, least recently verified files first."""
+    results = verify_fixity_records(limit=limit,
+                                    older_than=timedelta(days=older_than) if older_than is not None else None,
+                                    algorithms=algorithms or None, workers=workers)
+    count = failed = 0
+    for result in results:
+        count += 1
+        if result['status'] != FIXITY_OK:
+            failed += 1
+            click.echo(f"{result['status'].upper()}: {result['path']} {result['detail'] or ''}".rstrip())
+    click.echo(f"Verified {count} file(s), {failed} failed.")
+    if failed:
+        raise SystemExit(1)
+
+
+@preservation.group('fixity-audit')
+def fixity_audit():
+    """Throttled background re-verification of stored checksums."""
+    pass
+
+
+def _echo_audit_status(status):
+    click.echo(f"Status: {status['status']}")
+    click.echo(f"Verified: {status['files_verified']} file(s), "
+               f"{bytes_to_human_readable(status['bytes_verified'])}, {status['failures']} failure(s)")
+    click.echo(f"Throughput: {bytes_to_human_readable(int(status['throughput']))}/s")
+    click.echo(f"Backlog: {status['backlog_files']} of {status['total_files']} file(s), "
+               f"{bytes_to_human_readable(status['backlog_bytes'])}")
+
+
+@fixity_audit.command('run')
+@click.option('--bytes-per-second', type=float, default=None,
+              help='Read budget in bytes per second (default is FIXITY_AUDIT_BYTES_PER_SECOND).')
+@click.option('--iops', type=float, default=None, help='Read operations per second (default is FIXITY_AUDIT_IOPS).')
+@click.option('--duration', type=float, default=None, help='Stop after this many seconds (default is never).')
+@click.option('--until-idle', is_flag=True, help='Stop once no files are due for verification.')
+@click.option('--workers', type=int, default=2, help='Number of hashing threads.')
+def fixity_audit_run(bytes_per_second, iops, duration, until_idle, workers):
+    """Re-verify files not verified within the audit cycle, least recently verified first."""
+    config = current_app.config
+    scheduler = FixityAuditScheduler(
+        bytes_per_second=bytes_per_second or config['FIXITY_AUDIT_BYTES_PER_SECOND'],
+        iops=iops or config['FIXITY_AUDIT_IOPS'],
+        cycle=timedelta(days=config['FIXITY_AUDIT_CYCLE_DAYS']),
+        workers=workers
+    )
+    try:
+        status = scheduler.run(duration=duration, until_idle=until_idle)
+    except AuditRunningError as e:
+        raise click.ClickException(e.message)
+    _echo_audit_status(status)
+
+
+@fixity_audit.command('pause')
+def fixity_audit_pause():
+    """Pause the fixity audit after its current batch."""
+    set_audit_paused(True)
+    click.echo("Fixity audit paused.")
+
+
+@fixity_audit.command('resume')
+def fixity_audit_resume():
+    """Resume a paused fixity audit."""
+    set_audit_paused(False)
+    click.echo("Fixity audit resumed.")
+
+
+@fixity_audit.command('status')
+def fixity_audit_status():
+    """Show the throughput and backlog of the fixity audit."""
+    _echo_audit_status(audit_status(timedelta(days=current_app.config['FIXITY_AUDIT_CYCLE_DAYS'])))
+
+
 @preservation.command()
 @click.argument('xml_file')
 @click.argument('xsd_file')
-def validate_xml_command(xml_file, xsd_file):
-    """Validate an XML file against an XSD schema."""
+@click.option('--pattern', default='*.xml', help='Files to validate when XML_FILE is a directory (default is *.xml).')
+@click.option('--workers', type=int, default=None, help='Number of worker processes (default is the CPU count).')
+@click.option('--stream', is_flag=True, help='Validate while parsing, for files too large to load into memory.')
+@click.option('--max-errors', type=int, default=10, help='Errors to report with --stream (default is 10).')
+def validate_xml_command(xml_file, xsd_file, pattern, workers, stream, max_errors):
+    """Validate an XML file, or every XML file below a directory, against an XSD schema."""
     if not os.path.exists(xml_file):
         raise click.BadParameter(f"XML file {xml_file} does not exist.")
 
     if not os.path.exists(xsd_file):
         raise click.BadParameter(f"XSD schema file {xsd_file} does not exist.")
 
-    result, message = validate_xml(xml_file, xsd_file)
+    if os.path.isdir(xml_file):
+        xml_files = (path for path in iter_files(xml_file) if fnmatch(os.path.basename(path), pattern))
+        try:
+            results = validate_xml_files(xml_files, xsd_file, workers=workers)
+            count = invalid = 0
+            for path, result, message in results:
+                count += 1
+                if result:
+                    click.echo(f"VALID: {path}")
+                else:
+                    invalid += 1
+                    click.echo(f"INVALID: {path}: {message}")
+        except (OSError, etree.Error) as e:
+            raise click.ClickException(f"Could not load the schema: {e}")
+        click.echo(f"Validated {count} file(s), {invalid} invalid.")
+        return
+
+    if stream:
+        result, message = validate_xml_streaming(xml_file, xsd_file, max_errors=max_errors)
+    else:
+        result, message = validate_xml(xml_file, xsd_file)
 
     if result:
         click.echo("XML validation successful!")
@@ -110,4 +279,53 @@ def validate_filename_command(filename, pattern):
     if validate_filename(filename, pattern):
         click.echo(f"Filename '{filename}' is valid.")
     else:
-        click.echo(f"Filename '{filename}' is invalid according to the pattern.")
\ No newline at end of file
+        click.echo(f"Filename '{filename}' is invalid according to the pattern.")
+
+
+@preservation.command('normalize-filenames')
+@click.argument('root')
+@click.option('--dry-run', is_flag=True, help='Only report the renames and conflicts.')
+@click.option('--journal', default=None, help='Undo journal to append the renames to (default is ROOT.renames.jsonl).')
+@click.option('--workers', type=int, default=None, help='Number of renaming threads.')
+@click.option('--keep-unicode', is_flag=True, help='Keep non-ASCII characters instead of normalizing them.')
+@click.option('--keep-repeated-extensions', is_flag=True, help='Keep repeated file extensions such as .gz.gz.')
+def normalize_filenames(root, dry_run, journal, workers, keep_unicode, keep_repeated_extensions):
+    """Normalize every file and directory name below ROOT, deepest first, without clobbering any file."""
+    if not os.path.isdir(root):
+        raise click.BadParameter(f"Directory {root} does not exist.")
+
+    plan = plan_renames(root, normalize_unicode=not keep_unicode, repeated_extensions=not keep_repeated_extensions)
+    if dry_run:
+        for line in plan.report():
+            click.echo(line)
+    else:
+        journal = journal or os.path.abspath(root).rstrip(os.sep) + '.renames.jsonl'
+        failed = 0
+        for rename, error in apply_plan(plan, journal, workers):
+            if error:
+                failed += 1
+                click.echo(f"{rename.source}: {error}", err=True)
+        for conflict in plan.conflicts:
+            click.echo(f"CONFLICT ({conflict.reason}): {', '.join(conflict.sources)} -> {conflict.target}", err=True)
+        click.echo(f"Renamed {len(plan.renames) - failed} of {plan.scanned} name(s), undo journal: {journal}")
+    click.echo(f"{len(plan.renames)} rename(s), {len(plan.conflicts)} conflict(s), "
+               f"{len(plan.errors)} unreadable directories.")
+    if plan.conflicts or plan.errors:
+        raise SystemExit(1)
+
+
+@preservation.command('undo-renames')
+@click.argument('journal')
+@click.option('--workers', type=int, default=None, help='Number of renaming threads.')
+def undo_renames_command(journal, workers):
+    """Revert the renames recorded in the undo JOURNAL of normalize-filenames."""
+    if not os.path.exists(journal):
+        raise click.BadParameter(f"Journal {journal} does not exist.")
+
+    count = failed = 0
+    for rename, error in undo_renames(journal, workers):
+        count += 1
+        if error:
+            failed += 1
+            click.echo(f"{rename.source}: {error}", err=True)
+    click.echo(f"Reverted {count - failed} rename(s), {failed} failed.")
@@ -0,0 +1,134 @@
+import os
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+import sqlalchemy as sa
+from app import db
+from app.models import Fixity, PreservationEvent
+from app.preservation.tools.fixity.checksums import ALGORITHMS, compute_checksums_many
+
+# Statuses a fixity record can have after verification
+FIXITY_OK = 'ok'
+FIXITY_MISMATCH = 'mismatch'
+FIXITY_MISSING = 'missing'
+
+# PREMIS event type of a verification
+FIXITY_CHECK_EVENT = 'fixity check'
+
+
+def record_fixity(paths: Iterable[str], workers: Optional[int] = None, batch_size: int = 256) -> Iterator[Dict]:
+    """
+    Compute and store the checksums of files, replacing earlier records of the same paths.
+
+    All algorithms are computed in one read of each file, on a pool of threads. Records are
+    committed once per batch, so an interrupted run keeps what it has stored.
+
+    Args:
+        paths (Iterable[str]): The files to record.
+        workers (int, optional): The number of hashing threads. Defaults to the number of CPUs.
+        batch_size (int, optional): The number of files per commit. Defaults to 256.
+
+    Yields:
+        Dict: The path, size, digests and error (None on success) of each file, in completion order.
+    """
+    paths = (os.path.abspath(path) for path in paths)
+    for batch in iter(lambda: list(islice(paths, batch_size)), []):
+        existing = {record.path: record for record in db.session.scalars(sa.select(Fixity).where(Fixity.path.in_(batch)))}
+        results = []
+        for path, digests, error in compute_checksums_many(batch, ALGORITHMS, workers):
+            result = {'path': path, 'size': None, **dict.fromkeys(ALGORITHMS), 'error': error}
+            if digests is not None:
+                try:
+                    result['size'] = os.stat(path).st_size
+                except OSError as e:
+                    result['error'] = str(e)
+            if result['error'] is None:
+                result.update(digests)
+                record = existing.get(path) or Fixity(path=path)
+                for field in ('size', *ALGORITHMS):
+                    setattr(record, field, result[field])
+                record.status = FIXITY_OK
+                record.verified_at = datetime.now(timezone.utc)
+                db.session.add(record)
+            results.append(result)
+        db.session.commit()
+        yield from results
+
+
+def _verify_record(record: Fixity, digests: Optional[Dict[str, str]], error: Optional[str]) -> Dict:
+    if error is not None:
+        status, detail = FIXITY_MISSING if not os.path.exists(record.path) else FIXITY_MISMATCH, error
+    else:
+        changed = [algorithm for algorithm, digest in digests.items() if getattr(record, algorithm) != digest]
+        status = FIXITY_MISMATCH if changed else FIXITY_OK
+        detail = f"{', '.join(changed)} changed" if changed else None
+    return {'path': record.path, 'size': record.size, 'status': status, 'detail': detail}
+
+
+def verify_fixity(limit: Optional[int] = None, older_than: Optional[timedelta] = None,
+                  algorithms: Optional[Sequence[str]] = None, workers: Optional[int] = None,
+                  batch_size: int = 256, throttle: Optional[Callable[[int], None]] = None) -> Iterator[Dict]:
+    """
+    Re-verify stored checksums, least recently verified first.
+
+    Each run continues where the last one stopped: records are taken in order of their last
+    verification and stamped as they are checked, one commit per batch. Missing files and files
+    whose size changed are reported without reading them. Every failure is recorded as a
+    'fixity check' preservation event of the record.
+
+    Args:
+        limit (int, optional): The maximum number of records to verify. Defaults to all.
+        older_than (timedelta, optional): Only verify records last verified longer ago than this.
+        algorithms (Sequence[str], optional): Recompute only these of the stored digests, such
+            as just sha256 for a faster audit. Defaults to every stored digest.
+        workers (int, optional): The number of hashing threads. Defaults to the number of CPUs.
+        batch_size (int, optional): The number of records per commit. Defaults to 256.
+        throttle (Callable[[int], None], optional): Limits the reads, see Throttle. Defaults to no limit.
+
+    Yields:
+        Dict: The path, stored size, status ('ok', 'mismatch' or 'missing') and a detail message of each record.
+    """
+    query = sa.select(Fixity.id).order_by(Fixity.verified_at, Fixity.id)
+    if older_than is not None:
+        query = query.where(Fixity.verified_at < datetime.now(timezone.utc) - older_than)
+    if limit is not None:
+        query = query.limit(limit)
+    ids = list(db.session.scalars(query))
+
+    for offset in range(0, len(ids), batch_size):
+        records = db.session.scalars(sa.select(Fixity).where(Fixity.id.in_(ids[offset:offset + batch_size]))).all()
+        results: List[Dict] = []
+        to_hash: Dict[str, Fixity] = {}
+        for record in records:
+            try:
+                size = os.stat(record.path).st_size
+            except OSError as e:
+                results.append(_verify_record(record, None, str(e)))
+                continue
+            if size != record.size:
+                results.append({'path': record.path, 'size': record.size, 'status': FIXITY_MISMATCH,
+                                'detail': f'size changed from {record.size} to {size}'})
+            else:
+                to_hash[record.path] = record
+
+        # Hash each file once with every algorithm it has a digest for
+        by_algorithms: Dict[tuple, List[str]] = {}
+        for path, record in to_hash.items():
+            stored = tuple(a for a in record.digests() if algorithms is None or a in algorithms)
+            by_algorithms.setdefault(stored, []).append(path)
+        for stored, paths in by_algorithms.items():
+            for path, digests, error in compute_checksums_many(paths, stored, workers, throttle=throttle):
+                results.append(_verify_record(to_hash[path], digests, error))
+
+        records_by_path = {record.path: record for record in records}
+        now = datetime.now(timezone.utc)
+        for result in results:
+            record = records_by_path[result['path']]
+            record.status = result['status']
+            record.verified_at = now
+            if result['status'] != FIXITY_OK:
+                record.failure_count += 1
+                db.session.add(PreservationEvent(event_type=FIXITY_CHECK_EVENT, outcome='failure', fixity=record,
+                                                 outcome_detail=f"{result['status']}: {result['detail']}"))
+        db.session.commit()
+        yield from results
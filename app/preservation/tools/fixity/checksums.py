@@ -0,0 +1,116 @@
+import hashlib
+import mmap
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+# The algorithms computed on ingest, in the order they are reported
+ALGORITHMS = ('md5', 'sha1', 'sha256', 'sha512')
+
+# Files of at least this size are hashed from a memory map instead of read into a buffer
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+# Large enough that hashlib releases the GIL for most of the time spent on a buffer
+BUFFER_SIZE = 4 * 1024 * 1024
+
+
+def _update(digests: Sequence, data: memoryview) -> None:
+    for digest in digests:
+        digest.update(data)
+
+
+def compute_checksums(path: str, algorithms: Sequence[str] = ALGORITHMS, buffer_size: int = BUFFER_SIZE,
+                      throttle: Optional[Callable[[int], None]] = None) -> Dict[str, str]:
+    """
+    Compute several digests of a file in a single read pass.
+
+    Every block read is fed to all the digests before the next one is read, so the file is
+    read once however many algorithms are requested. Small files are read into one reused
+    buffer, large ones are memory mapped and hashed in `buffer_size` slices without copying.
+
+    Args:
+        path (str): The path of the file.
+        algorithms (Sequence[str], optional): hashlib algorithm names. Defaults to ALGORITHMS.
+        buffer_size (int, optional): The number of bytes hashed at a time. Defaults to 4 MiB.
+        throttle (Callable[[int], None], optional): Called with the number of bytes before each block
+            is read, and with 0 when the file is opened, see Throttle. Defaults to no limit.
+
+    Returns:
+        Dict[str, str]: The hex digest of the file per algorithm.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If an algorithm is not supported by hashlib.
+    """
+    digests = [hashlib.new(algorithm) for algorithm in algorithms]
+    throttle = throttle or (lambda count: None)
+    with open(path, 'rb') as f:
+        throttle(0)
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, 'madvise'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mapped) as view:
+                    for offset in range(0, len(view), buffer_size):
+                        throttle(min(buffer_size, len(view) - offset))
+                        with view[offset:offset + buffer_size] as block:
+                            _update(digests, block)
+        else:
+            buffer = bytearray(min(buffer_size, max(size, 1)))
+            with memoryview(buffer) as view:
+                remaining = size
+                while True:
+                    if remaining > 0:
+                        throttle(min(len(buffer), remaining))
+                    count = f.readinto(buffer)
+                    if not count:
+                        break
+                    remaining -= count
+                    with view[:count] as block:
+                        _update(digests, block)
+    return {algorithm: digest.hexdigest() for algorithm, digest in zip(algorithms, digests)}
+
+
+def _checksum_path(path: str, algorithms: Sequence[str], buffer_size: int,
+                   throttle: Optional[Callable[[int], None]]) -> Tuple[str, Optional[Dict[str, str]], Optional[str]]:
+    try:
+        return path, compute_checksums(path, algorithms, buffer_size, throttle), None
+    except OSError as e:
+        return path, None, str(e)
+
+
+def compute_checksums_many(paths: Iterable[str], algorithms: Sequence[str] = ALGORITHMS, workers: Optional[int] = None,
+                           buffer_size: int = BUFFER_SIZE, throttle: Optional[Callable[[int], None]] = None
+                           ) -> Iterator[Tuple[str, Optional[Dict[str, str]], Optional[str]]]:
+    """
+    Compute the digests of many files on a pool of threads.
+
+    hashlib and file reads release the GIL, so threads hash several files at once without the
+    cost of sending data to other processes. At most two files per thread are in flight, so
+    memory stays flat however many paths are given. Results are yielded as the files complete,
+    which is not necessarily the order of `paths`.
+
+    Args:
+        paths (Iterable[str]): The files to hash.
+        algorithms (Sequence[str], optional): hashlib algorithm names. Defaults to ALGORITHMS.
+        workers (int, optional): The number of threads. Defaults to the number of CPUs.
+        buffer_size (int, optional): The number of bytes hashed at a time. Defaults to 4 MiB.
+        throttle (Callable[[int], None], optional): Shared by all threads, see compute_checksums.
+
+    Yields:
+        Tuple[str, Optional[Dict[str, str]], Optional[str]]: The path, its digests per algorithm and
+        None, or the path, None and the error if the file could not be read.
+    """
+    workers = workers or os.cpu_count() or 1
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_checksum_path, path, algorithms, buffer_size, throttle)
+                   for path in islice(paths, workers * 2)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+            pending |= {executor.submit(_checksum_path, path, algorithms, buffer_size, throttle)
+                        for path in islice(paths, len(done))}
@@ -0,0 +1,38 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class Throttle:
+    """
+    Keep reads under a bytes per second and an operations per second budget.
+
+    Call it with the size of a read before doing it, every call counts as one operation. The
+    call sleeps until both budgets allow the read. Budget left unused accrues for up to
+    `burst` seconds, so short pauses between files do not lower the average rate. One
+    instance can be shared by any number of threads, the budget is for all of them together.
+    """
+
+    def __init__(self, bytes_per_second: Optional[float] = None, iops: Optional[float] = None, burst: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep) -> None:
+        self.bytes_per_second = bytes_per_second
+        self.iops = iops
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        # The time at which the budget spent so far is paid off, no burst is available at the start
+        self._bytes_at = self._operations_at = clock()
+
+    def __call__(self, count: int) -> None:
+        with self._lock:
+            now = self._clock()
+            wait = 0.0
+            if self.bytes_per_second:
+                self._bytes_at = max(self._bytes_at, now - self.burst) + count / self.bytes_per_second
+                wait = max(wait, self._bytes_at - now)
+            if self.iops:
+                self._operations_at = max(self._operations_at, now - self.burst) + 1 / self.iops
+                wait = max(wait, self._operations_at - now)
+        if wait > 0:
+            self._sleep(wait)
@@ -0,0 +1,228 @@
+import csv
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from app.preservation.tools.indentifiers.cache import Fingerprint, IdentificationCache, fingerprint
+from app.preservation.tools.indentifiers.fileformat import FormatIdentifier
+
+RESULT_FIELDS = ('path', 'size', 'format_registry_key', 'format_name', 'format_version', 'elapsed_ms', 'cached',
+                 'error')
+
+# The identifier of a pool worker, loaded once by _init_worker
+_worker_identifier: Optional[FormatIdentifier] = None
+
+
+def iter_files(root: str, follow_symlinks: bool = False) -> Iterator[str]:
+    """
+    Walk a directory tree with os.scandir and yield the path of every regular file.
+
+    Directory entries carry their file type, so the walk needs no extra stat call per file.
+    Directories that cannot be read are skipped.
+
+    Args:
+        root (str): The directory to walk. A path to a single file yields that file.
+        follow_symlinks (bool, optional): Whether to follow symbolic links. Defaults to False.
+
+    Yields:
+        str: The path of each file below `root`.
+    """
+    if not os.path.isdir(root):
+        yield root
+        return
+
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=follow_symlinks):
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def identify_path(identifier: FormatIdentifier, path: str) -> Dict:
+    """
+    Identify one file and return the result as a row of RESULT_FIELDS.
+
+    Errors are recorded in the `error` field instead of being raised, so a single unreadable
+    file does not abort a batch.
+
+    Args:
+        identifier (FormatIdentifier): The identifier to use.
+        path (str): The path of the file.
+
+    Returns:
+        Dict: The identification result including the time taken in milliseconds.
+    """
+    start = perf_counter()
+    row = dict.fromkeys(RESULT_FIELDS)
+    row['path'] = path
+    row['cached'] = False
+    try:
+        row['size'] = os.stat(path).st_size
+        row['format_name'], row['format_version'], row['format_registry_key'] = identifier.identify_file_format(path)
+    except Exception as e:
+        row['error'] = str(e)
+    row['elapsed_ms'] = round((perf_counter() - start) * 1000, 3)
+    return row
+
+
+def _init_worker(use_fido_pronom_formats: bool, use_fido_extension_formats: bool,
+                 identify_containers: bool) -> None:
+    global _worker_identifier
+    _worker_identifier = FormatIdentifier(use_fido_pronom_formats, use_fido_extension_formats,
+                                          allow_unknown_file_types=True, identify_containers=identify_containers)
+    # Load the signatures now rather than on the first file
+    _worker_identifier.fido
+
+
+def _identify_batch(paths: List[str]) -> List[Dict]:
+    return [identify_path(_worker_identifier, path) for path in paths]
+
+
+def _partition(paths: Iterator[str], batch_size: int,
+               cache: Optional[IdentificationCache]) -> Iterator[Tuple[List[Dict], List[str], List[Fingerprint]]]:
+    """Split the paths into batches of rows answered by the cache and paths that still need identifying."""
+    for batch in iter(lambda: list(islice(paths, batch_size)), []):
+        if cache is None:
+            yield [], batch, []
+            continue
+
+        rows, misses, fingerprints = [], [], []
+        for path in batch:
+            start = perf_counter()
+            try:
+                result, fp = cache.get(fingerprint(path))
+            except OSError:
+                # Let identify_path report the error
+                misses.append(path)
+                fingerprints.append(None)
+                continue
+            if result is None:
+                misses.append(path)
+                fingerprints.append(fp)
+                continue
+            row = dict(zip(RESULT_FIELDS, (path, fp.size, result[2], result[0], result[1])))
+            row.update(elapsed_ms=round((perf_counter() - start) * 1000, 3), cached=True, error=None)
+            rows.append(row)
+        yield rows, misses, fingerprints
+
+
+def _store(cache: Optional[IdentificationCache], rows: List[Dict], fingerprints: List[Fingerprint]) -> None:
+    if cache is None:
+        return
+    cache.set_many(
+        (fp, (row['format_name'], row['format_version'], row['format_registry_key']))
+        for row, fp in zip(rows, fingerprints)
+        if fp is not None and row['error'] is None
+    )
+
+
+def identify_tree(root: str, workers: Optional[int] = None, batch_size: int = 256,
+                  use_fido_pronom_formats: bool = True, use_fido_extension_formats: bool = True,
+                  cache_path: Optional[str] = None, hash_content: bool = False,
+                  identify_containers: bool = False) -> Iterator[Dict]:
+    """
+    Identify the format of every file below a directory.
+
+    The files are sent to a pool of worker processes in batches of `batch_size`. Each worker
+    loads the Fido signatures once when it starts. At most two batches per worker are in flight,
+    so memory stays flat however large the tree is. Results are yielded as the batches complete,
+    which is not necessarily the order of the walk.
+
+    With a cache, unchanged files are answered from it in this process and only the misses
+    are sent to the workers. New results are written back in one transaction per batch.
+
+    Args:
+        root (str): The directory (or single file) to identify.
+        workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+            With 1 the files are identified in the current process.
+        batch_size (int, optional): The number of files per task sent to a worker. Defaults to 256.
+        use_fido_pronom_formats (bool, optional): Whether to use the PRONOM signatures. Defaults to True.
+        use_fido_extension_formats (bool, optional): Whether to use the extension signatures. Defaults to True.
+        cache_path (str, optional): A SQLite file with an IdentificationCache. Defaults to no cache.
+        hash_content (bool, optional): Whether the cache also matches files by content hash. Defaults to False.
+        identify_containers (bool, optional): Whether ZIP and OLE2 files are matched against the
+            container signatures. Defaults to False.
+
+    Yields:
+        Dict: One result per file, see identify_path.
+    """
+    identifier = FormatIdentifier(use_fido_pronom_formats, use_fido_extension_formats,
+                                  allow_unknown_file_types=True, identify_containers=identify_containers)
+    cache = IdentificationCache(cache_path, identifier.signature_version, hash_content) if cache_path else None
+    batches = _partition(iter_files(root), batch_size, cache)
+    workers = workers or os.cpu_count() or 1
+
+    try:
+        if workers == 1:
+            for rows, misses, fingerprints in batches:
+                yield from rows
+                rows = [identify_path(identifier, path) for path in misses]
+                _store(cache, rows, fingerprints)
+                yield from rows
+        else:
+            yield from _identify_in_pool(batches, workers, cache,
+                                         (use_fido_pronom_formats, use_fido_extension_formats, identify_containers))
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def _identify_in_pool(batches: Iterator[Tuple[List[Dict], List[str], List[Fingerprint]]], workers: int,
+                      cache: Optional[IdentificationCache], initargs: Tuple) -> Iterator[Dict]:
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs)
+    pending = {}
+
+    def completed():
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            rows = future.result()
+            _store(cache, rows, pending.pop(future))
+            yield from rows
+
+    try:
+        for rows, misses, fingerprints in batches:
+            yield from rows
+            if misses:
+                pending[executor.submit(_identify_batch, misses)] = fingerprints
+            if len(pending) >= workers * 2:
+                yield from completed()
+
+        while pending:
+            yield from completed()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def write_csv(results: Iterable[Dict], output: TextIO) -> int:
+    """Write identification results as CSV with a header row and return the number of rows."""
+    writer = csv.DictWriter(output, fieldnames=RESULT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for count, row in enumerate(results, 1):
+        writer.writerow(row)
+    return count
+
+
+def write_ndjson(results: Iterable[Dict], output: TextIO) -> int:
+    """Write identification results as newline delimited JSON and return the number of rows."""
+    count = 0
+    for count, row in enumerate(results, 1):
+        output.write(json.dumps(row, ensure_ascii=False) + '\n')
+    return count
+
+
+OUTPUT_FORMATS = {
+    'csv': write_csv,
+    'ndjson': write_ndjson,
+}
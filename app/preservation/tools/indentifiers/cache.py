@@ -0,0 +1,149 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+# format name, format version, format registry key
+Identification = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+class Fingerprint(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    sha256: Optional[str] = None
+
+
+def fingerprint(path: str, stat: Optional[os.stat_result] = None) -> Fingerprint:
+    """
+    Return the fingerprint of a file from its stat information.
+
+    Args:
+        path (str): The path of the file.
+        stat (os.stat_result, optional): The stat of the file if already known, such as from os.DirEntry.stat().
+
+    Returns:
+        Fingerprint: The absolute path, size, modification time and inode of the file.
+    """
+    stat = stat or os.stat(path)
+    return Fingerprint(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def file_sha256(path: str, buffer_size: int = 1024 * 1024) -> str:
+    """Return the hex SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(buffer_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IdentificationCache:
+    """
+    A persistent cache of format identification results in a SQLite file.
+
+    A result is reused while the path, size, modification time and inode of the file are
+    unchanged. With `hash_content` a file whose fingerprint changed (for example because a
+    transfer was copied again) is hashed and matched against earlier results with the same
+    content. Hashing reads the whole file, so it only pays off when Fido is slower than a full read.
+
+    The cache is stamped with the signature version of the identifier that filled it. Opening
+    it with a different version empties it, so results from old signatures are never returned.
+
+    Failures are swallowed, a broken or locked cache only turns lookups into misses.
+    """
+
+    def __init__(self, path: str, signature_version: str, hash_content: bool = False) -> None:
+        self.path = path
+        self.signature_version = signature_version
+        self.hash_content = hash_content
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS identifications '
+                               '(path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, '
+                               'inode INTEGER NOT NULL, sha256 TEXT, format_name TEXT, format_version TEXT, '
+                               'format_registry_key TEXT, identified_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_identifications_sha256 ON identifications (sha256)')
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            row = connection.execute("SELECT value FROM meta WHERE key = 'signature_version'").fetchone()
+            if row is None or row[0] != self.signature_version:
+                with connection:
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.execute('DELETE FROM identifications')
+                    connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('signature_version', ?)",
+                                       (self.signature_version,))
+            self._local.connection = connection
+        return connection
+
+    def get(self, fp: Fingerprint) -> Tuple[Optional[Identification], Fingerprint]:
+        """
+        Look up the identification of a file.
+
+        Args:
+            fp (Fingerprint): The fingerprint of the file.
+
+        Returns:
+            Tuple[Optional[Identification], Fingerprint]: The cached result or None on a miss, and the
+            fingerprint, which has its content hash filled in if it had to be computed. Pass it on to
+            set() so the file is not hashed twice.
+        """
+        try:
+            row = self.connection.execute(
+                'SELECT format_name, format_version, format_registry_key FROM identifications '
+                'WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+                (fp.path, fp.size, fp.mtime_ns, fp.inode)).fetchone()
+            if row is None and self.hash_content:
+                fp = fp._replace(sha256=fp.sha256 or file_sha256(fp.path))
+                row = self.connection.execute(
+                    'SELECT format_name, format_version, format_registry_key FROM identifications '
+                    'WHERE sha256 = ? AND size = ? LIMIT 1', (fp.sha256, fp.size)).fetchone()
+                if row is not None:
+                    self.set(fp, tuple(row))
+        except (sqlite3.Error, OSError):
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None, fp
+        self.hits += 1
+        return tuple(row), fp
+
+    def set(self, fp: Fingerprint, result: Identification) -> None:
+        """Store the identification of a file."""
+        self.set_many([(fp, result)])
+
+    def set_many(self, items: Iterable[Tuple[Fingerprint, Identification]]) -> None:
+        """Store the identifications of several files in one transaction."""
+        try:
+            rows = []
+            for fp, result in items:
+                if self.hash_content and fp.sha256 is None:
+                    fp = fp._replace(sha256=file_sha256(fp.path))
+                rows.append((*fp, *result, time.time()))
+            with self.connection:
+                self.connection.execute('BEGIN')
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO identifications (path, size, mtime_ns, inode, sha256, format_name, '
+                    'format_version, format_registry_key, identified_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        except (sqlite3.Error, OSError):
+            pass
+
+    def close(self) -> None:
+        """Close the connection of the current thread."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
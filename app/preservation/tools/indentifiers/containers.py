@@ -0,0 +1,180 @@
+import re
+import sys
+import zipfile
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, List, NamedTuple, Optional, Tuple
+from xml.etree import ElementTree
+import olefile
+from fido.fido import Fido
+from app.preservation.tools.indentifiers.signatures import sre_parse
+
+# Fido's format <container> values, fmt/111 is the OLE2 compound document format
+CONTAINER_TYPES = {'zip': 'ZIP', 'ole': 'OLE2'}
+
+
+class ContainerFile(NamedTuple):
+    path: str
+    # Alternative internal signatures, each a tuple of patterns that must all match
+    signatures: Tuple[Tuple[re.Pattern, ...], ...]
+
+
+class ContainerSignature(NamedTuple):
+    id: str
+    puid: str
+    files: Tuple[ContainerFile, ...]
+
+
+def _gap(subsequence: ElementTree.Element) -> bytes:
+    low = subsequence.get('SubSeqMinOffset') or '0'
+    high = subsequence.get('SubSeqMaxOffset')
+    if high is None:
+        return b'.*?' if low == '0' else b'.{%s,}?' % low.encode()
+    return b'.{%s,%s}' % (low.encode(), high.encode())
+
+
+def byte_sequence_regex(byte_sequence: ElementTree.Element) -> bytes:
+    """
+    Convert a DROID ByteSequence to a regular expression.
+
+    Sequences are converted with Fido's container sequence parser. Unlike Fido the offsets
+    of the subsequences are kept, anchored at the start or end of the file as the reference
+    says. Fragments are not supported and are ignored.
+    """
+    subsequences = sorted(byte_sequence.findall('SubSequence'), key=lambda s: int(s.get('Position', 0)))
+    sequences = [Fido.convert_container_sequence(None, s.findtext('Sequence', ''))[len(b'(?s)'):]
+                 for s in subsequences]
+    reference = byte_sequence.get('Reference')
+    if reference == 'BOFoffset':
+        return b'(?s)\\A' + b''.join(_gap(s) + seq for s, seq in zip(subsequences, sequences))
+    if reference == 'EOFoffset':
+        # Offsets count back from the end, the first subsequence is the one nearest to it
+        return b'(?s)' + b''.join(seq + _gap(s) for s, seq in reversed(list(zip(subsequences, sequences)))) + b'\\Z'
+    parts = [sequences[0]] + [_gap(s) + seq for s, seq in zip(subsequences[1:], sequences[1:])] if sequences else []
+    return b'(?s)' + b''.join(parts)
+
+
+class ContainerSignatureSet:
+    """
+    The PRONOM container signatures, parsed once, matched against ZIP and OLE2 files in place.
+
+    Only the ZIP central directory or the OLE2 directory is read to list the members. The
+    members a signature names are opened without extracting the archive, and only as many
+    bytes as the signatures can reach are read from each.
+    """
+
+    def __init__(self, path: str) -> None:
+        root = ElementTree.parse(path).getroot()
+        puids = {mapping.get('signatureId'): mapping.get('Puid')
+                 for mapping in root.iter('FileFormatMapping')}
+        self.signatures: Dict[str, List[ContainerSignature]] = {'ZIP': [], 'OLE2': []}
+        # The number of bytes to read from a member, None to read it all
+        self.read_limits: Dict[Tuple[str, str], Optional[int]] = {}
+
+        for element in root.iter('ContainerSignature'):
+            container_type = element.get('ContainerType')
+            puid = puids.get(element.get('Id'))
+            if container_type not in self.signatures or puid is None:
+                continue
+            files = []
+            try:
+                for file in element.findall('Files/File'):
+                    path = file.findtext('Path')
+                    signatures = tuple(
+                        tuple(re.compile(byte_sequence_regex(byte_sequence))
+                              for byte_sequence in signature.findall('ByteSequence'))
+                        for signature in file.findall('BinarySignatures/InternalSignatureCollection/InternalSignature')
+                    )
+                    files.append(ContainerFile(path, signatures))
+                    self._extend_read_limit(container_type, path, signatures)
+            except re.error:
+                # Sequences Fido's parser cannot express, such as bitmasks
+                continue
+            self.signatures[container_type].append(ContainerSignature(element.get('Id'), puid, tuple(files)))
+
+    def _extend_read_limit(self, container_type: str, path: str, signatures) -> None:
+        key = (container_type, path)
+        limit = self.read_limits.get(key, 0)
+        for pattern in (pattern for signature in signatures for pattern in signature):
+            if limit is None:
+                break
+            _, high = sre_parse.parse(pattern.pattern).getwidth()
+            anchored = pattern.pattern.startswith(b'(?s)\\A')
+            limit = max(limit, high) if anchored and high < sys.maxsize else None
+        self.read_limits[key] = limit
+
+    def _match(self, container_type: str, members: Dict[str, str], read: Callable[[str, Optional[int]], bytes]) -> List[str]:
+        contents: Dict[str, bytes] = {}
+        puids: List[str] = []
+        for signature in self.signatures[container_type]:
+            if signature.puid in puids:
+                continue
+            for file in signature.files:
+                member = members.get(file.path)
+                if member is None:
+                    break
+                if not file.signatures:
+                    continue
+                if member not in contents:
+                    contents[member] = read(member, self.read_limits[(container_type, file.path)])
+                data = contents[member]
+                if not any(all(pattern.search(data) for pattern in patterns) for patterns in file.signatures):
+                    break
+            else:
+                puids.append(signature.puid)
+        return puids
+
+    def match_zip(self, source: BinaryIO) -> List[str]:
+        """Return the PUIDs of the ZIP container signatures matching a seekable file."""
+        try:
+            with zipfile.ZipFile(source) as archive:
+                members = {name: name for name in archive.namelist()}
+
+                def read(name: str, limit: Optional[int]) -> bytes:
+                    with archive.open(name) as member:
+                        return member.read(-1 if limit is None else limit)
+
+                return self._match('ZIP', members, read)
+        except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError, EOFError, UnicodeDecodeError):
+            return []
+
+    def match_ole2(self, source: BinaryIO) -> List[str]:
+        """Return the PUIDs of the OLE2 container signatures matching a seekable file."""
+        try:
+            with olefile.OleFileIO(source) as ole:
+                members = {}
+                for entry in ole.listdir():
+                    name = '/'.join(entry)
+                    members.setdefault(name, name)
+                    # Stream names may start with a control character, such as \x01CompObj
+                    members.setdefault(name[1:], name)
+
+                def read(name: str, limit: Optional[int]) -> bytes:
+                    with ole.openstream(name) as stream:
+                        return stream.read(-1 if limit is None else limit)
+
+                return self._match('OLE2', members, read)
+        except (OSError, EOFError, ValueError, IndexError):
+            return []
+
+    def match(self, container: str, source: BinaryIO) -> List[str]:
+        """
+        Return the PUIDs of the container signatures matching a seekable file.
+
+        Args:
+            container (str): The container type Fido reports for the file, 'zip' or 'ole'.
+            source (BinaryIO): The file, positioned anywhere, it is read with random access.
+
+        Returns:
+            List[str]: The matching PUIDs in signature file order, empty if none match or the file is damaged.
+        """
+        if container == 'zip':
+            return self.match_zip(source)
+        if container == 'ole':
+            return self.match_ole2(source)
+        return []
+
+
+@lru_cache(maxsize=None)
+def load_container_signatures(path: str) -> ContainerSignatureSet:
+    """Return the container signatures of a file, parsed once per process."""
+    return ContainerSignatureSet(path)
@@ -1,7 +1,64 @@
-from typing import Optional, List, Tuple
+import asyncio
+import io
+import mmap
+import os
+import threading
+from concurrent.futures import Executor
+from functools import lru_cache
+from time import perf_counter
+from typing import BinaryIO, Callable, NamedTuple, Optional, List, Tuple, Union
+import fido as fido_package
+from fido import CONFIG_DIR
 from fido.fido import Fido
 from fido.versions import get_local_versions
 from xml.etree.ElementTree import Element
+from app.preservation.tools.indentifiers.cache import IdentificationCache, fingerprint
+from app.preservation.tools.indentifiers.containers import ContainerSignatureSet, load_container_signatures
+from app.preservation.tools.indentifiers.signatures import CompiledFido, load_signature_set
+
+UNKNOWN_FORMAT_NAME = 'Unknown File Format'
+
+# Local files at least this large are identified through mmap, so only the pages of the
+# head and tail windows are ever read from disk
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+class FormatMatch(NamedTuple):
+    format_registry_key: Optional[str]
+    format_name: Optional[str]
+    format_version: Optional[str]
+    mimetype: Optional[str]
+    signature_name: Optional[str]
+
+    @classmethod
+    def from_fido(cls, match: Tuple[Element, str]) -> 'FormatMatch':
+        f, signature_name = match
+        fields = (getattr(f.find(tag), 'text', None) for tag in ('puid', 'name', 'version', 'mime'))
+        return cls(*fields, signature_name)
+
+
+class IdentificationResult(NamedTuple):
+    """
+    The outcome of identifying one file.
+
+    Attributes:
+        filename (str): The name of the identified file or stream, None for an anonymous stream.
+        size (int): The size in bytes.
+        matches (Tuple[FormatMatch, ...]): All matches Fido kept, the best one last.
+        match_type (str): 'container', 'signature', 'extension' or 'fail' if nothing matched.
+        elapsed (float): The time taken in seconds.
+    """
+    filename: Optional[str]
+    size: int
+    matches: Tuple[FormatMatch, ...]
+    match_type: str
+    elapsed: float
+
+    @property
+    def best(self) -> Optional[FormatMatch]:
+        """The match Fido ranks highest, or None if the format is unknown."""
+        return self.matches[-1] if self.matches else None
+
 
 class FormatIdentifier:
     _fido: Optional[Fido] = None
@@ -10,34 +67,67 @@ class FormatIdentifier:
     format_registry_key: Optional[str] = None
     use_fido_pronom_formats: bool
     use_fido_extension_formats: bool
+    allow_unknown_file_types: bool
+    identify_containers: bool
+    cache: Optional[IdentificationCache] = None
 
-    def __init__(self, use_fido_pronom_formats: bool = True, use_fido_extension_formats: bool = True) -> None:
+    def __init__(self, use_fido_pronom_formats: bool = True, use_fido_extension_formats: bool = True,
+                 allow_unknown_file_types: bool = False, cache_path: Optional[str] = None,
+                 hash_content: bool = False, identify_containers: bool = False) -> None:
         self.use_fido_pronom_formats = use_fido_pronom_formats
         self.use_fido_extension_formats = use_fido_extension_formats
+        self.allow_unknown_file_types = allow_unknown_file_types
+        self.identify_containers = identify_containers
+        self._fido_lock = threading.Lock()
+        if cache_path:
+            self.cache = IdentificationCache(cache_path, self.signature_version, hash_content)
+
+    @property
+    def signature_version(self) -> str:
+        """A stamp of the Fido release and signature files in use, which changes whenever results could."""
+        versions = get_local_versions()
+        parts = [f'fido-{fido_package.__version__}']
+        if self.use_fido_pronom_formats:
+            parts.append(versions.pronom_signature)
+        if self.use_fido_extension_formats:
+            parts.append(versions.fido_extension_signature)
+        if self.identify_containers:
+            parts.append(versions.pronom_container_signature)
+        return ':'.join(parts)
+
+    @property
+    def container_signatures(self) -> ContainerSignatureSet:
+        """The PRONOM container signatures, loaded once per process."""
+        return load_container_signatures(os.path.join(CONFIG_DIR, get_local_versions().pronom_container_signature))
 
     @property
     def fido(self) -> Fido:
         if self._fido is None:
-            format_files: List[str] = []
-            if self.use_fido_pronom_formats or self.use_fido_extension_formats:
-                versions = get_local_versions()
-                if self.use_fido_pronom_formats:
-                    format_files.append(versions.pronom_signature)
-                if self.use_fido_extension_formats:
-                    format_files.append(versions.fido_extension_signature)
-
-            self._fido = Fido(
-                handle_matches=self.handle_matches,
-                nocontainer=True,
-                format_files=format_files,
-            )
-
+            with self._fido_lock:
+                if self._fido is None:
+                    self._fido = self._load_fido()
         return self._fido
 
+    def _load_fido(self) -> CompiledFido:
+        format_files: List[str] = []
+        if self.use_fido_pronom_formats or self.use_fido_extension_formats:
+            versions = get_local_versions()
+            if self.use_fido_pronom_formats:
+                format_files.append(versions.pronom_signature)
+            if self.use_fido_extension_formats:
+                format_files.append(versions.fido_extension_signature)
+
+        # The signatures come from an on-disk cache, so only the first run parses the XML files
+        return CompiledFido(
+            load_signature_set(format_files),
+            handle_matches=self.handle_matches,
+            nocontainer=True,
+        )
+
     def handle_matches(self, fullname: str, matches: List[Tuple[Element, str]], delta_t: float, matchtype: str = '') -> None:
         if len(matches) == 0:
             if self.allow_unknown_file_types:
-                self.format_name = 'Unknown File Format'
+                self.format_name = UNKNOWN_FORMAT_NAME
                 self.format_version = None
                 self.format_registry_key = None
                 return
@@ -61,6 +151,138 @@ class FormatIdentifier:
         except AttributeError:
             self.format_registry_key = None
 
+    def identify(self, filename: str) -> IdentificationResult:
+        """
+        Identifies the format of the given file and returns all matches.
+
+        Unlike identify_file_format this keeps no state on the identifier, so one instance
+        (and its loaded signatures) can serve any number of threads at once. Only the head
+        and tail windows the signatures look at are read, large files through mmap.
+
+        With identify_containers, ZIP and OLE2 files are also matched against the PRONOM
+        container signatures (DOCX, XLSX, ODF, MSG and so on) by reading the archive
+        directory and the few members the signatures name, without extracting anything.
+
+        Args:
+            filename (str): The path to the file whose format is to be identified.
+
+        Returns:
+            IdentificationResult: The matches, the kind of match and the time taken.
+
+        Raises:
+            OSError: If the file cannot be read.
+        """
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+                try:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        return self.identify_bytes(mapped, filename)
+                except (OSError, ValueError):
+                    # Not mappable (a pipe or special file), read it as a stream
+                    f.seek(0)
+            return self.identify_stream(f, filename)
+
+    def identify_stream(self, stream: BinaryIO, filename: Optional[str] = None) -> IdentificationResult:
+        """
+        Identifies the format of a binary file-like object from its current position, without a temporary file.
+
+        A seekable stream (an open file, a ZIP or TAR member, an uploaded file) is only read
+        in the head and tail windows. Other streams are read to the end keeping only the last
+        window. The stream is not closed.
+
+        Args:
+            stream (BinaryIO): The stream to identify.
+            filename (str, optional): A name to match by extension if no signature matches.
+
+        Returns:
+            IdentificationResult: See identify.
+        """
+        start = perf_counter()
+        bufsize = self.fido.bufsize
+        seekable = getattr(stream, 'seekable', lambda: False)()
+        origin = stream.tell() if seekable else None
+        bofbuffer = _read_window(stream, bufsize)
+        size = len(bofbuffer)
+        if size < bufsize:
+            eofbuffer = bofbuffer
+        elif seekable:
+            offset = stream.tell()
+            end = stream.seek(0, os.SEEK_END)
+            size += end - offset
+            stream.seek(max(offset, end - bufsize))
+            eofbuffer = (bofbuffer + _read_window(stream, bufsize))[-bufsize:]
+        else:
+            tail = bytearray(bofbuffer)
+            for chunk in iter(lambda: stream.read(bufsize), b''):
+                size += len(chunk)
+                tail += chunk
+                del tail[:-bufsize]
+            eofbuffer = bytes(tail)
+        # Containers are read with absolute offsets, so only a stream holding nothing else qualifies
+        source = (lambda: stream) if origin == 0 else None
+        return self._identify_buffers(filename, size, bofbuffer, eofbuffer, start, source)
+
+    def identify_bytes(self, data: Union[bytes, bytearray, memoryview, mmap.mmap],
+                       filename: Optional[str] = None) -> IdentificationResult:
+        """
+        Identifies the format of an in-memory or memory-mapped buffer.
+
+        Only the head and tail windows are copied, so an mmap of a large file is not read in full.
+
+        Args:
+            data (Union[bytes, bytearray, memoryview, mmap.mmap]): The content to identify.
+            filename (str, optional): A name to match by extension if no signature matches.
+
+        Returns:
+            IdentificationResult: See identify.
+        """
+        start = perf_counter()
+        bufsize = self.fido.bufsize
+        with memoryview(data) as view:
+            size = view.nbytes
+            bofbuffer = view[:bufsize].tobytes()
+            eofbuffer = bofbuffer if size <= bufsize else view[size - bufsize:].tobytes()
+        # An mmap is file-like already, anything else is only wrapped if it turns out to be a container
+        source = (lambda: data) if isinstance(data, mmap.mmap) else (lambda: io.BytesIO(data))
+        return self._identify_buffers(filename, size, bofbuffer, eofbuffer, start, source)
+
+    def _identify_buffers(self, filename: Optional[str], size: int, bofbuffer: bytes, eofbuffer: bytes,
+                          start: float, source: Optional[Callable[[], BinaryIO]] = None) -> IdentificationResult:
+        fido = self.fido
+        matches = fido.signature_set.match(bofbuffer, eofbuffer)
+        match_type = 'signature'
+        container = fido.container_type(matches) if self.identify_containers and source is not None else None
+        if container:
+            puids = self.container_signatures.match(container, source())
+            container_matches = [(fido.puid_format_map[puid], fido.puid_format_map[puid].findtext('name'))
+                                 for puid in puids if puid in fido.puid_format_map]
+            if container_matches:
+                matches = container_matches
+                match_type = 'container'
+        # Empty files are matched by extension only, the RTF signature matches nothing at all
+        if (not matches or size == 0) and filename:
+            matches = fido.match_extensions(filename)
+            match_type = 'extension'
+        if not matches or size == 0 and not filename:
+            matches = []
+            match_type = 'fail'
+
+        return IdentificationResult(filename, size, tuple(FormatMatch.from_fido(match) for match in matches),
+                                    match_type, perf_counter() - start)
+
+    async def identify_async(self, filename: str, executor: Optional[Executor] = None) -> IdentificationResult:
+        """
+        Identifies the format of the given file without blocking the event loop.
+
+        Args:
+            filename (str): The path to the file whose format is to be identified.
+            executor (Executor, optional): The executor to run in. Defaults to the loop's default thread pool.
+
+        Returns:
+            IdentificationResult: See identify.
+        """
+        return await asyncio.get_running_loop().run_in_executor(executor, self.identify, filename)
+
     def identify_file_format(self, filename: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
         """
         Identifies the format of the given file using the fido library.
@@ -74,7 +296,57 @@ class FormatIdentifier:
                 - The format name (str or None) if identified, or None if unknown.
                 - The format version (str or None) if applicable, or None if unavailable.
                 - The format registry key (str or None), typically the PRONOM PUID, or None if not found.
+
+        Raises:
+            ValueError: If the format is unknown and allow_unknown_file_types is not set.
+
+        If the identifier has a cache, a stored result for the unchanged file is returned
+        without running Fido. The result is also kept in the format_* attributes of the identifier,
+        use identify() when the instance is shared between threads.
         """
 
-        self.fido.identify_file(filename)
-        return self.format_name, self.format_version, self.format_registry_key
+        fp = None
+        result = None
+        if self.cache is not None:
+            result, fp = self.cache.get(fingerprint(filename))
+
+        if result is None:
+            best = self.identify(filename).best
+            if best is None:
+                result = UNKNOWN_FORMAT_NAME, None, None
+            else:
+                result = best.format_name, best.format_version, best.format_registry_key
+            if fp is not None:
+                self.cache.set(fp, result)
+
+        if result[0] == UNKNOWN_FORMAT_NAME and result[2] is None and not self.allow_unknown_file_types:
+            raise ValueError(f"No matches for {filename}")
+
+        self.format_name, self.format_version, self.format_registry_key = result
+        return result
+
+@lru_cache(maxsize=None)
+def get_format_identifier(use_fido_pronom_formats: bool = True, use_fido_extension_formats: bool = True) -> FormatIdentifier:
+    """
+    Returns a process-wide FormatIdentifier so the Fido signatures are only loaded once.
+
+    Args:
+        use_fido_pronom_formats (bool): Whether to load the PRONOM signatures.
+        use_fido_extension_formats (bool): Whether to load the Fido extension signatures.
+
+    Returns:
+        FormatIdentifier: The shared identifier for the given signature selection.
+    """
+    return FormatIdentifier(use_fido_pronom_formats, use_fido_extension_formats)
+
+
+def _read_window(stream: BinaryIO, size: int) -> bytes:
+    """Read up to `size` bytes, fewer only at the end of the stream."""
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
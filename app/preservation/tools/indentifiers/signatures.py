@@ -0,0 +1,300 @@
+import hashlib
+import os
+import pickle
+import re
+import sys
+import tempfile
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+from xml.etree.ElementTree import Element, SubElement
+import fido as fido_package
+from fido import CONFIG_DIR
+from fido.fido import Fido
+
+# Bump when the pickled layout changes
+SIGNATURE_CACHE_FORMAT = 1
+
+# Format children kept from the signature files, the ones read by Fido and FormatIdentifier
+FORMAT_FIELDS = ('puid', 'name', 'version', 'mime', 'container')
+
+_ESCAPED_LITERALS = {ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('f'): b'\f', ord('v'): b'\v'}
+_QUANTIFIER = re.compile(rb'\{\d*(,\d*)?\}')
+
+
+def literal_hints(regex: bytes) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """
+    Find literal byte strings a buffer must contain for a Fido signature regex to match.
+
+    Only the top level of the expression is inspected, groups, classes and quantified
+    characters end a literal run. Expressions with a top-level alternation or inline flags
+    other than (?s) give no hints.
+
+    Args:
+        regex (bytes): A regular expression from a Fido signature file.
+
+    Returns:
+        Tuple[Optional[bytes], Optional[bytes]]: The literal the buffer must start with if the
+        expression is anchored with \\A, and the longest literal it must contain anywhere.
+    """
+    if regex.startswith(b'(?s)'):
+        regex = regex[4:]
+    if b'(?' in regex.replace(b'(?:', b''):
+        return None, None
+
+    anchored = regex.startswith(b'\\A')
+    i = 2 if anchored else 0
+    runs: List[bytearray] = [bytearray()]
+    depth = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == ord('\\'):
+            following = regex[i + 1:i + 2]
+            if following == b'x':
+                literal, i = bytes([int(regex[i + 2:i + 4], 16)]), i + 4
+            elif following and following[0] in _ESCAPED_LITERALS:
+                literal, i = _ESCAPED_LITERALS[following[0]], i + 2
+            elif following and not following.isalnum():
+                literal, i = following, i + 2
+            else:
+                # \A, \Z, \d, \b and friends
+                literal, i = None, i + 2
+        elif char == ord('['):
+            # Skip the class, a ] directly after [ or [^ is part of it
+            i += 1
+            if regex[i:i + 1] == b'^':
+                i += 1
+            if regex[i:i + 1] == b']':
+                i += 1
+            while regex[i] != ord(']'):
+                i += 2 if regex[i] == ord('\\') else 1
+            literal, i = None, i + 1
+        elif char == ord('('):
+            depth, literal, i = depth + 1, None, i + 1
+        elif char == ord(')'):
+            depth, literal, i = depth - 1, None, i + 1
+        elif char == ord('|'):
+            if depth == 0:
+                return None, None
+            literal, i = None, i + 1
+        elif char in b'.^$':
+            literal, i = None, i + 1
+        elif char in b'*+?':
+            # A quantifier makes the character before it optional or repeated
+            if runs[-1]:
+                runs[-1].pop()
+            runs.append(bytearray())
+            i += 1
+            continue
+        elif char == ord('{') and _QUANTIFIER.match(regex, i):
+            if runs[-1]:
+                runs[-1].pop()
+            runs.append(bytearray())
+            i = _QUANTIFIER.match(regex, i).end()
+            continue
+        else:
+            literal, i = bytes([char]), i + 1
+
+        if literal is not None and depth == 0:
+            runs[-1].extend(literal)
+        else:
+            runs.append(bytearray())
+
+    # The first run only holds literals directly after the anchor, anything else starts a new run
+    prefix = bytes(runs[0]) if anchored and runs[0] else None
+    required = bytes(max(runs, key=len)) or None
+    return prefix, required
+
+
+def tail_window(regex: bytes) -> Optional[int]:
+    """
+    Return the longest possible match of a regex anchored at the end with \\Z.
+
+    A search only has to start that many bytes before the end of the buffer. Expressions that
+    are not end-anchored, also anchored at the start or of unbounded width give None.
+    """
+    if not regex.endswith(b'\\Z') or b'\\A' in regex:
+        return None
+    try:
+        _, high = sre_parse.parse(regex).getwidth()
+    except (re.error, ValueError, OverflowError):
+        return None
+    return high if high < sys.maxsize else None
+
+
+class Pattern:
+    """One regex of a signature, compiled on first use."""
+
+    __slots__ = ('position', 'regex', 'prefix', 'required', 'window', '_compiled')
+
+    def __init__(self, position: str, regex: bytes, prefix: Optional[bytes], required: Optional[bytes],
+                 window: Optional[int]) -> None:
+        self.position = position
+        self.regex = regex
+        self.prefix = prefix
+        self.required = required
+        self.window = window
+        self._compiled = None
+
+    def matches(self, bofbuffer: bytes, eofbuffer: bytes) -> bool:
+        buffer = eofbuffer if self.position == 'EOF' else bofbuffer
+        if self.prefix is not None and not buffer.startswith(self.prefix):
+            return False
+        if self.required is not None and self.required not in buffer:
+            return False
+        if self._compiled is None:
+            self._compiled = re.compile(self.regex)
+        if self.position == 'BOF':
+            return self._compiled.match(buffer) is not None
+        if self.window is not None:
+            return self._compiled.search(buffer, max(0, len(buffer) - self.window)) is not None
+        return self._compiled.search(buffer) is not None
+
+
+class SignatureSet:
+    """
+    The formats and signatures of a set of Fido signature files in a form that is fast to load and match.
+
+    Only the format fields Fido and FormatIdentifier read are kept. Every pattern carries
+    literals the buffer must contain and, if it is anchored at the end, the width of the
+    tail it can match, both found once when the set is built. Most patterns are rejected
+    by a startswith or substring test, so only the few plausible ones are ever compiled.
+    """
+
+    def __init__(self, formats: Sequence[Tuple], priorities: Dict[str, FrozenSet[str]]) -> None:
+        # formats: (fields, extensions, signatures) with signatures as
+        # (name, ((position, regex, prefix, required, window), ...))
+        self._state = (formats, priorities)
+        self.priorities = priorities
+        self.formats: List[Element] = []
+        self.puid_format_map: Dict[str, Element] = {}
+        self.signatures: List[Tuple[Element, str, List[Tuple[str, List[Pattern]]]]] = []
+        for fields, extensions, signatures in formats:
+            element = Element('format')
+            for tag, text in zip(FORMAT_FIELDS, fields):
+                if text is not None:
+                    SubElement(element, tag).text = text
+            for extension in extensions:
+                SubElement(element, 'extension').text = extension
+            self.formats.append(element)
+            self.puid_format_map[fields[0]] = element
+            self.signatures.append((element, fields[0], [
+                (name, [Pattern(*pattern) for pattern in patterns]) for name, patterns in signatures
+            ]))
+
+    @classmethod
+    def from_fido(cls, fido: Fido) -> 'SignatureSet':
+        """Build a signature set from the formats loaded by a Fido instance."""
+        formats = []
+        for element in fido.formats:
+            # find().text rather than findtext() keeps empty elements as None, like Fido reads them
+            fields = tuple(getattr(element.find(tag), 'text', None) for tag in FORMAT_FIELDS)
+            extensions = tuple(extension.text for extension in element.findall('extension'))
+            signatures = tuple(
+                (signature.findtext('name'), tuple(
+                    (fido.get_pos(pattern), regex, *literal_hints(regex), tail_window(regex))
+                    for pattern in fido.get_patterns(signature)
+                    for regex in (fido.get_regex(pattern),)
+                ))
+                for signature in fido.get_signatures(element)
+            )
+            formats.append((fields, extensions, signatures))
+        return cls(formats, dict(fido.puid_has_priority_over_map))
+
+    def __reduce__(self):
+        return self.__class__, self._state
+
+    def _as_good_as_any(self, puid: str, matches: List[Tuple[Element, str, str]]) -> bool:
+        for _, _, other in matches:
+            if other != puid and puid in self.priorities[other]:
+                return False
+        return True
+
+    def match(self, bofbuffer: bytes, eofbuffer: bytes) -> List[Tuple[Element, str]]:
+        """
+        Apply the signatures to the head and tail of a file, with the same results as Fido.match_formats.
+
+        Returns:
+            List[Tuple[Element, str]]: (format, signature name) pairs with inferior matches removed.
+        """
+        matches = []
+        for element, puid, signatures in self.signatures:
+            if not self._as_good_as_any(puid, matches):
+                continue
+            for name, patterns in signatures:
+                try:
+                    if all(pattern.matches(bofbuffer, eofbuffer) for pattern in patterns):
+                        matches.append((element, name, puid))
+                except re.error:
+                    break
+        return [(element, name) for element, name, puid in matches if self._as_good_as_any(puid, matches)]
+
+
+class CompiledFido(Fido):
+    """A Fido that uses a SignatureSet instead of parsing the signature files."""
+
+    def __init__(self, signature_set: SignatureSet, **kwargs) -> None:
+        super().__init__(format_files=[], **kwargs)
+        self.signature_set = signature_set
+        self.formats = signature_set.formats
+        self.puid_format_map = signature_set.puid_format_map
+        self.puid_has_priority_over_map = signature_set.priorities
+
+    def match_formats(self, bofbuffer: bytes, eofbuffer: bytes) -> List[Tuple[Element, str]]:
+        self.current_count += 1
+        return self.signature_set.match(bofbuffer, eofbuffer)
+
+
+def default_cache_dir() -> str:
+    """The directory for signature caches, FIDO_SIGNATURE_CACHE_DIR or the user cache directory."""
+    return os.environ.get('FIDO_SIGNATURE_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'archcore', 'fido')
+
+
+def signature_cache_key(format_files: Sequence[str], conf_dir: str = CONFIG_DIR) -> str:
+    """A key that changes with the Fido release, the signature files and their contents on disk."""
+    parts = [str(SIGNATURE_CACHE_FORMAT), fido_package.__version__, sys.version.split()[0]]
+    for name in format_files:
+        stat = os.stat(os.path.join(conf_dir, name))
+        parts.append(f'{name}:{stat.st_size}:{stat.st_mtime_ns}')
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def load_signature_set(format_files: Sequence[str], conf_dir: str = CONFIG_DIR,
+                       cache_dir: Optional[str] = None) -> SignatureSet:
+    """
+    Load a signature set from the on-disk cache, building and storing it on a miss.
+
+    A cache that cannot be read or written is ignored, the set is then built from the
+    signature files for this process only.
+
+    Args:
+        format_files (Sequence[str]): Signature file names in `conf_dir`, as passed to Fido.
+        conf_dir (str, optional): The Fido configuration directory. Defaults to the one shipped with Fido.
+        cache_dir (str, optional): Where to keep the cache. Defaults to default_cache_dir().
+
+    Returns:
+        SignatureSet: The formats and signatures of the files.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    path = os.path.join(cache_dir, f'signatures-{signature_cache_key(format_files, conf_dir)}.pickle')
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+        pass
+
+    signature_set = SignatureSet.from_fido(Fido(quiet=True, format_files=list(format_files), conf_dir=conf_dir,
+                                                handle_matches=lambda *args: None))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent loaders never see a partial cache
+        fd, temporary = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(signature_set, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except OSError:
+        pass
+    return signature_set
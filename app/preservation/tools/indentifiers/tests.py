@@ -0,0 +1,160 @@
+import unittest
+import os
+import asyncio
+import io
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from app.preservation.tools.indentifiers.batch import iter_files, identify_tree
+from app.preservation.tools.indentifiers.cache import IdentificationCache, fingerprint
+from app.preservation.tools.indentifiers.fileformat import FormatIdentifier
+from app.preservation.tools.indentifiers.signatures import literal_hints, load_signature_set
+from fido.fido import Fido
+from fido.versions import get_local_versions
+
+
+class TestBatchIdentification(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'sub', 'empty'))
+        with open(os.path.join(self.root, 'data.csv'), 'w') as f:
+            f.write('a,b\n1,2\n')
+        with open(os.path.join(self.root, 'sub', 'notes.unknownext'), 'wb') as f:
+            f.write(b'\x00\x01\x02')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_iter_files(self):
+        """Test that the walk yields files only, including nested ones."""
+        files = sorted(os.path.relpath(path, self.root) for path in iter_files(self.root))
+        self.assertEqual(files, ['data.csv', os.path.join('sub', 'notes.unknownext')])
+
+    def test_identify_tree(self):
+        """Test that every file gets a result and unknown formats are not errors."""
+        results = {os.path.basename(row['path']): row for row in identify_tree(self.root, workers=1)}
+        self.assertEqual(results['data.csv']['format_registry_key'], 'x-fmt/18')
+        self.assertEqual(results['data.csv']['size'], 8)
+        self.assertIsNone(results['notes.unknownext']['format_registry_key'])
+        self.assertIsNone(results['notes.unknownext']['error'])
+
+    def test_identify_tree_cache(self):
+        """Test that unchanged files are answered from the cache and changed ones are identified again."""
+        cache_path = self.root + '.db'
+        self.addCleanup(os.remove, cache_path)
+
+        first = list(identify_tree(self.root, workers=1, cache_path=cache_path))
+        self.assertFalse(any(row['cached'] for row in first))
+
+        data = os.path.join(self.root, 'data.csv')
+        with open(data, 'a') as f:
+            f.write('3,4\n')
+        second = {os.path.basename(row['path']): row for row in identify_tree(self.root, workers=1,
+                                                                              cache_path=cache_path)}
+        self.assertTrue(second['notes.unknownext']['cached'])
+        self.assertFalse(second['data.csv']['cached'])
+        self.assertEqual(second['data.csv']['format_registry_key'], 'x-fmt/18')
+
+    def test_identify_result(self):
+        """Test that identify returns all matches and is safe to share between threads."""
+        identifier = FormatIdentifier()
+        data = os.path.join(self.root, 'data.csv')
+        unknown = os.path.join(self.root, 'sub', 'notes.unknownext')
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(identifier.identify, [data, unknown] * 8))
+        for result in results[::2]:
+            self.assertEqual(result.best.format_registry_key, 'x-fmt/18')
+            self.assertEqual(result.match_type, 'extension')
+        for result in results[1::2]:
+            self.assertIsNone(result.best)
+            self.assertEqual(result.match_type, 'fail')
+
+        result = asyncio.run(identifier.identify_async(data))
+        self.assertEqual(result.matches, results[0].matches)
+        with self.assertRaises(ValueError):
+            identifier.identify_file_format(unknown)
+
+    def test_identify_stream_and_bytes(self):
+        """Test that streams and buffers are identified from their head and tail windows."""
+        identifier = FormatIdentifier()
+        pdf = b'%PDF-1.4\n' + b'x' * 300000 + b'\n%%EOF\n'
+
+        class Unseekable(io.RawIOBase):
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+
+            def readable(self):
+                return True
+
+            def readinto(self, buffer):
+                return self.data.readinto(buffer)
+
+        for result in (identifier.identify_bytes(pdf), identifier.identify_bytes(memoryview(pdf)),
+                       identifier.identify_stream(io.BytesIO(pdf)), identifier.identify_stream(Unseekable(pdf))):
+            self.assertEqual(result.best.format_registry_key, 'fmt/18')
+            self.assertEqual(result.size, len(pdf))
+
+        result = identifier.identify_stream(io.BytesIO(b'a,b\n1,2\n'), 'upload.csv')
+        self.assertEqual((result.best.format_registry_key, result.match_type), ('x-fmt/18', 'extension'))
+        self.assertEqual(identifier.identify_bytes(b'').match_type, 'fail')
+
+    def test_identify_containers(self):
+        """Test that OOXML documents are told apart from plain ZIP files only in container mode."""
+        docx = os.path.join(self.root, 'report.docx')
+        with zipfile.ZipFile(docx, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('[Content_Types].xml', '<Types><Override PartName="/word/document.xml" ContentType='
+                             '"application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                             '</Types>')
+            archive.writestr('word/document.xml', '<document/>')
+
+        self.assertEqual(FormatIdentifier().identify(docx).best.format_registry_key, 'x-fmt/263')
+        identifier = FormatIdentifier(identify_containers=True)
+        result = identifier.identify(docx)
+        self.assertEqual((result.best.format_registry_key, result.match_type), ('fmt/412', 'container'))
+        with open(docx, 'rb') as f:
+            self.assertEqual(identifier.identify_bytes(f.read()).best.format_registry_key, 'fmt/412')
+
+        rows = {os.path.basename(row['path']): row for row in identify_tree(self.root, workers=1,
+                                                                            identify_containers=True)}
+        self.assertEqual(rows['report.docx']['format_registry_key'], 'fmt/412')
+
+    def test_cache_signature_version(self):
+        """Test that a new signature version empties the cache."""
+        cache_path = os.path.join(self.root, 'cache.db')
+        fp = fingerprint(os.path.join(self.root, 'data.csv'))
+        IdentificationCache(cache_path, 'v1').set(fp, ('Comma Separated Values', None, 'x-fmt/18'))
+        self.assertEqual(IdentificationCache(cache_path, 'v1').get(fp)[0][2], 'x-fmt/18')
+        self.assertIsNone(IdentificationCache(cache_path, 'v2').get(fp)[0])
+
+
+class TestSignatureSet(unittest.TestCase):
+
+    def test_literal_hints(self):
+        """Test the literals a signature regex requires."""
+        self.assertEqual(literal_hints(rb'(?s)\A%\!PS-Adobe-3\.0'), (b'%!PS-Adobe-3.0', b'%!PS-Adobe-3.0'))
+        self.assertEqual(literal_hints(rb'(?s)\AV5\x00.*\.CATMaterial'), (b'V5\x00', b'.CATMaterial'))
+        self.assertEqual(literal_hints(rb'(?s)\Aab?c'), (b'a', b'a'))
+        self.assertEqual(literal_hints(rb'(?s)\A.{4}STAK'), (None, b'STAK'))
+        self.assertEqual(literal_hints(rb'(?s)ab|cd'), (None, None))
+
+    def test_cached_set_matches_fido(self):
+        """Test that a signature set loaded from the cache matches like Fido."""
+        versions = get_local_versions()
+        format_files = [versions.pronom_signature, versions.fido_extension_signature]
+        fido = Fido(quiet=True, format_files=format_files, handle_matches=lambda *args: None)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        load_signature_set(format_files, cache_dir=cache_dir)
+        signature_set = load_signature_set(format_files, cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        for buffer in (b'a,b\n1,2\n', b'%PDF-1.4\n%%EOF\n', b'\x89PNG\r\n\x1a\n\x00\x00', b'<?xml version="1.0"?><a/>'):
+            expected = [(f.find('puid').text, name) for f, name in fido.match_formats(buffer, buffer)]
+            actual = [(f.find('puid').text, name) for f, name in signature_set.match(buffer, buffer)]
+            self.assertEqual(actual, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
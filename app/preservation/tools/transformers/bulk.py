@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import nullcontext
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+from app.preservation.tools.transformers.filename import normalize_name
+from app.preservation.tools.transformers.repeated_extension import remove_repeated_extensions
+
+
+class Rename(NamedTuple):
+    source: str
+    target: str
+    is_dir: bool
+
+    @property
+    def depth(self) -> int:
+        return self.source.count(os.sep)
+
+
+class RenameConflict(NamedTuple):
+    # The path more than one entry would be renamed to, or that is already taken
+    target: str
+    sources: Tuple[str, ...]
+    # 'collision', 'exists' or 'empty'
+    reason: str
+
+
+class RenamePlan:
+    """
+    The renames that normalize a directory tree, computed in memory before anything is renamed.
+
+    Entries whose new name is taken, by another entry or by a name that is kept, or is empty
+    are left out of the renames and listed as conflicts instead, so a plan never clobbers a file.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.renames: List[Rename] = []
+        self.conflicts: List[RenameConflict] = []
+        self.scanned = 0
+        # Directories that could not be read, with the error
+        self.errors: List[Tuple[str, str]] = []
+
+    def report(self) -> Iterator[str]:
+        """Yield a line per rename and conflict, as a dry run would print them."""
+        for rename in self.renames:
+            yield f"RENAME: {rename.source} -> {os.path.basename(rename.target)}"
+        for conflict in self.conflicts:
+            yield f"CONFLICT ({conflict.reason}): {', '.join(conflict.sources)} -> {conflict.target}"
+        for path, error in self.errors:
+            yield f"ERROR: {path}: {error}"
+
+
+def plan_renames(root: str, whitelist_file: Optional[str] = None, whitelist_dir: Optional[str] = None,
+                 replace: Optional[dict] = None, normalize_unicode: bool = True,
+                 repeated_extensions: bool = True) -> RenamePlan:
+    """
+    Scan a directory tree once and plan the renames that normalize every name below it.
+
+    Names are transformed as transform_filename does, and files also lose repeated extensions as
+    transform_repeated_extension does. The tree is read with os.scandir, whose entries carry their
+    file type, so no name costs an extra stat call. `root` itself is not renamed and symbolic
+    links are renamed but not followed.
+
+    Args:
+        root (str): The directory to normalize.
+        whitelist_file (str, optional): The characters allowed in file names. Defaults to DEFAULT_WHITELIST_FILE.
+        whitelist_dir (str, optional): The characters allowed in directory names. Defaults to DEFAULT_WHITELIST_DIR.
+        replace (dict, optional): Character replacements, see transform_filename.
+        normalize_unicode (bool, optional): If True, normalizes names to ASCII. Defaults to True.
+        repeated_extensions (bool, optional): If True, removes repeated file extensions. Defaults to True.
+
+    Returns:
+        RenamePlan: The renames, deepest first, and the conflicts.
+    """
+    root = os.path.abspath(root)
+    plan = RenamePlan(root)
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError as e:
+            plan.errors.append((directory, str(e)))
+            continue
+
+        names = set()
+        targets: Dict[str, List[Tuple[str, bool]]] = defaultdict(list)
+        for entry in entries:
+            plan.scanned += 1
+            names.add(entry.name)
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            if is_dir:
+                stack.append(entry.path)
+            new_name = normalize_name(entry.name, is_dir, whitelist_dir if is_dir else whitelist_file, replace,
+                                      normalize_unicode)
+            if repeated_extensions and not is_dir:
+                new_name = remove_repeated_extensions(new_name)
+            if new_name != entry.name:
+                targets[new_name].append((entry.name, is_dir))
+
+        for new_name, sources in targets.items():
+            target = os.path.join(directory, new_name)
+            source_paths = tuple(os.path.join(directory, name) for name, _ in sources)
+            if not new_name or new_name in ('.', '..'):
+                plan.conflicts.append(RenameConflict(target, source_paths, 'empty'))
+            elif len(sources) > 1:
+                plan.conflicts.append(RenameConflict(target, source_paths, 'collision'))
+            elif new_name in names:
+                # Also taken when the entry holding the name is renamed itself, the order would matter
+                plan.conflicts.append(RenameConflict(target, source_paths, 'exists'))
+            else:
+                plan.renames.append(Rename(source_paths[0], target, sources[0][1]))
+
+    # Children before their parents, so every source path is still valid when it is renamed
+    plan.renames.sort(key=lambda rename: rename.depth, reverse=True)
+    return plan
+
+
+def _rename(rename: Rename, journal: Optional[TextIO] = None, lock: Optional[threading.Lock] = None) -> Optional[str]:
+    # os.rename replaces an existing file on POSIX, refuse if the target appeared after planning
+    if os.path.lexists(rename.target):
+        return f"{rename.target} already exists"
+    try:
+        os.rename(rename.source, rename.target)
+    except OSError as e:
+        return str(e)
+    if journal is not None:
+        # Journaled as soon as it is done, so an interrupted run loses no rename
+        with lock:
+            journal.write(json.dumps({'source': rename.source, 'target': rename.target, 'is_dir': rename.is_dir}) + '\n')
+            journal.flush()
+    return None
+
+
+def _levels(renames: Iterable[Rename]) -> Iterator[List[Rename]]:
+    """Split renames into consecutive runs of one depth in which no two renames share a path."""
+    level: List[Rename] = []
+    paths = set()
+    for rename in renames:
+        # A journal of several runs can rename the same entry twice, those must stay in order
+        if level and (rename.depth != level[0].depth or rename.source in paths or rename.target in paths):
+            yield level
+            level, paths = [], set()
+        level.append(rename)
+        paths.update((rename.source, rename.target))
+    if level:
+        yield level
+
+
+def _run_levels(renames: Iterable[Rename], workers: Optional[int],
+                journal: Optional[TextIO] = None) -> Iterator[Tuple[Rename, Optional[str]]]:
+    # The renames of a level never touch each other's paths, each level runs in parallel after the one before
+    run = partial(_rename, journal=journal, lock=threading.Lock())
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for level in _levels(renames):
+            yield from zip(level, executor.map(run, level))
+
+
+def apply_plan(plan: RenamePlan, journal: Optional[str] = None,
+               workers: Optional[int] = None) -> Iterator[Tuple[Rename, Optional[str]]]:
+    """
+    Carry out the renames of a plan, deepest first, on a pool of threads.
+
+    Every completed rename is appended to the journal and flushed at once, so an interrupted run
+    can still be undone with undo_renames. A target that exists by the time it is renamed is
+    never replaced, the rename fails instead.
+
+    Args:
+        plan (RenamePlan): The plan from plan_renames.
+        journal (str, optional): The undo journal, a file of JSON lines that is appended to.
+        workers (int, optional): The number of threads. Defaults to the ThreadPoolExecutor default.
+
+    Yields:
+        Tuple[Rename, Optional[str]]: Each rename and its error, None on success.
+    """
+    with open(journal, 'a', encoding='utf-8') if journal else nullcontext() as f:
+        yield from _run_levels(plan.renames, workers, f)
+
+
+def undo_renames(journal: str, workers: Optional[int] = None) -> Iterator[Tuple[Rename, Optional[str]]]:
+    """
+    Revert the renames recorded in an undo journal, parents before their children.
+
+    Args:
+        journal (str): The journal written by apply_plan.
+        workers (int, optional): The number of threads. Defaults to the ThreadPoolExecutor default.
+
+    Yields:
+        Tuple[Rename, Optional[str]]: Each reverting rename and its error, None on success.
+    """
+    with open(journal, encoding='utf-8') as f:
+        renames = [Rename(entry['target'], entry['source'], entry['is_dir']) for entry in map(json.loads, f)]
+    # The journal is deepest first, reversed every parent path is restored before the paths below it
+    renames.reverse()
+    yield from _run_levels(renames, workers)
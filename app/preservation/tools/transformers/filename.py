@@ -5,6 +5,40 @@ import unicodedata
 DEFAULT_WHITELIST_FILE = "-_. %s%s" % (string.ascii_letters, string.digits)
 DEFAULT_WHITELIST_DIR = "-_ %s%s" % (string.ascii_letters, string.digits)
 
+
+def normalize_name(name: str, is_dir: bool = False, whitelist: str = None, replace: dict = None,
+                   normalize_unicode: bool = True) -> str:
+    """
+    Return a file or directory name transformed the way transform_filename renames it, without touching the disk.
+
+    Args:
+        name (str): The file or directory name, without its directory.
+        is_dir (bool, optional): Whether the name is that of a directory, which selects the default
+            whitelist and replacements. Defaults to False.
+        whitelist (str, optional): A string of allowed characters, see transform_filename.
+        replace (dict, optional): A dictionary specifying character replacements, see transform_filename.
+        normalize_unicode (bool, optional): If True, normalizes the name to ASCII. Defaults to True.
+
+    Returns:
+        str: The transformed name, which is empty if no character of `name` is allowed.
+    """
+    if whitelist is None:
+        whitelist = DEFAULT_WHITELIST_DIR if is_dir else DEFAULT_WHITELIST_FILE
+
+    if replace is None:
+        replace = {' ': '_'}
+        if is_dir:
+            replace['.'] = '_'
+
+    for k, v in replace.items():
+        name = name.replace(k, v)
+
+    if normalize_unicode:
+        name = unicodedata.normalize('NFKD', name).encode('ASCII', 'ignore').decode()
+
+    return ''.join(c for c in name if c in whitelist)
+
+
 def transform_filename(path: str, whitelist: str = None, replace: dict = None, normalize_unicode: bool = True) -> None:
     """
     Transforms the file or directory name by replacing certain characters, optionally normalizing Unicode,
@@ -46,19 +80,9 @@ def transform_filename(path: str, whitelist: str = None, replace: dict = None, n
         if os.path.isdir(path):
             replace['.'] = '_'
 
-    # Get the base name of the file/directory
-    basename = os.path.basename(path)
-
-    # Apply replacements
-    for k, v in replace.items():
-        basename = basename.replace(k, v)
-
-    # Normalize Unicode if enabled
-    if normalize_unicode:
-        basename = unicodedata.normalize('NFKD', basename).encode('ASCII', 'ignore').decode()
-
-    # Keep only whitelisted characters
-    new_basename = ''.join(c for c in basename if c in whitelist)
+    # Get the base name of the file/directory and clean it
+    new_basename = normalize_name(os.path.basename(path), whitelist=whitelist, replace=replace,
+                                  normalize_unicode=normalize_unicode)
 
     # Rename the file or directory with the cleaned name
-    os.rename(path, os.path.join(os.path.dirname(path), new_basename))
\ No newline at end of file
+    os.rename(path, os.path.join(os.path.dirname(path), new_basename))
@@ -6,6 +6,13 @@ from typing import Tuple
 REPEATED_PATTERN = r'\.(\w+)(\.(\1))+'
 
 
+def remove_repeated_extensions(name: str) -> str:
+    """
+    Return a file name with every repeated extension reduced to one, e.g. 'archive.tar.gz.gz' to 'archive.tar.gz'.
+    """
+    return re.sub(REPEATED_PATTERN, '.\\1', name)
+
+
 def transform_repeated_extension(path: str) -> Tuple[str, os]:
     """
     Transforms file paths by removing repeated file extensions and renaming the file.
@@ -22,7 +29,7 @@ def transform_repeated_extension(path: str) -> Tuple[str, os]:
         Given a path like 'archive.tar.gz.gz', it renames the file to 'archive.tar.gz'.
     """
     # Replace repeated extensions with a single occurrence (e.g., .gz.gz -> .gz)
-    new_path = re.sub(REPEATED_PATTERN, '.\\1', path)
+    new_path = remove_repeated_extensions(path)
 
     # Rename the file with the transformed path
     os.rename(path, new_path)
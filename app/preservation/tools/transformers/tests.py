@@ -0,0 +1,71 @@
+import unittest
+import os
+import shutil
+import tempfile
+from app.preservation.tools.transformers.bulk import apply_plan, plan_renames, undo_renames
+
+
+class TestBulkRename(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'old dir', 'sub.dir'))
+        for name in ('a b.txt', 'a_b.txt', 'r\u00e9.txt', 'r\u00e8.txt', 'x.gz.gz', os.path.join('sub.dir', 'f ile.pdf')):
+            with open(os.path.join(self.root, 'old dir', name), 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def tree(self):
+        return sorted(os.path.relpath(os.path.join(directory, name), self.root)
+                      for directory, dirs, files in os.walk(self.root) for name in dirs + files)
+
+    def test_plan_apply_undo(self):
+        before = self.tree()
+        plan = plan_renames(self.root)
+        self.assertEqual(plan.scanned, 8)
+        self.assertEqual(sorted((conflict.reason, len(conflict.sources)) for conflict in plan.conflicts),
+                         [('collision', 2), ('exists', 1)])
+        # Children are renamed before their parents
+        depths = [rename.depth for rename in plan.renames]
+        self.assertEqual(depths, sorted(depths, reverse=True))
+        self.assertEqual(self.tree(), before)
+
+        journal = os.path.join(self.root, 'renames.jsonl')
+        self.assertEqual([error for _, error in apply_plan(plan, journal, workers=4)], [None] * 4)
+        self.assertEqual(self.tree(), sorted([
+            'old_dir', os.path.join('old_dir', 'a b.txt'), os.path.join('old_dir', 'a_b.txt'),
+            os.path.join('old_dir', 'r\u00e9.txt'), os.path.join('old_dir', 'r\u00e8.txt'),
+            os.path.join('old_dir', 'sub_dir'), os.path.join('old_dir', 'sub_dir', 'f_ile.pdf'),
+            os.path.join('old_dir', 'x.gz'), 'renames.jsonl']))
+
+        self.assertEqual([error for _, error in undo_renames(journal, workers=4)], [None] * 4)
+        os.remove(journal)
+        self.assertEqual(self.tree(), before)
+
+    def test_undo_two_runs(self):
+        """Test that a journal appended to by two consecutive runs restores the original tree."""
+        before = self.tree()
+        journal = os.path.join(tempfile.mkdtemp(), 'renames.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(journal))
+
+        first = plan_renames(self.root, replace={' ': '-'}, repeated_extensions=False)
+        self.assertEqual([error for _, error in apply_plan(first, journal, workers=4)], [None] * 4)
+        # Renames the top directory the first run renamed once more, both revert at the same depth
+        second = plan_renames(self.root, replace={'-dir': '_dir'}, repeated_extensions=False)
+        self.assertEqual([(os.path.basename(rename.source), os.path.basename(rename.target))
+                          for rename in second.renames], [('old-dir', 'old_dir')])
+        self.assertEqual([error for _, error in apply_plan(second, journal, workers=4)], [None])
+        self.assertEqual(self.tree(), sorted([
+            'old_dir', os.path.join('old_dir', 'a-b.txt'), os.path.join('old_dir', 'a_b.txt'),
+            os.path.join('old_dir', 'r\u00e9.txt'), os.path.join('old_dir', 'r\u00e8.txt'),
+            os.path.join('old_dir', 'subdir'), os.path.join('old_dir', 'subdir', 'f-ile.pdf'),
+            os.path.join('old_dir', 'x.gz.gz')]))
+
+        self.assertEqual([error for _, error in undo_renames(journal, workers=4)], [None] * 5)
+        self.assertEqual(self.tree(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
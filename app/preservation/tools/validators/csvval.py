@@ -1,19 +1,286 @@
 import csv
-from typing import List
+import io
+import locale
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
+# Bytes read per chunk when validating in parallel
+CHUNK_SIZE = 16 * 1024 * 1024
 
-def validate_csv(path: str, column_number: int, delimiter: str = ',', encoding: str = None) -> List[str]:
+QUOTECHAR = '"'
+
+# Appended to a chunk as a record of its own, it is only read as one if the chunk does not end inside a quoted field
+_CHUNK_END = '\ufffe\uffffend of chunk\ufffe\uffff'
+
+
+class CSVError(NamedTuple):
+    # The line the record starts on and the record number, both counted from 1
+    line: int
+    record: int
+    # 'columns', 'line_break' or 'parse'
+    code: str
+    message: str
+
+    def __str__(self) -> str:
+        return f'Line {self.line}, record {self.record}: {self.message}'
+
+
+class CSVStats:
+    """Summary statistics of a validation, filled in as the file is read."""
+
+    def __init__(self) -> None:
+        self.records = 0
+        self.lines = 0
+        self.errors = 0
+        # Whether validation stopped at max_errors instead of reading the whole file
+        self.truncated = False
+        # The number of records per column count, a wrong delimiter shows up as one large count of 1
+        self.column_counts: Counter = Counter()
+
+    def add(self, other: 'CSVStats') -> None:
+        self.records += other.records
+        self.lines += other.lines
+        self.column_counts.update(other.column_counts)
+
+
+def _validate_lines(lines: Iterable[str], column_number: int, delimiter: str, stats: CSVStats,
+                    final: bool = True, chunk: bool = False) -> Iterator[CSVError]:
+    """
+    Validate CSV text given as lines, yielding errors with line and record numbers relative to the first line.
+
+    The counts are added to `stats` when the generator finishes or is closed. Returns (as the
+    generator's value) whether a chunk ended outside a quoted field.
     """
-    Validates a CSV file by checking if each row has the correct number of columns and if every row ends with a newline character.
+    last_line = ''
+
+    def read() -> Iterator[str]:
+        nonlocal last_line
+        for last_line in lines:
+            yield last_line
+        if chunk:
+            yield _CHUNK_END + '\n'
+
+    reader = csv.reader(read(), delimiter=delimiter, quotechar=QUOTECHAR)
+    records = 0
+    row = None
+    clean = not chunk
+    # Only the rows with a wrong column count are counted one by one, the rest is derived at the end
+    mismatched: Counter = Counter()
+    try:
+        try:
+            for records, row in enumerate(reader, 1):
+                if len(row) != column_number:
+                    if chunk and row == [_CHUNK_END]:
+                        break
+                    mismatched[len(row)] += 1
+                    # Text mode turns every line break into \n, so the ones inside fields give the first line
+                    start = reader.line_num - sum(field.count('\n') for field in row)
+                    yield CSVError(start, records, 'columns',
+                                   f'Wrong number of columns: expected {column_number}, found {len(row)}')
+        except csv.Error as e:
+            yield CSVError(reader.line_num, records + 1, 'parse', f'Could not parse the record: {e}')
+            return False
+
+        if chunk and row == [_CHUNK_END]:
+            clean = True
+            records -= 1
+        if final and last_line and not last_line.endswith('\n'):
+            yield CSVError(reader.line_num - chunk, records, 'line_break',
+                           'Missing line break at the end of the file')
+        return clean
+    finally:
+        stats.records += records
+        stats.lines += reader.line_num - (chunk and clean)
+        stats.column_counts.update(mismatched)
+        if records > sum(mismatched.values()):
+            stats.column_counts[column_number] += records - sum(mismatched.values())
+
+
+def _validate_chunk(data: bytes, encoding: str, column_number: int, delimiter: str, max_errors: Optional[int],
+                    final: bool) -> Tuple[List[CSVError], CSVStats, bool]:
+    stats = CSVStats()
+    errors = []
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding=encoding)
+    validation = _validate_lines(lines, column_number, delimiter, stats, final=final, chunk=True)
+    # The whole chunk is always read, only its end tells whether it was cut inside a quoted field.
+    # Errors past max_errors are dropped here, the caller applies the cap across chunks.
+    try:
+        while True:
+            error = next(validation)
+            if max_errors is None or len(errors) < max_errors:
+                errors.append(error)
+    except StopIteration as stop:
+        return errors, stats, stop.value
+
+
+def _record_boundary(data: bytes) -> int:
+    """
+    Return the offset just after the last line break of data outside a quoted field, or 0 if there is none.
+
+    `data` must start at a record boundary. A field is taken to be quoted while an odd number of
+    quote characters precede it, which holds for well-formed CSV. A quote inside an unquoted field
+    can fool it, _validate_chunk detects that.
+    """
+    quote = QUOTECHAR.encode()
+    quotes = data.count(quote)
+    end = len(data)
+    while True:
+        position = data.rfind(b'\n', 0, end)
+        if position < 0:
+            return 0
+        quotes -= data.count(quote, position, end)
+        if quotes % 2 == 0:
+            return position + 1
+        end = position
+
+
+def _read_chunks(f: BinaryIO, chunk_size: int) -> Iterator[Tuple[int, bytes, bool]]:
+    """Read a file in one pass and yield (offset, data, final) chunks that start and end on record boundaries."""
+    offset, carry = 0, b''
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            if carry:
+                yield offset, carry, True
+            return
+        data = carry + block if carry else block
+        cut = _record_boundary(data)
+        if cut == 0:
+            carry = data
+            continue
+        yield offset, data[:cut], False
+        offset, carry = offset + cut, data[cut:]
+
+
+def _chunk_safe(encoding: str) -> bool:
+    # Cutting the bytes at line breaks only works if line breaks and quotes are single ASCII bytes
+    try:
+        return ('\n' + QUOTECHAR).encode(encoding) == b'\n' + QUOTECHAR.encode()
+    except LookupError:
+        return False
+
+
+def iter_csv_errors(path: str, column_number: int, delimiter: str = ',', encoding: Optional[str] = None,
+                    max_errors: Optional[int] = None, workers: int = 1, chunk_size: int = CHUNK_SIZE,
+                    stats: Optional[CSVStats] = None) -> Iterator[CSVError]:
+    """
+    Validate a CSV file in one pass, yielding each error as it is found.
+
+    Every record must have `column_number` columns and the file must end with a line break.
+    Errors carry the line the record starts on, so records with quoted line breaks are reported
+    where they begin. Only the errors are kept, never the rows, so memory stays flat however many
+    errors the file has.
+
+    With more than one worker the file is read once in chunks of about `chunk_size` bytes, cut
+    at line breaks outside quoted fields, and the chunks are validated on a pool of processes.
+    Errors are still yielded in file order. A chunk that turns out to end inside a quoted field,
+    which a stray quote in an unquoted field can cause, is detected and the rest of the file is
+    then validated in this process. Encodings in which a line break is not a single byte, such as
+    UTF-16, are always validated in this process.
+
+    Args:
+        path (str): The file path to the CSV file.
+        column_number (int): The expected number of columns in each record.
+        delimiter (str, optional): The delimiter used in the CSV file. Defaults to ','.
+        encoding (str, optional): The encoding of the CSV file. If None, the system's default encoding is used.
+        max_errors (int, optional): Stop after this many errors. Defaults to reading the whole file.
+        workers (int, optional): The number of worker processes. Defaults to 1, validating in this process.
+        chunk_size (int, optional): The number of bytes per chunk sent to a worker. Defaults to 16 MiB.
+        stats (CSVStats, optional): Filled in with the number of records, lines and errors, and whether
+            validation stopped at `max_errors`.
+
+    Yields:
+        CSVError: The errors in file order.
+
+    Raises:
+        OSError: If the file cannot be opened.
+        UnicodeDecodeError: If there is a problem with the file encoding.
+    """
+    stats = stats if stats is not None else CSVStats()
+    encoding = encoding or locale.getpreferredencoding(False)
+
+    def capped(errors: Iterator[CSVError]) -> Iterator[CSVError]:
+        try:
+            for error in errors:
+                stats.errors += 1
+                yield error
+                if max_errors is not None and stats.errors >= max_errors:
+                    stats.truncated = True
+                    return
+        finally:
+            # Lets the source count what it has read so far
+            errors.close()
+
+    def sequential(offset: int) -> Iterator[CSVError]:
+        line_offset, record_offset = stats.lines, stats.records
+        tail = CSVStats()
+        try:
+            with open(path, 'rb') as raw:
+                raw.seek(offset)
+                with io.TextIOWrapper(raw, encoding=encoding) as lines:
+                    validation = _validate_lines(lines, column_number, delimiter, tail)
+                    try:
+                        for error in validation:
+                            yield error._replace(line=error.line + line_offset, record=error.record + record_offset)
+                    finally:
+                        validation.close()
+        finally:
+            stats.add(tail)
+
+    if workers <= 1 or not _chunk_safe(encoding):
+        yield from capped(sequential(0))
+        return
+
+    yield from capped(_iter_chunk_errors(path, column_number, delimiter, encoding, max_errors, workers, chunk_size,
+                                         stats, sequential))
+
+
+def _iter_chunk_errors(path, column_number, delimiter, encoding, max_errors, workers, chunk_size, stats,
+                       sequential) -> Iterator[CSVError]:
+    with open(path, 'rb') as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = _read_chunks(f, chunk_size)
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    offset, data, final = chunk
+                    pending.append((offset, executor.submit(_validate_chunk, data, encoding, column_number,
+                                                            delimiter, max_errors, final)))
+                if not pending:
+                    return
+                offset, future = pending.popleft()
+                errors, chunk_stats, clean = future.result()
+                if not clean:
+                    # The chunk was cut inside a quoted field, validate from its start without chunking
+                    yield from sequential(offset)
+                    return
+                line_offset, record_offset = stats.lines, stats.records
+                stats.add(chunk_stats)
+                for error in errors:
+                    yield error._replace(line=error.line + line_offset, record=error.record + record_offset)
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def validate_csv(path: str, column_number: int, delimiter: str = ',', encoding: str = None,
+                 max_errors: Optional[int] = None) -> List[str]:
+    """
+    Validates a CSV file by checking if each row has the correct number of columns and if the file ends with a newline character.
 
     Args:
         path (str): The file path to the CSV file.
         column_number (int): The expected number of columns in each row.
         delimiter (str, optional): The delimiter used in the CSV file. Defaults to ','.
         encoding (str, optional): The encoding of the CSV file. If None, the system's default encoding is used.
+        max_errors (int, optional): Stop after this many errors. Defaults to reading the whole file.
 
     Returns:
-        List[str]: A list of error messages. Each error message indicates a row with an incorrect number of columns or missing newline characters.
+        List[str]: A list of error messages with the line each error was found on.
 
     Example:
         Given a CSV file `data.csv` with 3 columns expected:
@@ -25,40 +292,8 @@ def validate_csv(path: str, column_number: int, delimiter: str = ',', encoding:
                 print(error)
         ```
 
-    Behavior:
-        - **Line break validation**: Checks if each line ends with a newline character (`\n`).
-        - **Column validation**: Ensures each row has the specified number of columns (`column_number`).
-        - **CSV parsing**: Uses Python’s built-in `csv.reader` to handle CSV structure based on the specified `delimiter` and `quotechar`.
-
-    Error Handling:
-        - Rows with an incorrect number of columns will generate an error message in the format:
-          `"Wrong number of columns for row {row}"`
-        - Rows missing a newline character at the end will generate an error message in the format:
-          `"Missing line break for post {row}"`
-
     Raises:
         OSError: If the file cannot be opened.
         UnicodeDecodeError: If there is a problem with the file encoding.
     """
-    errors = []
-
-    # Check for missing newline characters in each row
-    with open(path, 'r', encoding=encoding) as csvfile:
-        for row in csvfile:
-            if not row.endswith('\n'):
-                msg = f'Missing line break for post {row}'
-                errors.append(msg)
-
-        # Reset file pointer to the beginning
-        csvfile.seek(0)
-
-        # Use CSV reader to check for column consistency
-        reader = csv.reader(csvfile, delimiter=delimiter, quotechar='"')
-
-        # Validate the number of columns in each row
-        for row in reader:
-            if len(row) != column_number:
-                msg = f'Wrong number of columns for row {row}'
-                errors.append(msg)
-
-    return errors
\ No newline at end of file
+    return [str(error) for error in iter_csv_errors(path, column_number, delimiter, encoding, max_errors)]
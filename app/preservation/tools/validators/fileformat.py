@@ -1,4 +1,4 @@
-from app.preservation.tools.indentifiers.fileformat import FormatIdentifier
+from app.preservation.tools.indentifiers.fileformat import get_format_identifier
 import os
 
 def validate_file_format(filename: str, expected_puid: str) -> bool:
@@ -13,7 +13,7 @@ def validate_file_format(filename: str, expected_puid: str) -> bool:
         bool: True if the file matches the expected PUID, False otherwise.
     """
 
-    identifier = FormatIdentifier()
+    identifier = get_format_identifier()
     if not os.path.exists(filename):
         raise FileNotFoundError(f"File {filename} does not exist.")
 
@@ -1,6 +1,10 @@
 import unittest
 import os
-from app.preservation.tools.validators.xmlval import validate_xml  # Import the function from your module
+import random
+import tempfile
+from app.preservation.tools.validators.xmlval import (SchemaRegistry, iter_xml_errors, validate_xml, validate_xml_files,
+                                                      validate_xml_streaming)  # Import the function from your module
+from app.preservation.tools.validators.csvval import CSVStats, iter_csv_errors, validate_csv
 
 class TestXMLValidation(unittest.TestCase):
 
@@ -66,5 +70,102 @@ class TestXMLValidation(unittest.TestCase):
         self.assertFalse(result)
         self.assertIn("An error occurred", message)
 
+    def test_schema_registry(self):
+        """Test that schemas are compiled once and again after they change."""
+        registry = SchemaRegistry(maxsize=1)
+        schema = registry.get(self.valid_xsd)
+        self.assertIs(registry.get(self.valid_xsd), schema)
+
+        stat = os.stat(self.valid_xsd)
+        os.utime(self.valid_xsd, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        self.assertIsNot(registry.get(self.valid_xsd), schema)
+
+    def test_validate_xml_files(self):
+        """Test that a batch of files is validated against one schema on a pool of workers."""
+        files = [self.valid_xml, self.invalid_xml, 'nonexistent.xml'] * 3
+        results = list(validate_xml_files(files, self.valid_xsd, workers=2, batch_size=2))
+        self.assertEqual(sorted((path, result) for path, result, _ in results),
+                         sorted((path, path == self.valid_xml) for path in files))
+
+    def test_streaming(self):
+        """Test that streaming validation reports errors with the line they were found on."""
+        self.assertEqual(validate_xml_streaming(self.valid_xml, self.valid_xsd), (True, "XML is valid."))
+        errors = list(iter_xml_errors(self.invalid_xml, self.valid_xsd))
+        self.assertEqual([(error.line, error.domain) for error in errors], [(5, 'SCHEMASV')])
+        self.assertIn("Missing child element(s)", errors[0].message)
+
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(fd, 'w') as xml_file:
+            xml_file.write('<note>\n<to>Tove</to>\n<from>Jani</form>\n</note>\n')
+        try:
+            errors = list(iter_xml_errors(path, self.valid_xsd))
+            self.assertEqual((errors[-1].line, errors[-1].domain), (3, 'PARSER'))
+            self.assertIn("Opening and ending tag mismatch", errors[-1].message)
+            self.assertEqual(len(list(iter_xml_errors(path, self.valid_xsd, max_errors=1))), 1)
+        finally:
+            os.remove(path)
+
+
+class TestCSVValidation(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        rows = []
+        for i in range(200):
+            if i % 50 == 7:
+                rows.append('short,row\n')
+            elif i % 30 == 3:
+                rows.append('quoted,"line one\nline two",x\n')
+            else:
+                rows.append(f'{i},"a ""quoted"" value",{i * 2}\n')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(''.join(rows) + '5" floppy,stray quote,c\nlast,row')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_errors(self):
+        stats = CSVStats()
+        errors = list(iter_csv_errors(self.path, 3, encoding='utf-8', stats=stats))
+        self.assertEqual([(error.line, error.record, error.code) for error in errors],
+                         [(9, 8, 'columns'), (60, 58, 'columns'), (112, 108, 'columns'), (164, 158, 'columns'),
+                          (209, 202, 'columns'), (209, 202, 'line_break')])
+        self.assertEqual((stats.records, stats.lines, stats.errors), (202, 209, 6))
+        self.assertEqual(stats.column_counts, {3: 197, 2: 5})
+        self.assertEqual(validate_csv(self.path, 3, encoding='utf-8')[0],
+                         'Line 9, record 8: Wrong number of columns: expected 3, found 2')
+
+    def test_max_errors(self):
+        stats = CSVStats()
+        errors = list(iter_csv_errors(self.path, 3, encoding='utf-8', max_errors=2, stats=stats))
+        self.assertEqual([error.record for error in errors], [8, 58])
+        self.assertTrue(stats.truncated)
+
+    def test_chunks_match_sequential(self):
+        sequential = list(iter_csv_errors(self.path, 3, encoding='utf-8'))
+        for chunk_size in (64, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                stats = CSVStats()
+                chunked = list(iter_csv_errors(self.path, 3, encoding='utf-8', workers=2, chunk_size=chunk_size,
+                                               stats=stats))
+                self.assertEqual(chunked, sequential)
+                self.assertEqual((stats.records, stats.lines), (202, 209))
+
+    def test_capped_chunks_match_sequential(self):
+        """Test that a chunk cut inside a quoted field by a stray quote is detected even when the cap is reached."""
+        rng = random.Random(42)
+        cells = ['a', 'b c', '"q,d"', '"x\ny"', '5" disk', '""', '"a ""b"""']
+        for run in range(40):
+            with open(self.path, 'w', encoding='utf-8') as f:
+                for _ in range(rng.randint(5, 30)):
+                    f.write(','.join(rng.choice(cells) for _ in range(rng.choice((2, 3, 3, 3, 4)))) + '\n')
+            for max_errors in (1, 3):
+                with self.subTest(run=run, max_errors=max_errors):
+                    sequential = list(iter_csv_errors(self.path, 3, encoding='utf-8', max_errors=max_errors))
+                    chunked = list(iter_csv_errors(self.path, 3, encoding='utf-8', max_errors=max_errors, workers=2,
+                                                   chunk_size=40))
+                    self.assertEqual(chunked, sequential)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
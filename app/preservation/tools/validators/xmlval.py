@@ -1,9 +1,71 @@
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from lxml import etree
+from app.cache import LRUCache
+
+
+class SchemaRegistry:
+    """
+    Compiled XML schemas, kept in memory and shared by every validation in the process.
+
+    Schemas are keyed by absolute path, size and modification time, so an edited schema is
+    compiled again on its next use. Only the main schema file is checked, a schema that
+    changes only in a file it includes or imports is not noticed. The least recently used
+    schemas are evicted once more than `maxsize` are kept.
+    """
+
+    def __init__(self, maxsize: int = 16) -> None:
+        self._cache = LRUCache(maxsize)
+
+    def get(self, xsd_file: str) -> etree.XMLSchema:
+        """
+        Return the compiled schema of a file, compiling it on first use.
+
+        Raises:
+            OSError: If the schema file cannot be read.
+            etree.XMLSyntaxError: If the schema is not well-formed.
+            etree.XMLSchemaParseError: If the schema is not a valid XML Schema.
+        """
+        stat = os.stat(xsd_file)
+        key = (os.path.abspath(xsd_file), stat.st_size, stat.st_mtime_ns)
+        schema = self._cache.get(key)
+        if schema is None:
+            # Parsing from the path lets includes and imports resolve relative to the schema
+            schema = etree.XMLSchema(etree.parse(xsd_file))
+            self._cache.set(key, schema)
+        return schema
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+schema_registry = SchemaRegistry()
+
+# The schema of a pool worker, compiled once by _init_worker
+_worker_schema: Optional[etree.XMLSchema] = None
+
+
+def _validate(xml_file: str, xml_schema: etree.XMLSchema) -> Tuple[bool, str]:
+    try:
+        with open(xml_file, 'rb') as f:
+            xml_doc = etree.parse(f)
+        xml_schema.assertValid(xml_doc)
+        return True, "XML is valid."
+    except (etree.XMLSchemaError, etree.DocumentInvalid) as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"An error occurred: {str(e)}"
+
 
 def validate_xml(xml_file: str, xsd_file: str) -> tuple[bool, str]:
     """
     Validate an XML file against a given XML Schema (XSD).
 
+    The schema is compiled once and then taken from the schema registry.
+
     Args:
         xml_file (str): Path to the XML file.
         xsd_file (str): Path to the XSD schema file.
@@ -14,20 +76,184 @@ def validate_xml(xml_file: str, xsd_file: str) -> tuple[bool, str]:
                           messages or errors.
     """
     try:
-        # Parse the XSD file
-        with open(xsd_file, 'rb') as schema_file:
-            schema_doc = etree.parse(schema_file)
-            xml_schema = etree.XMLSchema(schema_doc)
+        xml_schema = schema_registry.get(xsd_file)
+    except etree.XMLSchemaError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"An error occurred: {str(e)}"
+    return _validate(xml_file, xml_schema)
 
-        # Parse the XML file
-        with open(xml_file, 'rb') as xml_file:
-            xml_doc = etree.parse(xml_file)
 
-        # Validate the XML file against the schema
-        xml_schema.assertValid(xml_doc)
-        return True, "XML is valid."
+# How lxml words the message of a well-formedness error raised by iterparse
+_PARSER_MESSAGE = re.compile(r"line \d+: b?'(.*)'$", re.DOTALL)
 
-    except (etree.XMLSchemaError, etree.DocumentInvalid) as e:
+
+class XMLError(NamedTuple):
+    line: int
+    # The libxml2 error domain, such as SCHEMASV for validity and PARSER for well-formedness errors
+    domain: str
+    message: str
+
+    def __str__(self) -> str:
+        return f'Line {self.line}: {self.message}'
+
+
+class _LineReader:
+    """A file wrapper that hands the parser one line per read, so errors can be placed on the line being parsed."""
+
+    def __init__(self, f: BinaryIO) -> None:
+        self._f = f
+        self._newlines = 0
+        # The line the data last handed to the parser starts on
+        self.line = 1
+        self.eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.readline(size if size and size > 0 else -1)
+        self.line = self._newlines + 1
+        self._newlines += data.endswith(b'\n')
+        self.eof = not data
+        return data
+
+
+def iter_xml_errors(xml_file: str, xsd_file: str, max_errors: Optional[int] = None) -> Iterator[XMLError]:
+    """
+    Validate an XML file against a schema while parsing it, yielding the errors as they are found.
+
+    The document is parsed incrementally with validation enabled and every element is freed as
+    soon as it is complete, so memory use does not grow with the size of the document. libxml2
+    does not know line numbers when validating while parsing, the line reported is the one being
+    parsed when the error was raised, which is the line of the element's start or end tag.
+
+    Args:
+        xml_file (str): Path to the XML file.
+        xsd_file (str): Path to the XSD schema file, compiled once through the schema registry.
+        max_errors (int, optional): Stop parsing after this many errors. Defaults to parsing the whole file.
+
+    Yields:
+        XMLError: The validity and well-formedness errors in document order. Parsing stops at the
+        first well-formedness error.
+
+    Raises:
+        OSError: If a file cannot be read.
+        etree.XMLSchemaParseError: If the schema is not a valid XML Schema.
+    """
+    xml_schema = schema_registry.get(xsd_file)
+    count = 0
+    with open(xml_file, 'rb') as f:
+        reader = _LineReader(f)
+        events = etree.iterparse(reader, events=('end',), schema=xml_schema)
+        seen = 0
+        try:
+            for _, element in events:
+                if len(events.error_log) > seen:
+                    for entry in list(events.error_log)[seen:]:
+                        count += 1
+                        yield XMLError(reader.line, entry.domain_name, entry.message)
+                        if max_errors is not None and count >= max_errors:
+                            return
+                    seen = len(events.error_log)
+                # Free the element and the siblings before it, only the open ancestors stay in memory
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        except etree.XMLSyntaxError as e:
+            # Raised at the end of a document with validity errors, or at the first well-formedness error
+            for entry in list(events.error_log)[seen:]:
+                if max_errors is not None and count >= max_errors:
+                    return
+                count += 1
+                yield XMLError(reader.line, entry.domain_name, entry.message)
+            if max_errors is not None and count >= max_errors:
+                return
+            if e.lineno:
+                # A well-formedness error, reported with a line only by the exception
+                message = _PARSER_MESSAGE.match(e.msg)
+                yield XMLError(e.lineno, 'PARSER', message.group(1) if message else e.msg)
+            elif not reader.eof:
+                # libxml2 drops the message of a well-formedness error that follows validity errors
+                yield XMLError(reader.line, 'PARSER', 'The document is not well-formed.')
+
+
+def validate_xml_streaming(xml_file: str, xsd_file: str, max_errors: int = 10) -> tuple[bool, str]:
+    """
+    Validate an XML file against a given XML Schema (XSD) without loading the whole document.
+
+    Like validate_xml, for documents too large to hold in memory, see iter_xml_errors.
+
+    Args:
+        xml_file (str): Path to the XML file.
+        xsd_file (str): Path to the XSD schema file.
+        max_errors (int, optional): The number of errors to report. Defaults to 10.
+
+    Returns:
+        tuple[bool, str]: A tuple containing a boolean indicating whether
+                          the XML is valid, and a string with the first
+                          `max_errors` errors, one per line.
+    """
+    try:
+        errors = [str(error) for error in iter_xml_errors(xml_file, xsd_file, max_errors)]
+    except etree.XMLSchemaError as e:
         return False, str(e)
     except Exception as e:
-        return False, f"An error occurred: {str(e)}"
\ No newline at end of file
+        return False, f"An error occurred: {str(e)}"
+    if errors:
+        return False, '\n'.join(errors)
+    return True, "XML is valid."
+
+
+def _init_worker(xsd_file: str) -> None:
+    global _worker_schema
+    _worker_schema = schema_registry.get(xsd_file)
+
+
+def _validate_batch(xml_files: List[str]) -> List[Tuple[str, bool, str]]:
+    return [(xml_file, *_validate(xml_file, _worker_schema)) for xml_file in xml_files]
+
+
+def validate_xml_files(xml_files: Iterable[str], xsd_file: str, workers: Optional[int] = None,
+                       batch_size: int = 32) -> Iterator[Tuple[str, bool, str]]:
+    """
+    Validate many XML files against one schema on a pool of worker processes.
+
+    Each worker compiles the schema once when it starts. At most two batches per worker are in
+    flight, so memory stays flat however many files are given. Results are yielded as the
+    batches complete, which is not necessarily the order of `xml_files`.
+
+    Args:
+        xml_files (Iterable[str]): Paths to the XML files.
+        xsd_file (str): Path to the XSD schema file.
+        workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+            With 1 the files are validated in the current process.
+        batch_size (int, optional): The number of files per task sent to a worker. Defaults to 32.
+
+    Yields:
+        Tuple[str, bool, str]: The path, whether the file is valid and the message of validate_xml.
+
+    Raises:
+        OSError: If the schema file cannot be read.
+        etree.XMLSchemaParseError: If the schema is not a valid XML Schema.
+    """
+    # Fail early, and once, on a broken schema
+    schema = schema_registry.get(xsd_file)
+    xml_files = iter(xml_files)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for xml_file in xml_files:
+            yield (xml_file, *_validate(xml_file, schema))
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(xsd_file,))
+    pending = set()
+    try:
+        for batch in iter(lambda: list(islice(xml_files, batch_size)), []):
+            pending.add(executor.submit(_validate_batch, batch))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+        for future in as_completed(pending):
+            yield from future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
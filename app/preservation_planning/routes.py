@@ -1,9 +1,14 @@
-from flask import render_template, request, url_for
+import os
+from datetime import datetime, timezone
+from flask import render_template, request, url_for, current_app
 from flask_login import login_required
 from app.preservation_planning import bp
 import sqlalchemy as sa
 from app import db
 from app.models import FormatRegistry
+from app.pagination import keyset_paginate
+from app.conditional import conditional_response
+from app.filters import xslt_cache
 
 @bp.route('/preservation-planning', methods=['GET', 'POST'])
 @login_required
@@ -13,15 +18,37 @@ def index():
 @bp.route('/preservation-planning/format-registry', methods=['GET', 'POST'])
 @login_required
 def format_registry():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     query = sa.select(FormatRegistry)
-    items = db.paginate(query,page=page, per_page=15, error_out=False)
-    next_url = url_for('preservation_planning.format_registry', page=items.next_num) \
+    items = keyset_paginate(query, (FormatRegistry.id,), cursor, per_page=15, count_limit=1000)
+    next_url = url_for('preservation_planning.format_registry', cursor=items.next_cursor) \
         if items.has_next else None
-    prev_url = url_for('preservation_planning.format_registry', page=items.prev_num) \
+    prev_url = url_for('preservation_planning.format_registry', cursor=items.prev_cursor) \
         if items.has_prev else None
 
-    return render_template('preservation_planning/format_registry/index.jinja2',
-                           items=items,
-                           next_url=next_url,
-                           prev_url=prev_url)
+    validators = [(item.id, item.updated_at) for item in items] + [items.total]
+    last_modified = max((item.updated_at for item in items), default=None)
+    return conditional_response(validators, last_modified, lambda: render_template(
+        'preservation_planning/format_registry/index.jinja2',
+        items=items,
+        next_url=next_url,
+        prev_url=prev_url))
+
+
+@bp.route('/preservation-planning/format-registry/<int:id>', methods=['GET'])
+@login_required
+def format_registry_detail(id):
+    item = db.get_or_404(FormatRegistry, id)
+    xslt_path = os.path.join(current_app.root_path, 'templates', 'preservation_planning', 'pronom.xslt')
+    with open(xslt_path) as f:
+        xslt_file = f.read()
+        xslt_modified = datetime.fromtimestamp(os.fstat(f.fileno()).st_mtime, timezone.utc).replace(tzinfo=None)
+
+    def render():
+        return render_template('preservation_planning/format_registry/detail.jinja2', format=item,
+                               xslt_file=xslt_file)
+
+    # The page changes with the stylesheet as well as with the record
+    stylesheet_hash = xslt_cache.stylesheet(xslt_file)[0]
+    last_modified = max(item.updated_at, xslt_modified)
+    return conditional_response((item.id, item.updated_at, stylesheet_hash), last_modified, render)
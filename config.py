@@ -5,4 +5,11 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
                               'sqlite:///' + os.path.join(basedir, 'app.db')
-    LANGUAGES = ['en', 'sv']
\ No newline at end of file
+    LANGUAGES = ['en', 'sv']
+    # Rendered HTML fragments kept per process, and an optional SQLite file shared by all workers
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 1024))
+    FRAGMENT_CACHE_PATH = os.environ.get('FRAGMENT_CACHE_PATH')
+    # Read budget of the fixity audit (unset is unlimited) and the days within which every file is re-verified
+    FIXITY_AUDIT_BYTES_PER_SECOND = float(os.environ.get('FIXITY_AUDIT_BYTES_PER_SECOND', 0)) or None
+    FIXITY_AUDIT_IOPS = float(os.environ.get('FIXITY_AUDIT_IOPS', 0)) or None
+    FIXITY_AUDIT_CYCLE_DAYS = float(os.environ.get('FIXITY_AUDIT_CYCLE_DAYS', 90))
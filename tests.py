@@ -1,6 +1,33 @@
 import unittest
+import base64
+import hashlib
+import json
+import os
 import re
+import shutil
 import sys
+import tempfile
+from unittest import mock
+from app import create_app, db, fragment_cache
+from app.cache import LRUCache, SQLiteFragmentStore
+from datetime import datetime, timedelta, timezone
+from app.models import Node, Agent, Fixity, FormatRegistry, PreservationEvent
+from app.conditional import conditional_response
+from app.filters import XSLTCache, xslt_cache
+from app.pagination import keyset_paginate
+from app.data_management.search import search_nodes
+from app.data_management.tools.ead import importer
+from app.data_management.tools.ead.exporter import export_ead, export_ndjson
+from app.data_management.tools.ead.importer import EADImportError, import_ead, iter_ead_components
+from app.data_management.tree import (
+    rebuild_node_paths, rebuild_node_counters, delete_subtree, move_subtree, InvalidMoveError
+)
+from app.preservation.fixity import record_fixity, verify_fixity
+from app.preservation.audit import (
+    AuditRunningError, FixityAuditScheduler, audit_status, get_audit_state, set_audit_paused
+)
+from app.preservation.tools.fixity.throttle import Throttle
+from config import Config
 from app.main.utils import (
 bytes_to_human_readable,
 list_installed_packages,
@@ -111,5 +138,772 @@ class TestGetDiskUsage(unittest.TestCase):
                 self.assertIsInstance(disk_usage_stats[key], int)
                 self.assertGreaterEqual(disk_usage_stats[key], 0)
 
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    LOGIN_DISABLED = True
+
+
+class AppTestCase(unittest.TestCase):
+    """
+    A base test class that runs every test in an application context on an empty in-memory database.
+    """
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        # The cache outlives the app, and node ids repeat between test databases
+        fragment_cache.local.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+
+class TestNodeHierarchy(AppTestCase):
+    """
+    A unit test class to verify the materialized ancestry paths maintained on Node.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.fonds = Node(title='Fonds', ref_code='F', level_of_description='fonds')
+        self.series = Node(title='Series', ref_code='S', level_of_description='series', parent=self.fonds)
+        self.file = Node(title='File', ref_code='1', level_of_description='file', parent=self.series)
+        self.other = Node(title='Other', ref_code='O', level_of_description='fonds')
+        db.session.add_all([self.fonds, self.series, self.file, self.other])
+        db.session.commit()
+
+    def test_paths_on_insert(self):
+        """
+        Test that new nodes get their path and depth from their parent.
+        """
+        self.assertEqual(self.file.path, f'/{self.fonds.id}/{self.series.id}/{self.file.id}/')
+        self.assertEqual(self.file.depth, 2)
+        self.assertEqual(self.file.get_top_node(), self.fonds)
+        self.assertEqual(self.file.get_all_parent_nodes(), [self.fonds, self.series])
+        self.assertTrue(self.file.is_descendant_of(self.fonds))
+        self.assertFalse(self.fonds.is_descendant_of(self.file))
+
+    def test_paths_on_move(self):
+        """
+        Test that re-parenting a node rewrites the paths of its whole subtree.
+        """
+        self.series.parent = self.other
+        db.session.commit()
+
+        self.assertEqual(self.file.path, f'/{self.other.id}/{self.series.id}/{self.file.id}/')
+        self.assertEqual(self.file.get_top_node(), self.other)
+        self.assertFalse(self.file.is_descendant_of(self.fonds))
+
+    def test_counters(self):
+        """
+        Test that child and descendant counters follow inserts, moves and deletes.
+        """
+        self.assertEqual((self.fonds.child_count, self.fonds.descendant_count), (1, 2))
+        self.assertEqual((self.series.child_count, self.series.descendant_count), (1, 1))
+
+        self.series.parent = self.other
+        db.session.commit()
+        self.assertEqual((self.fonds.child_count, self.fonds.descendant_count), (0, 0))
+        self.assertEqual((self.other.child_count, self.other.descendant_count), (1, 2))
+
+        db.session.delete(self.file)
+        db.session.commit()
+        self.assertEqual((self.other.child_count, self.other.descendant_count), (1, 1))
+        self.assertEqual(self.series.child_count, 0)
+
+        db.session.execute(db.update(Node).values(child_count=0, descendant_count=0))
+        db.session.commit()
+        rebuild_node_counters()
+        self.assertEqual((self.other.child_count, self.other.descendant_count), (1, 1))
+
+        db.session.execute(db.update(Node).where(Node.id == self.series.id).values(path=None))
+        db.session.commit()
+        with self.assertRaises(ValueError):
+            rebuild_node_counters(self.series.id)
+
+    def test_move_subtree(self):
+        """
+        Test that moves into the own subtree or onto a duplicate reference code are rejected.
+        """
+        with self.assertRaises(InvalidMoveError):
+            move_subtree(self.fonds.id, self.file.id)
+
+        db.session.add(Node(title='Clash', ref_code='S', level_of_description='series', parent=self.other))
+        db.session.commit()
+        with self.assertRaises(InvalidMoveError):
+            move_subtree(self.series.id, self.other.id)
+
+        move_subtree(self.file.id, self.other.id)
+        self.assertEqual(self.file.path, f'/{self.other.id}/{self.file.id}/')
+        self.assertEqual((self.other.child_count, self.other.descendant_count), (2, 2))
+
+    def test_delete_subtree(self):
+        """
+        Test that deleting a subtree removes its nodes and associations and updates the counters.
+        """
+        agent = Agent(type='person', name='Agent', description='')
+        agent.nodes.append(self.file)
+        self.other.related_nodes.append(self.series)
+        db.session.add(agent)
+        db.session.commit()
+
+        counts = delete_subtree(self.series.id)
+        self.assertEqual(counts, {'nodes': 2, 'node_association': 1, 'agent_node_association': 1})
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Node)), 2)
+        self.assertEqual((self.fonds.child_count, self.fonds.descendant_count), (0, 0))
+
+    def test_session_delete(self):
+        """
+        Test that deleting a node with children through the session also removes its descendants.
+        """
+        agent = Agent(type='person', name='Agent', description='')
+        agent.nodes.append(self.file)
+        self.other.related_nodes.append(self.file)
+        db.session.add(agent)
+        db.session.commit()
+        file_id = self.file.id
+
+        db.session.delete(self.series)
+        db.session.commit()
+        self.assertIsNone(db.session.get(Node, file_id))
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Node)), 2)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Node).where(
+            Node.descendant_clause(self.fonds.path))), 0)
+        self.assertEqual((self.fonds.child_count, self.fonds.descendant_count), (0, 0))
+        self.assertEqual(agent.nodes, [])
+        self.assertEqual(self.other.related_nodes.count(), 0)
+        self.assertEqual(search_nodes('File'), (0, []))
+
+        # A node deleted in the same flush as one of its ancestors is only subtracted once
+        series = Node(title='Series', ref_code='S', level_of_description='series', parent=self.other)
+        file = Node(title='File', ref_code='1', level_of_description='file', parent=series)
+        db.session.add_all([series, file])
+        db.session.commit()
+        db.session.delete(series)
+        db.session.delete(file)
+        db.session.commit()
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Node)), 2)
+        self.assertEqual((self.other.child_count, self.other.descendant_count), (0, 0))
+
+    def test_search(self):
+        """
+        Test that the full-text index follows edits and returns highlighted hits with their top node.
+        """
+        self.file.archival_history = 'Transferred <b>from</b> the harbour office'
+        db.session.commit()
+
+        total, hits = search_nodes('harbour')
+        self.assertEqual(total, 1)
+        self.assertEqual(hits[0]['id'], self.file.id)
+        self.assertEqual(hits[0]['root_title'], 'Fonds')
+        self.assertIn('<mark>harbour</mark>', hits[0]['archival_history'])
+        self.assertIn('&lt;b&gt;', hits[0]['archival_history'])
+
+        db.session.delete(self.file)
+        db.session.commit()
+        self.assertEqual(search_nodes('harbour'), (0, []))
+
+    def test_full_tree(self):
+        """
+        Test that the full tree is nested correctly and can be capped by depth.
+        """
+        tree = self.fonds.get_full_tree()
+        self.assertEqual(tree['id'], self.fonds.id)
+        self.assertEqual(tree['children'][0]['id'], self.series.id)
+        self.assertEqual(tree['children'][0]['children'][0]['id'], self.file.id)
+
+        tree = self.fonds.get_full_tree(max_depth=1)
+        self.assertEqual(tree['children'][0]['children'], [])
+
+    def test_rebuild_paths(self):
+        """
+        Test that rebuilding restores the paths of all nodes.
+        """
+        expected = self.file.path
+        db.session.execute(db.update(Node).values(path=None, depth=0))
+        db.session.commit()
+
+        self.assertEqual(rebuild_node_paths(), 4)
+        self.assertEqual(db.session.get(Node, self.file.id).path, expected)
+        self.assertEqual(db.session.get(Node, self.file.id).depth, 2)
+
+    def test_move_route(self):
+        """
+        Test that the move view needs a destination or an explicit move to the top level.
+        """
+        client = self.app.test_client()
+        url = f'/data-management/archival-descriptions/move?source_node_id={self.file.id}'
+
+        for form in ({}, {'destination_node_id': 'abc'}):
+            with self.subTest(form=form):
+                response = client.post(url, data=form)
+                self.assertEqual(response.status_code, 302)
+                self.assertIn('/move', response.headers['Location'])
+                self.assertEqual(self.file.parent_id, self.series.id)
+
+        response = client.post(url, data={'destination_node_id': self.fonds.id})
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual(self.file.parent_id, self.fonds.id)
+
+        client.post(url, data={'to_root': '1'})
+        db.session.expire_all()
+        self.assertIsNone(self.file.parent_id)
+        self.assertEqual(self.file.path, f'/{self.file.id}/')
+
+    def test_move_route_without_paths(self):
+        """
+        Test that the move view asks for rebuilding the paths instead of failing on nodes without one.
+        """
+        db.session.execute(db.update(Node).values(path=None))
+        db.session.commit()
+        response = self.app.test_client().get(
+            f'/data-management/archival-descriptions/move?source_node_id={self.file.id}&tree_root_id={self.fonds.id}')
+        self.assertEqual(response.status_code, 409)
+
+
+EAD2002 = """<?xml version="1.0" encoding="UTF-8"?>
+<ead xmlns="urn:isbn:1-931666-22-9">
+  <eadheader><eadid>test</eadid></eadheader>
+  <archdesc level="fonds">
+    <did><unitid>F1</unitid><unittitle>Harbour   office</unittitle><unitdate normal="1900/1950">1900-1950</unitdate></did>
+    <custodhist><p>Transferred in 1990.</p></custodhist>
+    <dsc>
+      <c01 level="series">
+        <did><unitid>S1</unitid><unittitle>Minutes</unittitle><physdesc>2 boxes</physdesc></did>
+        <c02 level="file"><did><unitid>1</unitid><unittitle>1900</unittitle><unitdate normal="1900">1900</unitdate></did></c02>
+        <c02 level="file"><did><unitid>2</unitid><unittitle>1901</unittitle></did></c02>
+      </c01>
+      <c01 level="otherlevel" otherlevel="box"><did><unitid>S2</unitid><unittitle>Maps</unittitle></did></c01>
+    </dsc>
+  </archdesc>
+</ead>
+"""
+
+EAD3 = """<?xml version="1.0" encoding="UTF-8"?>
+<ead xmlns="http://ead3.archivists.org/schema/">
+  <control><recordid>test</recordid></control>
+  <archdesc level="collection">
+    <did>
+      <unitid>C1</unitid><unittitle>Letters</unittitle>
+      <unitdatestructured><daterange><fromdate standarddate="1920-03">1920</fromdate>
+        <todate standarddate="1925-12-31">1925</todate></daterange></unitdatestructured>
+    </did>
+    <dsc><c level="item"><did><unitid>L1</unitid><unittitle>Letter</unittitle></did></c></dsc>
+  </archdesc>
+</ead>
+"""
+
+
+class TestEADImport(AppTestCase):
+    """
+    A unit test class to verify the streaming EAD import.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.directory)
+
+    def write(self, content):
+        path = os.path.join(self.directory, 'finding-aid.xml')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_parse_ead2002(self):
+        components = list(iter_ead_components(self.write(EAD2002)))
+        self.assertEqual([(depth, fields['ref_code'], fields['level_of_description']) for depth, fields in components],
+                         [(0, 'F1', 'fonds'), (1, 'S1', 'series'), (2, '1', 'file'), (2, '2', 'file'),
+                          (1, 'S2', 'box')])
+        fonds = components[0][1]
+        self.assertEqual(fonds['title'], 'Harbour office')
+        self.assertEqual(fonds['archival_history'], 'Transferred in 1990.')
+        self.assertEqual((fonds['date_start'], fonds['date_end']), (datetime(1900, 1, 1), datetime(1950, 1, 1)))
+        self.assertEqual(components[1][1]['extent'], '2 boxes')
+
+    def test_parse_ead3(self):
+        components = list(iter_ead_components(self.write(EAD3)))
+        self.assertEqual([(depth, fields['ref_code']) for depth, fields in components], [(0, 'C1'), (1, 'L1')])
+        self.assertEqual((components[0][1]['date_start'], components[0][1]['date_end']),
+                         (datetime(1920, 3, 1), datetime(1925, 12, 31)))
+
+    def test_import(self):
+        existing = Node(title='Existing', ref_code='E', level_of_description='fonds')
+        db.session.add(existing)
+        db.session.commit()
+
+        path = self.write(EAD2002)
+        self.assertEqual(import_ead(path, parent_id=existing.id, batch_size=2), 5)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+        nodes = {node.ref_code: node for node in db.session.scalars(db.select(Node))}
+        fonds, series, file = nodes['F1'], nodes['S1'], nodes['2']
+        self.assertEqual(fonds.id, existing.id + 1)
+        self.assertEqual(file.path, f'/{existing.id}/{fonds.id}/{series.id}/{file.id}/')
+        self.assertEqual((file.depth, file.parent_id), (3, series.id))
+        self.assertEqual((fonds.child_count, fonds.descendant_count), (2, 4))
+        self.assertEqual((existing.child_count, existing.descendant_count), (1, 5))
+
+    def test_import_parent_without_path(self):
+        existing = Node(title='Existing', ref_code='E', level_of_description='fonds')
+        db.session.add(existing)
+        db.session.commit()
+        db.session.execute(db.update(Node).values(path=None))
+        db.session.commit()
+
+        with self.assertRaises(EADImportError):
+            import_ead(self.write(EAD2002), parent_id=existing.id)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Node)), 1)
+
+    def test_resume(self):
+        path = self.write(EAD2002)
+        components = importer.iter_ead_components
+
+        def interrupted(path):
+            for index, component in enumerate(components(path)):
+                if index == 3:
+                    raise KeyboardInterrupt
+                yield component
+
+        # The first batch of two is committed, the third component is lost with the interruption
+        with mock.patch.object(importer, 'iter_ead_components', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                import_ead(path, batch_size=2)
+        self.assertTrue(os.path.exists(f'{path}.checkpoint'))
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Node)), 2)
+
+        self.assertEqual(import_ead(path, batch_size=2), 3)
+        ref_codes = sorted(db.session.scalars(db.select(Node.ref_code)))
+        self.assertEqual(ref_codes, ['1', '2', 'F1', 'S1', 'S2'])
+        fonds = db.session.scalar(db.select(Node).where(Node.ref_code == 'F1'))
+        self.assertEqual((fonds.child_count, fonds.descendant_count), (2, 4))
+
+
+    def test_export(self):
+        """
+        Test that an exported description imports back as the same tree.
+        """
+        import_ead(self.write(EAD2002))
+        fonds = db.session.scalar(db.select(Node).where(Node.ref_code == 'F1'))
+
+        lines = [json.loads(line) for line in ''.join(export_ndjson(fonds.id)).splitlines()]
+        self.assertEqual([(line['depth'], line['ref_code']) for line in lines],
+                         [(0, 'F1'), (1, 'S1'), (2, '1'), (2, '2'), (1, 'S2')])
+        self.assertEqual((lines[0]['parent_id'], lines[0]['date_start']), (None, '1900-01-01'))
+
+        components = list(iter_ead_components(self.write(''.join(export_ead(fonds.id)))))
+        self.assertEqual([(depth, fields['ref_code'], fields['level_of_description'])
+                          for depth, fields in components],
+                         [(0, 'F1', 'fonds'), (1, 'S1', 'series'), (2, '1', 'file'), (2, '2', 'file'),
+                          (1, 'S2', 'box')])
+        self.assertEqual(components[0][1]['archival_history'], 'Transferred in 1990.')
+
+    def test_export_route(self):
+        """
+        Test that the export view rejects bad requests before it starts streaming.
+        """
+        import_ead(self.write(EAD2002))
+        fonds = db.session.scalar(db.select(Node).where(Node.ref_code == 'F1'))
+        client = self.app.test_client()
+        url = f'/data-management/archival-descriptions/{fonds.id}/export'
+
+        response = client.get(url, query_string={'format': 'ndjson'})
+        self.assertEqual((response.status_code, response.mimetype), (200, 'application/x-ndjson'))
+        self.assertEqual(len(response.data.splitlines()), 5)
+        self.assertEqual(client.get(url, query_string={'format': 'pdf'}).status_code, 400)
+        self.assertEqual(client.get(f'/data-management/archival-descriptions/{fonds.id + 100}/export').status_code,
+                         404)
+
+        db.session.execute(db.update(Node).values(path=None))
+        db.session.commit()
+        self.assertEqual(client.get(url).status_code, 409)
+        rebuild_node_paths()
+        self.assertIn(b'<archdesc level="fonds">', client.get(url).data)
+
+
+class TestKeysetPagination(AppTestCase):
+    """
+    A unit test class to verify the keyset_paginate function.
+    """
+
+    def setUp(self):
+        super().setUp()
+        db.session.add_all([Node(title=f'Fonds {i}', ref_code=str(i), level_of_description='fonds')
+                            for i in range(7)])
+        db.session.commit()
+
+    def test_forward_and_backward(self):
+        """
+        Test that next and previous cursors walk the pages in both directions.
+        """
+        query = db.select(Node).where(Node.parent_id.is_(None))
+        columns = (Node.created_at, Node.id)
+
+        first = keyset_paginate(query, columns, per_page=3, count_limit=5)
+        self.assertEqual([node.ref_code for node in first], ['0', '1', '2'])
+        self.assertFalse(first.has_prev)
+        self.assertEqual(first.total, 5)
+        self.assertTrue(first.total_is_estimate)
+
+        second = keyset_paginate(query, columns, first.next_cursor, per_page=3)
+        third = keyset_paginate(query, columns, second.next_cursor, per_page=3)
+        self.assertEqual([node.ref_code for node in third], ['6'])
+        self.assertFalse(third.has_next)
+
+        back = keyset_paginate(query, columns, third.prev_cursor, per_page=3)
+        self.assertEqual([node.ref_code for node in back], ['3', '4', '5'])
+        back = keyset_paginate(query, columns, back.prev_cursor, per_page=3)
+        self.assertEqual([node.ref_code for node in back], ['0', '1', '2'])
+        self.assertFalse(back.has_prev)
+
+    def test_invalid_cursor(self):
+        """
+        Test that an invalid cursor returns the first page.
+        """
+        page = keyset_paginate(db.select(Node), (Node.id,), 'garbage', per_page=3)
+        self.assertEqual([node.ref_code for node in page], ['0', '1', '2'])
+
+    def test_children_pages(self):
+        """
+        Test that children are paged across equal creation times and that tampered cursors start over.
+        """
+        parent = db.session.scalar(db.select(Node).where(Node.ref_code == '0'))
+        created = datetime(2024, 1, 1)
+        db.session.add_all([Node(title=f'Child {i}', ref_code=f'c{i}', level_of_description='file', parent=parent,
+                                 created_at=created) for i in range(5)])
+        db.session.commit()
+
+        first = parent.get_children_page(per_page=2)
+        second = parent.get_children_page(first.next_cursor, per_page=2)
+        last = parent.get_children_page(second.next_cursor, per_page=2)
+        self.assertEqual([child.ref_code for page in (first, second, last) for child in page],
+                         ['c0', 'c1', 'c2', 'c3', 'c4'])
+        self.assertTrue(second.has_next)
+        self.assertFalse(last.has_next)
+
+        tampered = [base64.urlsafe_b64encode(json.dumps(payload).encode()).decode() for payload in
+                    (['next', 5], ['next', [123, 1]], ['next', ['2024-01-01T00:00:00', 'x']], ['up', [None, 1]])]
+        for cursor in tampered + ['not base64!']:
+            with self.subTest(cursor=cursor):
+                self.assertEqual([child.ref_code for child in parent.get_children_page(cursor, per_page=2)],
+                                 ['c0', 'c1'])
+
+        client = self.app.test_client()
+        response = client.get(f'/node/{parent.id}/children', query_string={'cursor': second.next_cursor})
+        self.assertIn(b'Child 4', response.data)
+        self.assertNotIn(b'hx-trigger="revealed"', response.data)
+        response = client.get(f'/node/{parent.id}/children', query_string={'cursor': tampered[1]})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Child 0', response.data)
+
+
+class TestFixity(AppTestCase):
+    """
+    A unit test class to verify recording and re-verifying file checksums.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.paths = []
+        for name, content in (('a.txt', b'first'), ('b.txt', b'second'), ('c.txt', b'third')):
+            path = os.path.join(self.root, name)
+            with open(path, 'wb') as f:
+                f.write(content)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        super().tearDown()
+
+    def test_record_fixity(self):
+        results = list(record_fixity(self.paths, workers=2, batch_size=2))
+        self.assertEqual(len(results), 3)
+        record = db.session.scalar(db.select(Fixity).where(Fixity.path == self.paths[0]))
+        self.assertEqual(record.size, 5)
+        for algorithm in ('md5', 'sha1', 'sha256', 'sha512'):
+            with self.subTest(algorithm=algorithm):
+                self.assertEqual(getattr(record, algorithm), hashlib.new(algorithm, b'first').hexdigest())
+
+    def test_verify_fixity(self):
+        list(record_fixity(self.paths))
+        self.assertEqual({result['status'] for result in verify_fixity()}, {'ok'})
+
+        with open(self.paths[0], 'wb') as f:
+            f.write(b'FIRST')
+        os.remove(self.paths[1])
+        statuses = {result['path']: result['status'] for result in verify_fixity(workers=2)}
+        self.assertEqual(statuses, {self.paths[0]: 'mismatch', self.paths[1]: 'missing', self.paths[2]: 'ok'})
+        record = db.session.scalar(db.select(Fixity).where(Fixity.path == self.paths[0]))
+        self.assertEqual(record.failure_count, 1)
+
+    def test_verify_least_recently_verified_first(self):
+        list(record_fixity(self.paths))
+        first = [result['path'] for result in verify_fixity(limit=2)]
+        second = [result['path'] for result in verify_fixity(limit=2)]
+        self.assertEqual(len(set(first)), 2)
+        # The file left out of the first run is the least recently verified one now
+        self.assertIn((set(self.paths) - set(first)).pop(), second)
+
+    def test_audit_scheduler(self):
+        list(record_fixity(self.paths))
+        os.remove(self.paths[1])
+        scheduler = FixityAuditScheduler(cycle=timedelta(0), batch_size=2)
+
+        set_audit_paused(True)
+        self.assertEqual(scheduler.run(until_idle=True)['files_verified'], 0)
+
+        set_audit_paused(False)
+        status = scheduler.run(until_idle=True)
+        self.assertEqual(status['files_verified'], 3)
+        self.assertEqual(status['bytes_verified'], len(b'first') + len(b'third'))
+        self.assertEqual(status['failures'], 1)
+        self.assertEqual(status['status'], 'stopped')
+        events = db.session.scalars(db.select(PreservationEvent)).all()
+        self.assertEqual([event.fixity.path for event in events], [self.paths[1]])
+        self.assertEqual(audit_status(timedelta(days=1))['backlog_files'], 0)
+
+    def test_audit_single_instance(self):
+        scheduler = FixityAuditScheduler(cycle=timedelta(0))
+        state = get_audit_state()
+        state.pid = os.getpid() + 1
+        state.heartbeat_at = datetime.now(timezone.utc)
+        db.session.commit()
+        with self.assertRaises(AuditRunningError):
+            scheduler.run(until_idle=True)
+        self.assertEqual(get_audit_state().pid, os.getpid() + 1)
+
+        # A scheduler that stopped sending heartbeats is taken over
+        state.heartbeat_at = datetime.now(timezone.utc) - timedelta(minutes=10)
+        db.session.commit()
+        scheduler.run(until_idle=True)
+        self.assertIsNone(get_audit_state().pid)
+
+    def test_throttle(self):
+        now, sleeps = [0.0], []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        throttle = Throttle(bytes_per_second=100, iops=4, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            throttle(50)
+        # 200 bytes at 100 per second, the operations budget is not the limit
+        self.assertAlmostEqual(now[0], 2.0)
+
+        now[0] = 0.0
+        throttle = Throttle(iops=4, clock=lambda: now[0], sleep=sleep)
+        for _ in range(8):
+            throttle(0)
+        self.assertAlmostEqual(now[0], 2.0)
+
+
+
+class TestFragmentCache(AppTestCase):
+    """
+    A unit test class to verify the in-process and shared fragment cache tiers.
+    """
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        # 'b' is now the least recently used
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_shared_store(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = SQLiteFragmentStore(os.path.join(directory, 'fragments.db'), max_entries=3)
+            store.PRUNE_INTERVAL = 5
+            store.set('a', 'first')
+            self.assertEqual(store.get('a'), 'first')
+            self.assertIsNone(store.get('missing'))
+            # Rewriting a key makes it the most recent entry
+            for key in ('b', 'c', 'd', 'a'):
+                store.set(key, key)
+            self.assertEqual([store.get(key) for key in 'abcd'], ['a', None, 'c', 'd'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_node_version_invalidates(self):
+        fonds = Node(title='Fonds', ref_code='F', level_of_description='fonds')
+        series = Node(title='Series', ref_code='S', level_of_description='series', parent=fonds)
+        db.session.add_all([fonds, series])
+        db.session.commit()
+
+        client = self.app.test_client()
+        self.assertIn(b'Series', client.get(f'/node/{fonds.id}/children').data)
+        hits = fragment_cache.local.hits
+        self.assertIn(b'Series', client.get(f'/node/{fonds.id}/children').data)
+        self.assertEqual(fragment_cache.local.hits, hits + 1)
+
+        series.title = 'Renamed'
+        db.session.commit()
+        self.assertIn(b'Renamed', client.get(f'/node/{fonds.id}/children').data)
+
+    def test_link_edits_raise_version(self):
+        """
+        Test that editing only the agent or related node links of a node raises its version.
+        """
+        fonds = Node(title='Fonds', ref_code='F', level_of_description='fonds')
+        series = Node(title='Series', ref_code='S', level_of_description='series', parent=fonds)
+        agent = Agent(type='person', name='Agent', description='')
+        db.session.add_all([fonds, series, agent])
+        db.session.commit()
+        versions = (fonds.version, series.version)
+
+        series.agents.append(agent)
+        db.session.commit()
+        self.assertEqual((fonds.version, series.version), (versions[0] + 1, versions[1] + 1))
+
+        series.agents.remove(agent)
+        db.session.commit()
+        self.assertEqual(series.version, versions[1] + 2)
+
+        series.related_nodes.append(fonds)
+        db.session.commit()
+        self.assertEqual(series.version, versions[1] + 3)
+
+
+class TestConditionalResponse(AppTestCase):
+    """
+    A unit test class to verify the 304 Not Modified handling of conditional_response.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.modified = datetime(2024, 5, 1, 12, 0, 0)
+        self.renders = 0
+
+        def view():
+            def render():
+                self.renders += 1
+                return 'page'
+            return conditional_response(('record', 1), self.modified, render)
+
+        self.app.add_url_rule('/conditional', 'conditional', view)
+        self.client = self.app.test_client()
+        self.etag = self.client.get('/conditional').headers['ETag'].strip('"')
+
+    def test_etag(self):
+        for header in (f'"{self.etag}"', f'W/"{self.etag}"', f'"other", "{self.etag}"', '*'):
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get('/conditional', headers={'If-None-Match': header}).status_code, 304)
+        response = self.client.get('/conditional', headers={'If-None-Match': '"other"'})
+        self.assertEqual((response.status_code, response.data), (200, b'page'))
+        # If-None-Match takes precedence over a matching If-Modified-Since
+        response = self.client.get('/conditional', headers={'If-None-Match': '"other"',
+                                                            'If-Modified-Since': 'Wed, 01 May 2024 12:00:00 GMT'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.renders, 3)
+
+    def test_if_modified_since(self):
+        response = self.client.get('/conditional', headers={'If-Modified-Since': 'Wed, 01 May 2024 12:00:00 GMT'})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/conditional', headers={'If-Modified-Since': 'Wed, 01 May 2024 11:59:59 GMT'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_pending_flashes(self):
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('message', 'Saved')]
+        response = self.client.get('/conditional', headers={'If-None-Match': f'"{self.etag}"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_format_registry_stylesheet(self):
+        """
+        Test that the format registry page is revalidated when the stylesheet changes.
+        """
+        item = FormatRegistry(puid='fmt/1', format_name='Format', format_version='1', pronom_xml='<PRONOM/>',
+                              preservation=True, allowed=True)
+        db.session.add(item)
+        db.session.commit()
+        url = f'/preservation-planning/format-registry/{item.id}'
+        etag = self.client.get(url).headers['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        stylesheet = xslt_cache.stylesheet
+        with mock.patch.object(xslt_cache, 'stylesheet', lambda xslt: ('changed', *stylesheet(xslt)[1:])):
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_node_details_agents(self):
+        """
+        Test that node details are revalidated and re-rendered when a linked agent is renamed.
+        """
+        node = Node(title='Fonds', ref_code='F', level_of_description='fonds')
+        agent = Agent(type='person', name='Before', description='')
+        agent.nodes.append(node)
+        db.session.add(agent)
+        db.session.commit()
+        url = f'/node/{node.id}/details'
+
+        def render_template(template, node):
+            return ', '.join(agent.name for agent in node.agents)
+
+        with mock.patch('app.data_management.routes.render_template', render_template):
+            response = self.client.get(url)
+            self.assertEqual(response.data, b'Before')
+            etag = response.headers['ETag']
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+            agent.name = 'After'
+            db.session.commit()
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual((response.status_code, response.data), (200, b'After'))
+
+    def test_agent_detail(self):
+        """
+        Test that the agent detail fragment is answered with 304 until the agent is edited.
+        """
+        agent = Agent(type='person', name='Before', description='')
+        db.session.add(agent)
+        db.session.commit()
+        url = f'/data-management/agent-records/{agent.id}?submenu=False'
+        response = self.client.get(url)
+        self.assertIn(b'Before', response.data)
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        response = self.client.post(f'/data-management/agent-records/{agent.id}/edit',
+                                    data={'name': 'After', 'type': 'person', 'description': ''})
+        self.assertIn(b'After', response.data)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'After', response.data)
+
+
+class TestXSLTCache(unittest.TestCase):
+
+    stylesheet = """<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+                      <xsl:output method="html"/>
+                      <xsl:template match="/"><h1><xsl:value-of select="greeting/name"/></h1></xsl:template>
+                    </xsl:stylesheet>"""
+
+    def test_transform(self):
+        cache = XSLTCache()
+        self.assertEqual(cache.transform('<greeting><name>World</name></greeting>', self.stylesheet).strip(),
+                         '<h1>World</h1>')
+        # The same stylesheet, as loaded by another view, is not compiled again
+        self.assertIs(cache.stylesheet(self.stylesheet.encode())[1], cache.stylesheet(self.stylesheet)[1])
+        self.assertEqual(cache.transform(b'<greeting><name>Moon</name></greeting>', self.stylesheet).strip(),
+                         '<h1>Moon</h1>')
+        self.assertEqual(cache.transform('<greeting><name>World</name></greeting>', self.stylesheet).strip(),
+                         '<h1>World</h1>')
+        self.assertEqual(cache._results.hits, 1)
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file